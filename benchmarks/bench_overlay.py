@@ -0,0 +1,63 @@
+"""
+Micro-benchmark: NumPy overlay engine vs. the original PIL compositing path.
+
+    python benchmarks/bench_overlay.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from overlay import OverlayRenderer
+
+SIZES = (256, 512, 1024)
+
+def pil_overlay(image: Image.Image, mask: Image.Image, color=(255, 0, 0)) -> Image.Image:
+    """
+    The PIL path previously used by SegmentationServer.overlay_mask_on_image.
+    Note its colour layer has alpha 0, so the mask was not actually visible;
+    it is kept as-is here only to measure its cost.
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    mask_rgb = Image.new('RGBA', image.size, color + (0,))
+    mask_alpha = mask.point(lambda p: 255 if p > 0 else 0)
+    overlay = Image.composite(mask_rgb, overlay, mask_alpha)
+    return Image.alpha_composite(image, overlay)
+
+def make_inputs(size: int):
+    rng = np.random.default_rng(size)
+    image = Image.fromarray(rng.integers(0, 255, size=(size, size, 3), dtype=np.uint8))
+    mask = Image.new('L', (size, size), 0)
+    r = size // 4
+    ImageDraw.Draw(mask).ellipse([size // 2 - r, size // 2 - r, size // 2 + r, size // 2 + r], fill=255)
+    return image, mask
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    renderer = OverlayRenderer()
+    print(f"{'size':>6} {'PIL ms':>9} {'NumPy ms':>9} {'alpha ms':>9} {'contour ms':>11} {'speedup':>8}")
+    for size in SIZES:
+        image, mask = make_inputs(size)
+        image_np, mask_np = np.asarray(image), np.asarray(mask)
+
+        pil = min(timeit.repeat(lambda: pil_overlay(image, mask), number=args.repeat, repeat=3)) / args.repeat
+        fill = min(timeit.repeat(lambda: renderer.render(image_np, [(mask_np, (255, 0, 0))]),
+                                 number=args.repeat, repeat=3)) / args.repeat
+        blend = min(timeit.repeat(lambda: renderer.render(image_np, [(mask_np, (255, 0, 0))], alpha=0.4),
+                                  number=args.repeat, repeat=3)) / args.repeat
+        outline = min(timeit.repeat(lambda: renderer.render(image_np, [(mask_np, (255, 0, 0))], contour=True),
+                                    number=args.repeat, repeat=3)) / args.repeat
+        print(f"{size:>5}² {pil * 1e3:>9.3f} {fill * 1e3:>9.3f} {blend * 1e3:>9.3f} {outline * 1e3:>11.3f} "
+              f"{pil / fill:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
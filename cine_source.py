@@ -0,0 +1,164 @@
+"""
+Multi-frame (cine-loop) sources for the ingest server.
+Supports video files (via OpenCV), multi-page TIFF (via PIL) and raw frame
+dumps described by a JSON sidecar (`<file>.raw.json` next to `<file>.raw`):
+
+    {"width": 640, "height": 480, "channels": 3, "dtype": "uint8",
+     "fps": 20, "start_time": 1713564540.0, "timestamps": [...]}
+
+Frames are decoded lazily by a generator and a background thread reads a few
+frames ahead, so a multi-GB loop is never fully loaded into memory. Each
+frame keeps the timestamp given by the source.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+TIFF_EXTENSIONS = (".tif", ".tiff")
+RAW_EXTENSIONS = (".raw",)
+CINE_PATTERNS = tuple(f"*{ext}" for ext in VIDEO_EXTENSIONS + TIFF_EXTENSIONS + RAW_EXTENSIONS)
+
+DEFAULT_FPS = 20.0
+
+class CineFrame(NamedTuple):
+    pixels: np.ndarray
+    timestamp: float
+    index: int
+
+def is_cine(path: str) -> bool:
+    return path.lower().endswith(VIDEO_EXTENSIONS + TIFF_EXTENSIONS + RAW_EXTENSIONS)
+
+def _read_sidecar(path: str) -> dict:
+    sidecar = path + ".json"
+    if not os.path.exists(sidecar):
+        return {}
+    with open(sidecar) as f:
+        return json.load(f)
+
+def _frame_time(meta: dict, start: float, fps: float, idx: int) -> float:
+    timestamps = meta.get("timestamps")
+    if timestamps and idx < len(timestamps):
+        return float(timestamps[idx])
+    return start + idx / fps
+
+def iter_video(path: str) -> Iterator[CineFrame]:
+    if cv2 is None:
+        raise RuntimeError("opencv-python is required to read video cine loops")
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Unable to open video {path}")
+    start = _read_sidecar(path).get("start_time", os.path.getmtime(path))
+    idx = 0
+    try:
+        while True:
+            ok, bgr = capture.read()
+            if not ok:
+                break
+            # Presentation time of the decoded frame, from the container
+            pts = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            yield CineFrame(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), start + pts, idx)
+            idx += 1
+    finally:
+        capture.release()
+
+def iter_tiff(path: str) -> Iterator[CineFrame]:
+    meta = _read_sidecar(path)
+    start = meta.get("start_time", os.path.getmtime(path))
+    fps = meta.get("fps", DEFAULT_FPS)
+    with Image.open(path) as img:
+        for idx, page in enumerate(ImageSequence.Iterator(img)):
+            pixels = np.ascontiguousarray(np.asarray(page.convert("RGB"), dtype=np.uint8))
+            yield CineFrame(pixels, _frame_time(meta, start, fps, idx), idx)
+
+def iter_raw(path: str) -> Iterator[CineFrame]:
+    meta = _read_sidecar(path)
+    if not meta:
+        raise ValueError(f"Raw frame dump {path} needs a {path}.json sidecar with width/height")
+    channels = meta.get("channels", 3)
+    shape = (meta["height"], meta["width"], channels) if channels > 1 else (meta["height"], meta["width"])
+    dtype = np.dtype(meta.get("dtype", "uint8"))
+    frame_bytes = int(np.prod(shape)) * dtype.itemsize
+    count = os.path.getsize(path) // frame_bytes
+    if count == 0:
+        return
+    start = meta.get("start_time", os.path.getmtime(path))
+    fps = meta.get("fps", DEFAULT_FPS)
+    # Memory-mapped: only the pages of frames actually read are loaded
+    frames = np.memmap(path, dtype=dtype, mode="r", shape=(count,) + shape)
+    for idx in range(count):
+        yield CineFrame(frames[idx], _frame_time(meta, start, fps, idx), idx)
+
+def iter_frames(path: str) -> Iterator[CineFrame]:
+    """Lazily decode every frame of a multi-frame source."""
+    lower = path.lower()
+    if lower.endswith(VIDEO_EXTENSIONS):
+        return iter_video(path)
+    if lower.endswith(TIFF_EXTENSIONS):
+        return iter_tiff(path)
+    if lower.endswith(RAW_EXTENSIONS):
+        return iter_raw(path)
+    raise ValueError(f"Unsupported cine source: {path}")
+
+_END = object()
+
+class CineSource:
+    """
+    Reads frames from `path` on a background thread, keeping at most
+    `read_ahead` decoded frames buffered.
+    """
+
+    def __init__(self, path: str, read_ahead: int = 4):
+        self.path = path
+        self._frames: "queue.Queue" = queue.Queue(maxsize=max(1, read_ahead))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, name=f"cine-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self):
+        try:
+            for frame in iter_frames(self.path):
+                if not self._put(frame):
+                    return
+        except Exception as e:
+            logger.error(f"Error decoding {self.path}: {e}")
+            self._put(e)
+        self._put(_END)
+
+    def next(self) -> Optional[CineFrame]:
+        """Return the next frame, or None once the source is exhausted."""
+        if self._stop.is_set():
+            return None
+        item = self._frames.get()
+        if item is _END:
+            self.close()
+            return None
+        if isinstance(item, Exception):
+            self.close()
+            raise item
+        return item
+
+    def close(self):
+        self._stop.set()
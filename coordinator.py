@@ -1,81 +1,419 @@
 """
 Coordinator that orchestrates the ultrasound triage workflow.
 Connects to all MCP servers and coordinates the processing pipeline.
+
+Two execution modes are available:
+- `run()` processes one frame at a time through ingest -> segment -> assess -> speak.
+- `run_pipelined()` runs each stage as its own asyncio worker connected by
+  bounded queues, so frame N+1 is fetched and segmented while frame N is in
+  diagnostics and frame N-1 is being spoken.
+
+In both modes a frame that the ingest server reports as unchanged (similarity
+at or above `reuse_threshold` against the previous frame, and perceptual hash
+within `max_hash_distance` bits of the last fully processed frame) reuses the
+previous segmentation and diagnosis instead of calling the servers again.
+
+Before a frame is sent for diagnosis its image quality is scored locally
+(image_quality.py); frames scoring below `min_quality` (blurry, saturated,
+too little gain) get probe/gain guidance instead of an LLM assessment. The
+metrics are sent along with the frame, so the diagnostic server does not
+score it again.
+
+Server clients can be injected through `clients` (keyed by server name);
+in_process.py uses this to run every server in this process and event loop,
+with `in_process=True` so frames travel as NumPy arrays by reference. With
+`--socket-dir=<dir>` (or MCP_SOCKET_DIR) the coordinator instead connects to
+servers listening on Unix sockets in that directory through pooled,
+multiplexed connections, and logs their per-connection statistics.
+
+Every stage call (ingest, segment, assess, speak) and every whole frame in
+`process_frame` is timed in `self.metrics` under the "coordinator"
+component (see metrics.py); `metrics_report()` dumps it as JSON or
+Prometheus text, and `--metrics-file=<path>` (or METRICS_FILE) writes it to
+a file with the pipeline stats and on exit. SLOW_REQUEST_MS enables stack
+profiles of slower requests and stages.
 """
 import asyncio
 import logging
-from typing import Dict
+from typing import Dict, Optional
+
+try:
+    from mcp import Client
+except ImportError:  # the in-process mode (in_process.py) does not need the MCP SDK
+    Client = None
 
-from mcp import Client
+from frame_hash import hamming
+from frame_scheduler import FrameScheduler
+from image_quality import ImageQualityScorer
+from mcp_local import PooledClient, socket_path
+from metrics import REGISTRY, MetricsRegistry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PIPELINE_STAGES = ("segment", "assess", "speak")
+SERVER_NAMES = ("ultrasound-ingest", "segmentation", "diagnostic", "voice-tts")
+# The overlay is for display only; skip computing it in the hot loop. The mask
+# is only used as a region downstream, so it travels as compact RLE
+SEGMENT_FIELDS = {"score": "float", "mask": "rle"}
+
 class Coordinator:
-    def __init__(self):
-        self.ingest_client = Client("ultrasound-ingest")
-        self.segmentation_client = Client("segmentation")
-        self.diagnostic_client = Client("diagnostic")
-        self.tts_client = Client("voice-tts")
-        
+    def __init__(self, queue_size: int = 2, target_hz: float = 1.0, deadline: Optional[float] = None,
+                 shared_memory: bool = False, reuse_threshold: Optional[float] = 0.98,
+                 max_hash_distance: int = 6, segment_session: Optional[str] = "coordinator",
+                 min_quality: Optional[float] = 0.4, target_organ: str = "liver",
+                 clients: Optional[Dict] = None, in_process: bool = False,
+                 registry: Optional[MetricsRegistry] = None, metrics_path: Optional[str] = None):
+        if clients is None:
+            if Client is None:
+                raise RuntimeError("The mcp package is required unless clients are provided")
+            clients = {name: Client(name) for name in SERVER_NAMES}
+        self.ingest_client = clients["ultrasound-ingest"]
+        self.segmentation_client = clients["segmentation"]
+        self.diagnostic_client = clients["diagnostic"]
+        self.tts_client = clients["voice-tts"]
+        self.target_organ = target_organ
+
+        # Servers share this process: ask for frames as arrays instead of encoded images
+        self.in_process = in_process
+
+        # Per-stage latency, in-flight and error metrics; written to `metrics_path`
+        # (Prometheus text for *.prom, JSON otherwise) with the stats and on exit
+        self.metrics = registry or REGISTRY
+        self.metrics_path = metrics_path
+
         self.guidance_text = "Please adjust the probe position to improve image quality."
 
-    async def process_frame(self):
-        """Process a single frame through the entire pipeline."""
-        # Get next frame from ingest server
-        frame_data = await self.ingest_client.request("nextFrame", {})
+        # Local quality gate in front of the diagnostic (LLM) call; None disables it
+        self.min_quality = min_quality
+        self.quality_scorer = ImageQualityScorer()
+        self.skipped_assessments = 0
+
+        # Pass frames between servers as shared-memory slot handles instead of base64
+        self.shared_memory = shared_memory
+
+        # Streaming segmentation session carried across frames; None disables it
+        self.segment_session = segment_session
+
+        # Static-hold detection; None disables result reuse
+        self.reuse_threshold = reuse_threshold
+        self.max_hash_distance = max_hash_distance
+        self.last_result: Optional[Dict] = None
+        self.reused_frames = 0
+
+        # Paces frames at target_hz; frames overrunning `deadline` count as late
+        self.scheduler = FrameScheduler(target_hz=target_hz, deadline=deadline)
+
+        # Pipelined mode: one bounded queue in front of each stage after ingest
+        self.queue_size = queue_size
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.processed = {stage: 0 for stage in ("ingest",) + PIPELINE_STAGES}
+        self.dropped = {stage: 0 for stage in PIPELINE_STAGES}
+
+    async def fetch_frame(self) -> Dict:
+        """Get next frame from ingest server."""
+        # Frames come back as arrays (by reference in process), or as shared-memory handles
+        params = {"shared_memory": True} if self.shared_memory and not self.in_process else {}
+        frame_data = await self.ingest_client.request("nextFrame", params)
         logger.info("Received new frame")
+        return frame_data
 
-        # Segment the image
-        seg_result = await self.segmentation_client.request(
-            "segment",
-            {"image": frame_data["image"]}
-        )
+    @staticmethod
+    def _frame_payload(frame_data: Dict) -> Dict:
+        """Forward the decoded array, the shared-memory handle or the encoded image."""
+        if "pixels" in frame_data:
+            return {"pixels": frame_data["pixels"]}
+        if "frame" in frame_data:
+            return {"frame": frame_data["frame"]}
+        return {"image": frame_data["image"]}
+
+    async def segment_frame(self, frame_data: Dict) -> Dict:
+        """Segment the image, asking only for the fields the pipeline reads."""
+        request = {**self._frame_payload(frame_data), "fields": SEGMENT_FIELDS}
+        if self.segment_session is not None:
+            request["session"] = self.segment_session
+        seg_result = await self.segmentation_client.request("segment", request)
         logger.info(f"Segmentation score: {seg_result['score']}")
+        return seg_result
 
+    async def assess_frame(self, frame_data: Dict, seg_result: Dict) -> str:
+        """Return the sentence to speak for a segmented frame."""
         # Check segmentation score
         if seg_result["score"] < 0.5:
             logger.info("Low segmentation score, requesting probe adjustment")
-            await self.tts_client.request(
-                "speak",
-                {"text": self.guidance_text}
-            )
-            return
+            return self.guidance_text
+
+        request = {
+            **self._frame_payload(frame_data),
+            "mask": seg_result["mask"],
+            "target_organ": self.target_organ
+        }
+        if self.min_quality is not None:
+            loop = asyncio.get_running_loop()
+            quality = await loop.run_in_executor(None, self.frame_quality, frame_data, seg_result)
+            if quality is not None:
+                if quality["score"] < self.min_quality:
+                    self.skipped_assessments += 1
+                    logger.info(f"Image quality {quality['score']:.2f} below {self.min_quality}, skipping assessment")
+                    return self.quality_guidance(quality)
+                # Scored once here; the diagnostic server reuses it
+                request["quality"] = quality
 
         # Process with diagnostic server
-        diag_result = await self.diagnostic_client.request(
-            "assess",
-            {
-                "image": frame_data["image"],
-                "mask": seg_result["mask"]
-            }
-        )
-        
+        diag_result = await self.diagnostic_client.request("assess", request)
+
         # Build result sentence
-        result_text = (
+        return (
             f"Image quality is {diag_result['image_quality']:.0%}. "
             f"Identified {', '.join(diag_result['landmarks'])}. "
             f"{diag_result['diagnosis']}."
         )
-        
-        # Speak result
+
+    def frame_quality(self, frame_data: Dict, seg_result: Dict) -> Optional[Dict]:
+        """Local quality metrics for the frame, or None if it cannot be decoded."""
+        image = next((frame_data[k] for k in ("pixels", "frame", "image") if k in frame_data), None)
+        try:
+            return self.quality_scorer.score(image, seg_result.get("mask"))
+        except Exception as e:
+            logger.warning(f"Could not score image quality: {e}")
+            return None
+
+    def quality_guidance(self, quality: Dict) -> str:
+        """Guidance addressing the most likely cause of a poor frame."""
+        if quality.get("saturated", 0.0) > 0.2:
+            return "The image is saturated. Please reduce the gain."
+        if quality["dynamic_range"] < self.quality_scorer.dynamic_range_ref * 0.25:
+            return "The image is too dark. Please increase the gain."
+        if quality["sharpness"] < self.quality_scorer.sharpness_ref * 0.2:
+            return "The image is blurry. Please hold the probe steady."
+        return self.guidance_text
+
+    async def speak(self, text: str):
+        """Send text to the TTS server."""
         await self.tts_client.request(
             "speak",
-            {"text": result_text}
+            {"text": text}
         )
-        logger.info(f"Spoke result: {result_text}")
+        logger.info(f"Spoke result: {text}")
+
+    def reuse_previous(self, frame_data: Dict) -> bool:
+        """True if the frame is unchanged enough to keep the previous result."""
+        if self.reuse_threshold is None or self.last_result is None:
+            return False
+        if frame_data.get("similarity", 0.0) < self.reuse_threshold:
+            return False
+        # Guard against slow drift: compare with the last frame actually processed
+        frame_hash = frame_data.get("hash")
+        if frame_hash is None:
+            return False
+        distance = hamming(int(frame_hash, 16), int(self.last_result["hash"], 16))
+        if distance > self.max_hash_distance:
+            return False
+        self.reused_frames += 1
+        logger.info(f"Frame unchanged (similarity {frame_data['similarity']}), reusing previous result")
+        return True
+
+    def remember_result(self, frame_data: Dict, seg_result: Dict, result_text: str):
+        if frame_data.get("hash") is not None:
+            self.last_result = {
+                "hash": frame_data["hash"],
+                "segmentation": seg_result,
+                "text": result_text,
+            }
+
+    def track(self, stage: str):
+        return self.metrics.track("coordinator", stage)
+
+    def metrics_report(self, format: str = "json") -> str:
+        if format == "prometheus":
+            return self.metrics.to_prometheus()
+        return self.metrics.to_json(include_profiles=True)
+
+    def dump_metrics(self):
+        if not self.metrics_path:
+            return
+        report = self.metrics_report("prometheus" if self.metrics_path.endswith(".prom") else "json")
+        with open(self.metrics_path, "w") as f:
+            f.write(report)
+
+    async def process_frame(self):
+        """Process a single frame through the entire pipeline."""
+        with self.track("frame"):
+            with self.track("ingest"):
+                frame_data = await self.fetch_frame()
+            if self.reuse_previous(frame_data):
+                return
+            with self.track("segment"):
+                seg_result = await self.segment_frame(frame_data)
+            with self.track("assess"):
+                result_text = await self.assess_frame(frame_data, seg_result)
+            self.remember_result(frame_data, seg_result, result_text)
+            with self.track("speak"):
+                await self.speak(result_text)
 
     async def run(self):
-        """Run the coordinator in an infinite loop."""
+        """Run the coordinator in an infinite loop, paced by the frame scheduler."""
+        self.scheduler.reset()
+        try:
+            while True:
+                await self.scheduler.wait_next()
+                try:
+                    await self.process_frame()
+                except Exception as e:
+                    logger.error(f"Error in processing loop: {e}")
+                finally:
+                    self.scheduler.frame_done()
+        finally:
+            self.dump_metrics()
+
+    # ------------------------------------------------------------------
+    # Pipelined mode
+    # ------------------------------------------------------------------
+
+    def _put_drop_oldest(self, stage: str, item):
+        """Enqueue for `stage`, discarding the oldest waiting item if full."""
+        queue = self.queues[stage]
+        while True:
+            try:
+                queue.put_nowait(item)
+                return
+            except asyncio.QueueFull:
+                queue.get_nowait()
+                queue.task_done()
+                self.dropped[stage] += 1
+                logger.debug(f"Dropped oldest item queued for {stage}")
+
+    def pipeline_stats(self) -> Dict[str, Dict[str, int]]:
+        """Report per-stage queue depth, processed and dropped counts."""
+        stats = {"ingest": {
+            "processed": self.processed["ingest"],
+            "reused": self.reused_frames,
+            **self.scheduler.stats()
+        }}
+        for stage in PIPELINE_STAGES:
+            queue = self.queues.get(stage)
+            stats[stage] = {
+                "depth": queue.qsize() if queue else 0,
+                "maxsize": self.queue_size,
+                "processed": self.processed[stage],
+                "dropped": self.dropped[stage],
+            }
+        return stats
+
+    async def _ingest_worker(self):
+        while True:
+            await self.scheduler.wait_next()
+            try:
+                with self.track("ingest"):
+                    frame_data = await self.fetch_frame()
+                self.processed["ingest"] += 1
+                if not self.reuse_previous(frame_data):
+                    self._put_drop_oldest("segment", frame_data)
+            except Exception as e:
+                logger.error(f"Error in ingest stage: {e}")
+            finally:
+                self.scheduler.frame_done()
+
+    async def _segment_worker(self):
+        queue = self.queues["segment"]
+        while True:
+            frame_data = await queue.get()
+            try:
+                with self.track("segment"):
+                    seg_result = await self.segment_frame(frame_data)
+                self.processed["segment"] += 1
+                self._put_drop_oldest("assess", (frame_data, seg_result))
+            except Exception as e:
+                logger.error(f"Error in segment stage: {e}")
+            finally:
+                queue.task_done()
+
+    async def _assess_worker(self):
+        queue = self.queues["assess"]
         while True:
+            frame_data, seg_result = await queue.get()
             try:
-                await self.process_frame()
-                # Throttle to 1 Hz
-                await asyncio.sleep(1)
+                with self.track("assess"):
+                    result_text = await self.assess_frame(frame_data, seg_result)
+                self.remember_result(frame_data, seg_result, result_text)
+                self.processed["assess"] += 1
+                self._put_drop_oldest("speak", result_text)
             except Exception as e:
-                logger.error(f"Error in processing loop: {e}")
-                await asyncio.sleep(1)
+                logger.error(f"Error in assess stage: {e}")
+            finally:
+                queue.task_done()
+
+    async def _speak_worker(self):
+        queue = self.queues["speak"]
+        while True:
+            text = await queue.get()
+            try:
+                with self.track("speak"):
+                    await self.speak(text)
+                self.processed["speak"] += 1
+            except Exception as e:
+                logger.error(f"Error in speak stage: {e}")
+            finally:
+                queue.task_done()
+
+    async def run_pipelined(self, stats_interval: Optional[float] = 10.0):
+        """
+        Run every stage as its own worker connected by bounded drop-oldest queues.
+        The frame scheduler paces the ingest stage; `stats_interval` controls how
+        often queue depths are logged (None disables logging).
+        """
+        self.scheduler.reset()
+        self.queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in PIPELINE_STAGES}
+        workers = [
+            self._ingest_worker(),
+            self._segment_worker(),
+            self._assess_worker(),
+            self._speak_worker(),
+        ]
+        if stats_interval:
+            workers.append(self._log_stats(stats_interval))
+        tasks = [asyncio.create_task(w) for w in workers]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.dump_metrics()
+
+    def connection_stats(self) -> Dict[str, list]:
+        """Per-connection statistics of clients that keep them (e.g. PooledClient)."""
+        clients = {
+            "ultrasound-ingest": self.ingest_client,
+            "segmentation": self.segmentation_client,
+            "diagnostic": self.diagnostic_client,
+            "voice-tts": self.tts_client,
+        }
+        return {name: client.stats() for name, client in clients.items() if callable(getattr(client, "stats", None))}
+
+    async def _log_stats(self, stats_interval: float):
+        while True:
+            await asyncio.sleep(stats_interval)
+            logger.info(f"Pipeline stats: {self.pipeline_stats()}")
+            connections = self.connection_stats()
+            if connections:
+                logger.info(f"Connection stats: {connections}")
+            self.dump_metrics()
 
 if __name__ == "__main__":
-    coordinator = Coordinator()
-    asyncio.run(coordinator.run())
+    import sys
+    import os
+    rate = next((float(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--rate=")), 1.0)
+    socket_dir = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--socket-dir=")),
+                      os.environ.get("MCP_SOCKET_DIR"))
+    clients = None
+    if socket_dir:
+        clients = {name: PooledClient(socket_path(name, socket_dir)) for name in SERVER_NAMES}
+    metrics_path = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--metrics-file=")),
+                        os.environ.get("METRICS_FILE"))
+    coordinator = Coordinator(target_hz=rate, shared_memory="--shared-memory" in sys.argv, clients=clients,
+                              metrics_path=metrics_path)
+    if "--pipelined" in sys.argv:
+        asyncio.run(coordinator.run_pipelined())
+    else:
+        asyncio.run(coordinator.run())
@@ -0,0 +1,130 @@
+"""
+Executor layer that keeps CPU-bound work off the asyncio event loop.
+`CPUExecutor.run(fn, *args, kind=...)` dispatches a call to one of two pools:
+- `thread`: for work that releases the GIL (NumPy, PIL decode/encode, torch).
+- `process`: for Python-heavy work that would hold the GIL. `fn` and its
+  arguments must be picklable.
+Both pools are sized from the core count, and a semaphore per pool bounds how
+many calls are handed to it at once; the rest wait on the loop. For each pool
+the executor records queue wait (from `run()` until the call starts in a
+worker) separately from execution time.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+EXECUTOR_KINDS = ("thread", "process")
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    """Runs in the worker; wall-clock start time is comparable across processes."""
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+class PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.exec_ms_total = 0.0
+        self.exec_ms_max = 0.0
+
+    def record(self, wait_ms: float, exec_ms: float):
+        with self.lock:
+            self.completed += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.exec_ms_total += exec_ms
+            self.exec_ms_max = max(self.exec_ms_max, exec_ms)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            completed = max(self.completed, 1)
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "queue_wait_ms_avg": self.wait_ms_total / completed,
+                "queue_wait_ms_max": self.wait_ms_max,
+                "exec_ms_avg": self.exec_ms_total / completed,
+                "exec_ms_max": self.exec_ms_max,
+            }
+
+class CPUExecutor:
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None,
+                 process_initializer: Optional[Callable] = None, process_initargs: tuple = ()):
+        cores = os.cpu_count() or 1
+        self.workers = {
+            "thread": thread_workers or cores,
+            # Leave a core for the event loop when there is more than one
+            "process": process_workers or max(1, cores - 1),
+        }
+        self.process_initializer = process_initializer
+        self.process_initargs = process_initargs
+        self._pools: Dict[str, Executor] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._stats = {kind: PoolStats() for kind in EXECUTOR_KINDS}
+
+    def _pool(self, kind: str) -> Executor:
+        pool = self._pools.get(kind)
+        if pool is None:
+            if kind == "thread":
+                pool = ThreadPoolExecutor(max_workers=self.workers[kind], thread_name_prefix="cpu")
+            else:
+                pool = ProcessPoolExecutor(max_workers=self.workers[kind],
+                                           initializer=self.process_initializer,
+                                           initargs=self.process_initargs)
+            self._pools[kind] = pool
+        return pool
+
+    def _limit(self, kind: str) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running loop
+        limit = self._limits.get(kind)
+        if limit is None:
+            limit = self._limits[kind] = asyncio.Semaphore(self.workers[kind])
+        return limit
+
+    async def run(self, fn: Callable, *args, kind: str = "thread", **kwargs):
+        """Run `fn(*args, **kwargs)` in the `kind` pool and return its result."""
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Executor kind must be one of {EXECUTOR_KINDS}")
+        stats = self._stats[kind]
+        submitted = time.time()
+        stats.waiting += 1
+        try:
+            await self._limit(kind).acquire()
+        finally:
+            stats.waiting -= 1
+        stats.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            started, finished, result = await loop.run_in_executor(
+                self._pool(kind), _timed_call, fn, args, kwargs
+            )
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            self._limit(kind).release()
+        stats.record(max(started - submitted, 0.0) * 1000, (finished - started) * 1000)
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            kind: {"workers": self.workers[kind], **self._stats[kind].snapshot()}
+            for kind in EXECUTOR_KINDS
+        }
+
+    def shutdown(self, wait: bool = True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        self._pools.clear()
@@ -1,73 +1,121 @@
 """
-Dummy diagnostic agent. Accepts `{image, mask}` and always returns:
+Dummy diagnostic agent. Accepts `{image, mask}` (or `{frame, mask}` with a
+shared-memory frame handle from the ingest server, or `{pixels, mask}` with a
+NumPy frame in the in-process mode) and returns:
 {diagnosis: "No abnormal findings",
  image_quality: 0.72,
+ quality: {...},
  landmarks: ["liver", "kidney"]}
+`image_quality` is the local quality score from image_quality.py and
+`quality` holds its individual metrics. Frames that cannot be decoded keep
+the default 0.72 score and an empty `quality`. A request that already
+carries `quality` (the coordinator scores every frame for its quality gate)
+is not scored again. Shared-memory frame copies and quality scoring run on a
+CPUExecutor (cpu_executor.py), never on the event loop.
 """
 import asyncio
+import base64
+import io
 import logging
 import os
-from typing import Dict
-import anthropic
+from typing import Dict, List, Optional
+import numpy as np
+from PIL import Image
 from dotenv import load_dotenv
+from cpu_executor import CPUExecutor
+from image_quality import ImageQualityScorer
+from llm_gateway import LLMGateway, get_gateway
+from mcp_local import App
 from prompts import create_health_assessment_prompt
+from shared_frames import read_frame
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def assessment_content(target_organ: str, pixels: np.ndarray) -> List[Dict]:
+    """Message content asking for a health assessment of a decoded frame, attached as a PNG."""
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(pixels)).save(buffer, format="PNG")
+    return [
+        {
+            "type": "image",
+            "source": {"type": "base64", "media_type": "image/png",
+                       "data": base64.b64encode(buffer.getvalue()).decode("utf-8")}
+        },
+        {"type": "text", "text": create_health_assessment_prompt(target_organ)},
+    ]
+
 class DiagnosticServer:
-    def __init__(self):
+    def __init__(self, llm: Optional[LLMGateway] = None, executor: Optional[CPUExecutor] = None):
         self.default_response = {
             "diagnosis": "No abnormal findings",
             "image_quality": 0.72,
             "landmarks": ["liver", "kidney"]
         }
-        self.app = App()
+        self.app = App("diagnostic")
+        self.quality_scorer = ImageQualityScorer()
+        self.executor = executor or CPUExecutor()
+        # Shared, pooled LLM client (see llm_gateway.py)
+        self.llm = llm or get_gateway()
 
     async def assess(self, request: Dict) -> Dict:
         """Process image and mask, return diagnostic information."""
         logger.info("Processing diagnostic request")
         
         # Verify input contains required fields
-        if not all(k in request for k in ["image", "mask", "target_organ"]):
-            raise ValueError("Request must include 'image', 'mask', and 'target_organ'")
+        if not any(k in request for k in ("image", "frame", "pixels")) or not all(k in request for k in ["mask", "target_organ"]):
+            raise ValueError("Request must include 'image' (or 'frame'/'pixels'), 'mask', and 'target_organ'")
 
-        # Extract fields
-        image = request["image"]
+        # Extract fields; a frame handle is copied out of its shared slot
         mask = request["mask"]
         target_organ = request["target_organ"]
+        if "pixels" in request or "frame" in request:
+            if "pixels" in request:
+                image = request["pixels"]
+            else:
+                image = await self.executor.run(read_frame, request["frame"])
+            prompt = await self.executor.run(assessment_content, target_organ, image)
+        else:
+            image = request["image"]
+            prompt = create_health_assessment_prompt(target_organ, image)
+
+        quality = request.get("quality")
+        if quality is None:
+            quality = await self.executor.run(self.frame_quality, image, mask)
 
-        # Compose prompt for Claude
-        prompt = create_health_assessment_prompt(target_organ, image)
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise RuntimeError("ANTHROPIC_API_KEY is not set in your environment or .env file!")
-        client = anthropic.AsyncAnthropic(api_key=api_key)
         try:
-            response = await client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                max_tokens=128,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            assessment = response.content
-            if isinstance(assessment, list):
-                assessment = " ".join([c["text"] if isinstance(c, dict) and "text" in c else str(c) for c in assessment])
+            assessment = await self.llm.complete(prompt, max_tokens=128)
         except Exception as e:
             logger.error(f"Error in Claude API call: {str(e)}")
             assessment = "Unable to complete health assessment at this time."
 
-        # Dummy image quality and landmarks for now
+        # Dummy landmarks for now
         return {
             "diagnosis": assessment,
-            "image_quality": 0.72,
+            "image_quality": quality.get("score", self.default_response["image_quality"]),
+            "quality": quality,
             "landmarks": [target_organ]
         }
 
+    def frame_quality(self, image, mask) -> Dict:
+        """Local quality metrics for the frame, or {} if it cannot be decoded."""
+        try:
+            return self.quality_scorer.score(image, mask)
+        except Exception as e:
+            logger.warning(f"Could not score image quality: {e}")
+            return {}
+
+    def register_handlers(self):
+        self.app.register_request("assess", self.assess)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
     def run(self):
         """Start the MCP server."""
-        self.app.register_request("assess", self.assess)
+        self.register_handlers()
         self.app.run(
             os.sys.stdin.buffer,
             os.sys.stdout.buffer,
@@ -75,6 +123,5 @@ class DiagnosticServer:
         )
 
 if __name__ == "__main__":
-    from mcp_local import App
     server = DiagnosticServer()
     server.run()
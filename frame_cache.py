@@ -0,0 +1,238 @@
+"""
+Pre-decoded frame cache for the ingest server.
+Each image file is decoded once into a contiguous RGB NumPy buffer and kept
+in an LRU cache bounded by a memory cap. Frames evicted from memory can be
+spilled to a memory-mapped raw frame store on disk, so large replay sets are
+served from page cache instead of being re-decoded with PIL. Memory-mapped
+frames live in the page cache, not the process heap, so only their base64
+payloads count against the cap.
+"""
+import base64
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class CachedFrame:
+    """A decoded RGB frame plus its lazily-built base64 payload."""
+
+    def __init__(self, pixels: np.ndarray, source: str, mapped: bool = False):
+        self.pixels = pixels
+        self.source = source
+        # Pixels are a view of the MmapFrameStore file rather than heap memory
+        self.mapped = mapped
+        self._b64: Optional[str] = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        height, width = self.pixels.shape[:2]
+        return width, height
+
+    @property
+    def nbytes(self) -> int:
+        """Heap bytes held by the frame."""
+        return (0 if self.mapped else self.pixels.nbytes) + (len(self._b64) if self._b64 else 0)
+
+    def b64(self) -> str:
+        """Raw RGB bytes encoded as base64, computed once per cached frame."""
+        if self._b64 is None:
+            self._b64 = encode_b64(self.pixels)
+        return self._b64
+
+def encode_b64(pixels: np.ndarray) -> str:
+    return base64.b64encode(memoryview(pixels).cast("B")).decode("utf-8")
+
+def decode_rgb(path: str) -> np.ndarray:
+    """Decode an image file into a C-contiguous (H, W, 3) uint8 array."""
+    with Image.open(path) as img:
+        return np.ascontiguousarray(np.asarray(img.convert("RGB"), dtype=np.uint8))
+
+class MmapFrameStore:
+    """
+    Append-only raw frame store backed by a single memory-mapped file.
+    An index file next to the data maps each key to (offset, shape), one
+    JSON record per line, appended after the frame's pixels are written; a
+    torn last line or a record pointing past the end of the data is ignored
+    on load.
+    """
+
+    def __init__(self, path: str):
+        self.data_path = Path(path)
+        self.index_path = self.data_path.with_suffix(self.data_path.suffix + ".jsonl")
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        self.index: Dict[str, Tuple[int, Tuple[int, ...]]] = {}
+        if self.index_path.exists() and self.data_path.exists():
+            self._load_index()
+        self._mmap: Optional[np.memmap] = None
+
+    def _load_index(self):
+        data_size = self.data_path.stat().st_size
+        line = ""
+        with open(self.index_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    offset, shape = record["offset"], tuple(record["shape"])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"Skipping unreadable record in {self.index_path}")
+                    continue
+                if offset + int(np.prod(shape)) <= data_size:
+                    self.index[record["key"]] = (offset, shape)
+        if line and not line.endswith("\n"):
+            # Terminate a torn record so the next append starts on its own line
+            with open(self.index_path, "a") as f:
+                f.write("\n")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def put(self, key: str, pixels: np.ndarray):
+        if key in self.index:
+            return
+        with open(self.data_path, "ab") as f:
+            offset = f.tell()
+            f.write(np.ascontiguousarray(pixels, dtype=np.uint8).tobytes())
+        self.index[key] = (offset, tuple(pixels.shape))
+        self._mmap = None  # file grew, remap on next read
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps({"key": key, "offset": offset, "shape": list(pixels.shape)}) + "\n")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return a read-only view of the stored frame, or None if absent."""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, shape = entry
+        if self._mmap is None:
+            self._mmap = np.memmap(self.data_path, dtype=np.uint8, mode="r")
+        count = int(np.prod(shape))
+        return self._mmap[offset:offset + count].reshape(shape)
+
+class FrameCache:
+    """
+    LRU cache of decoded frames keyed by file path and modification time.
+    `max_bytes` caps the in-memory footprint; with `store_path` set, decoded
+    frames are also written to an MmapFrameStore, so frames evicted from memory
+    come back as memory-mapped views instead of being decoded again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, store_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.store = MmapFrameStore(store_path) if store_path else None
+        self._frames: "OrderedDict[str, CachedFrame]" = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.evictions = 0
+        # Frames may be decoded ahead of time on a worker thread
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+
+    @staticmethod
+    def _key(path: str) -> str:
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def __contains__(self, path: str) -> bool:
+        return self._key(path) in self._frames
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def get(self, path: str) -> CachedFrame:
+        """Return the decoded frame for `path`, decoding it only on a miss."""
+        return self._get(self._key(path), path)
+
+    def _get(self, key: str, path: str) -> CachedFrame:
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+            pixels = self.store.get(key) if self.store is not None else None
+            if pixels is not None:
+                self.store_hits += 1
+                return self._insert(key, CachedFrame(pixels, path, mapped=True))
+            # A prefetch and a request for the same file share one decode
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = pending = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result()
+        # Decode outside the lock so a background prefetch never blocks lookups
+        try:
+            pixels = decode_rgb(path)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            if self.store is not None:
+                self.store.put(key, pixels)
+            frame = self._insert(key, CachedFrame(pixels, path))
+        pending.set_result(frame)
+        return frame
+
+    def _insert(self, key: str, frame: CachedFrame) -> CachedFrame:
+        self._frames[key] = frame
+        self.current_bytes += frame.nbytes
+        self._evict()
+        return frame
+
+    def get_b64(self, path: str) -> str:
+        """Return the base64 payload for `path`, counting it against the memory cap."""
+        key = self._key(path)
+        frame = self._get(key, path)
+        if frame._b64 is not None:
+            return frame._b64
+        payload = encode_b64(frame.pixels)
+        with self._lock:
+            if frame._b64 is None:
+                frame._b64 = payload
+                # An evicted frame no longer counts against the cap
+                if self._frames.get(key) is frame:
+                    self.current_bytes += len(payload)
+                    self._evict()
+            return frame._b64
+
+    def _evict(self):
+        # Always keep the most recent frame, even if it alone exceeds the cap
+        while self.current_bytes > self.max_bytes and len(self._frames) > 1:
+            key, frame = self._frames.popitem(last=False)
+            self.current_bytes -= frame.nbytes
+            self.evictions += 1
+            logger.debug(f"Evicted {frame.source} from frame cache")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "frames": len(self._frames),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "store_hits": self.store_hits,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,53 @@
+"""
+Fast change detection between consecutive frames.
+Each frame is reduced to a small grayscale thumbnail, from which a 64-bit
+difference hash (dHash) is built. Consecutive frames are compared on the
+thumbnails (mean absolute difference) to give a similarity score in [0, 1];
+hashes are cheap to keep around and compare by Hamming distance.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+THUMB_SIZE = 32
+HASH_SIZE = 8
+
+def thumbnail(pixels: np.ndarray, size: int = THUMB_SIZE) -> np.ndarray:
+    """Box-downsample a frame to a (size, size) float32 grayscale array."""
+    img = Image.fromarray(np.asarray(pixels))
+    if img.mode != "L":
+        img = img.convert("L")
+    return np.asarray(img.resize((size, size), Image.BOX), dtype=np.float32)
+
+def dhash(thumb: np.ndarray, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel comparison."""
+    small = np.asarray(
+        Image.fromarray(thumb).resize((hash_size + 1, hash_size), Image.BOX),
+        dtype=np.float32
+    )
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def similarity(thumb_a: np.ndarray, thumb_b: np.ndarray) -> float:
+    """1.0 for identical thumbnails, 0.0 for maximally different ones."""
+    return float(1.0 - np.abs(thumb_a - thumb_b).mean() / 255.0)
+
+class FrameChangeDetector:
+    """Tags each frame with its hash and similarity to the previous frame."""
+
+    def __init__(self, size: int = THUMB_SIZE):
+        self.size = size
+        self._previous: Optional[np.ndarray] = None
+
+    def tag(self, pixels: np.ndarray) -> Dict:
+        thumb = thumbnail(pixels, self.size)
+        score = similarity(thumb, self._previous) if self._previous is not None else 0.0
+        self._previous = thumb
+        return {"hash": f"{dhash(thumb):016x}", "similarity": round(score, 4)}
+
+    def reset(self):
+        self._previous = None
@@ -0,0 +1,81 @@
+"""
+Deadline-driven frame scheduler for the coordinator loop.
+Frames are released on a fixed grid of slots at `target_hz`. When a frame
+finishes early the scheduler waits for the next slot; when the loop falls
+behind, the slots that have already passed are skipped (counted as dropped)
+and the next frame runs immediately. Frames that take longer than the
+per-frame deadline are counted as late.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class FrameScheduler:
+    def __init__(self, target_hz: float = 1.0, deadline: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if target_hz <= 0:
+            raise ValueError("target_hz must be positive")
+        self.period = 1.0 / target_hz
+        # By default a frame is late if it overruns its own slot
+        self.deadline = deadline if deadline is not None else self.period
+        self.clock = clock
+        self.reset()
+
+    def reset(self):
+        """Clear counters and restart the slot grid on the next wait."""
+        self._next_slot: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._frame_start: Optional[float] = None
+        self.frames = 0
+        self.dropped = 0
+        self.late = 0
+
+    async def wait_next(self):
+        """Wait until the next frame slot, skipping slots that are already stale."""
+        now = self.clock()
+        if self._next_slot is None:
+            self._next_slot = now
+            self._started_at = now
+        if now < self._next_slot:
+            await asyncio.sleep(self._next_slot - now)
+            now = self.clock()
+        else:
+            missed = int((now - self._next_slot) // self.period)
+            if missed:
+                self.dropped += missed
+                self._next_slot += missed * self.period
+                logger.debug(f"Scheduler behind, skipped {missed} frame slot(s)")
+        self._frame_start = now
+        self._next_slot += self.period
+
+    def frame_done(self) -> bool:
+        """Record the end of the current frame; returns True if it missed its deadline."""
+        if self._frame_start is None:
+            return False
+        elapsed = self.clock() - self._frame_start
+        self._frame_start = None
+        self.frames += 1
+        if elapsed > self.deadline:
+            self.late += 1
+            logger.debug(f"Frame took {elapsed:.3f}s, deadline {self.deadline:.3f}s")
+            return True
+        return False
+
+    @property
+    def achieved_hz(self) -> float:
+        if self._started_at is None or self.frames == 0:
+            return 0.0
+        elapsed = self.clock() - self._started_at
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "target_hz": 1.0 / self.period,
+            "achieved_hz": self.achieved_hz,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "late": self.late,
+        }
@@ -0,0 +1,185 @@
+"""
+Incremental watcher for the `sample_images/` directory.
+Keeps an index of frame files ordered by modification time, updated as the
+acquisition side writes new files. Uses inotify (via the optional
+`inotify_simple` package) when available and falls back to polling, where a
+rescan only happens once the directory's own mtime has changed. Newly seen
+files are handed to an `on_added` callback so they can be decoded in the
+background before they are requested.
+"""
+import asyncio
+import bisect
+import fnmatch
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = flags = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+class FrameIndex:
+    """
+    Frame paths kept sorted by (mtime_ns, path). New frames normally carry
+    the newest mtime, so inserts land at the end of the list; removals find
+    their entry by bisection.
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[int, str]] = []
+        self._mtimes: Dict[str, int] = {}
+        # paths() result, rebuilt after the next change
+        self._paths: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._mtimes
+
+    def __getitem__(self, idx: int) -> str:
+        return self._entries[idx][1]
+
+    def add(self, path: str, mtime_ns: int) -> bool:
+        """Insert or reposition `path`; returns True if it is new or changed."""
+        old = self._mtimes.get(path)
+        if old == mtime_ns:
+            return False
+        if old is not None:
+            self._discard((old, path))
+        entry = (mtime_ns, path)
+        if not self._entries or entry > self._entries[-1]:
+            self._entries.append(entry)
+        else:
+            bisect.insort(self._entries, entry)
+        self._mtimes[path] = mtime_ns
+        self._paths = None
+        return True
+
+    def _discard(self, entry: Tuple[int, str]):
+        del self._entries[bisect.bisect_left(self._entries, entry)]
+
+    def remove(self, path: str):
+        mtime_ns = self._mtimes.pop(path, None)
+        if mtime_ns is not None:
+            self._discard((mtime_ns, path))
+            self._paths = None
+
+    def newest(self) -> Optional[str]:
+        return self._entries[-1][1] if self._entries else None
+
+    def paths(self, newest_first: bool = False) -> List[str]:
+        """Indexed paths, oldest first; the list is shared until the index changes, do not modify it."""
+        if self._paths is None:
+            self._paths = [path for _, path in self._entries]
+        return self._paths[::-1] if newest_first else self._paths
+
+class DirectoryWatcher:
+    def __init__(self, directory: str, patterns: Iterable[str] = IMAGE_PATTERNS,
+                 poll_interval: float = 0.5, on_added: Optional[Callable[[str], None]] = None,
+                 use_inotify: bool = True):
+        self.directory = str(directory)
+        self.patterns = tuple(patterns)
+        self.poll_interval = poll_interval
+        self.on_added = on_added
+        self.use_inotify = use_inotify and INotify is not None
+        self.index = FrameIndex()
+        self._dir_mtime: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _matches(self, name: str) -> bool:
+        lower = name.lower()
+        return any(fnmatch.fnmatch(lower, pattern) for pattern in self.patterns)
+
+    def _add(self, path: str, mtime_ns: int):
+        if self.index.add(path, mtime_ns):
+            logger.debug(f"Indexed frame {path}")
+            if self.on_added:
+                self.on_added(path)
+
+    def _add_path(self, path: str):
+        try:
+            self._add(path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            self.index.remove(path)
+
+    def scan(self) -> int:
+        """Full directory scan; returns the number of indexed frames."""
+        seen = set()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and self._matches(entry.name):
+                    seen.add(entry.path)
+                    self._add(entry.path, entry.stat().st_mtime_ns)
+        for path in list(self.index.paths()):
+            if path not in seen:
+                self.index.remove(path)
+        self._dir_mtime = os.stat(self.directory).st_mtime_ns
+        return len(self.index)
+
+    def poll(self) -> bool:
+        """Rescan only if the directory changed since the last scan."""
+        dir_mtime = os.stat(self.directory).st_mtime_ns
+        if dir_mtime == self._dir_mtime:
+            return False
+        self.scan()
+        return True
+
+    def start(self) -> asyncio.Task:
+        """Start watching in the background on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.watch())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def watch(self):
+        if self._dir_mtime is None:
+            self.scan()
+        if self.use_inotify:
+            await self._watch_inotify()
+        else:
+            await self._watch_polling()
+
+    async def _watch_polling(self):
+        logger.info(f"Polling {self.directory} every {self.poll_interval}s for new frames")
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error polling {self.directory}: {e}")
+
+    async def _watch_inotify(self):
+        logger.info(f"Watching {self.directory} with inotify for new frames")
+        inotify = INotify()
+        inotify.add_watch(
+            self.directory,
+            flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE | flags.MOVED_FROM
+        )
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        loop.add_reader(inotify.fileno(), ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                for event in inotify.read(timeout=0):
+                    if not event.name or not self._matches(event.name):
+                        continue
+                    path = os.path.join(self.directory, event.name)
+                    if event.mask & (flags.DELETE | flags.MOVED_FROM):
+                        self.index.remove(path)
+                    else:
+                        self._add_path(path)
+        finally:
+            loop.remove_reader(inotify.fileno())
+            inotify.close()
@@ -0,0 +1,125 @@
+"""
+Local image-quality scoring for ultrasound frames, used to skip expensive
+LLM assessments of frames nobody could read anyway.
+
+`ImageQualityScorer.score(image, mask)` computes vectorized NumPy metrics on a
+grayscale copy of the frame, downsampled so the longest side is at most
+`max_side` pixels (a few milliseconds per frame):
+- sharpness: variance of the 4-neighbour Laplacian relative to the variance
+  of the frame, so it does not depend on gain (low for blurry frames)
+- snr: mean / standard deviation inside the mask region; fully developed
+  speckle sits near 1.9, lower values mean noise dominates
+- coverage: fraction of the frame covered by the mask, taken from the
+  encoded mask without decoding it where possible (see mask_codec.py)
+- dynamic_range: spread between the 1st and 99th intensity percentiles,
+  plus the fractions of saturated and near-black pixels (too much/little gain)
+Each metric is mapped to [0, 1] against a reference value, and the overall
+`score` is their weighted geometric mean, so a single failing metric (for
+example no gain at all) pulls the whole frame down.
+"""
+import base64
+import io
+import math
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from mask_codec import decode_mask, mask_area, mask_shape
+from shared_frames import read_frame
+
+DEFAULT_WEIGHTS = {"sharpness": 0.35, "snr": 0.2, "coverage": 0.15, "dynamic_range": 0.3}
+
+def load_pixels(image) -> np.ndarray:
+    """Pixels from an array, a shared-memory frame handle, PNG/JPEG bytes or base64 text."""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, dict):
+        return read_frame(image)
+    if isinstance(image, str):
+        image = base64.b64decode(image)
+    if isinstance(image, (bytes, bytearray)):
+        return np.asarray(Image.open(io.BytesIO(image)))
+    return np.asarray(image)
+
+def to_gray(pixels: np.ndarray, max_side: int = 256) -> np.ndarray:
+    """Float32 luminance, strided down so the longest side is at most `max_side`."""
+    step = max(1, -(-max(pixels.shape[:2]) // max_side))
+    pixels = pixels[::step, ::step]
+    if pixels.ndim == 2:
+        return pixels.astype(np.float32)
+    rgb = pixels[..., :3].astype(np.float32)
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def laplacian_ratio(gray: np.ndarray) -> float:
+    """Laplacian variance over intensity variance; about 20 for white noise, near 0 for flat blur."""
+    variance = float(gray.var())
+    return laplacian_variance(gray) / variance if variance > 0 else 0.0
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    if min(gray.shape) < 3:
+        return 0.0
+    center = gray[1:-1, 1:-1]
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * center
+    return float(laplacian.var())
+
+class ImageQualityScorer:
+    def __init__(self, weights: Optional[Dict[str, float]] = None, sharpness_ref: float = 2.0,
+                 snr_ref: float = 1.9, dynamic_range_ref: float = 160.0,
+                 min_coverage: float = 0.02, max_side: int = 256):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.sharpness_ref = sharpness_ref
+        self.snr_ref = snr_ref
+        self.dynamic_range_ref = dynamic_range_ref
+        self.min_coverage = min_coverage
+        self.max_side = max_side
+
+    def _region(self, mask, shape) -> Optional[np.ndarray]:
+        """Mask resampled to the downsampled frame, or None to use the whole frame."""
+        if mask is None:
+            return None
+        region = decode_mask(mask)
+        if region.shape != tuple(shape[:2]):
+            return None
+        step = max(1, -(-max(shape[:2]) // self.max_side))
+        region = region[::step, ::step]
+        return region if region.any() else None
+
+    def score(self, image, mask=None) -> Dict[str, float]:
+        start = time.perf_counter()
+        pixels = load_pixels(image)
+        gray = to_gray(pixels, self.max_side)
+        metrics = {}
+
+        metrics["sharpness"] = laplacian_ratio(gray)
+
+        region = self._region(mask, pixels.shape)
+        values = gray[region] if region is not None else gray.ravel()
+        std = float(values.std())
+        metrics["snr"] = float(values.mean()) / std if std > 0 else 0.0
+
+        if mask is not None:
+            height, width = mask_shape(mask)
+            metrics["coverage"] = mask_area(mask) / float(height * width) if height * width else 0.0
+
+        low, high = np.percentile(gray, [1, 99])
+        metrics["dynamic_range"] = float(high - low)
+        metrics["saturated"] = float(np.count_nonzero(gray >= 250)) / gray.size
+        metrics["dark"] = float(np.count_nonzero(gray <= 5)) / gray.size
+
+        components = {
+            "sharpness": min(metrics["sharpness"] / self.sharpness_ref, 1.0),
+            "snr": min(metrics["snr"] / self.snr_ref, 1.0),
+            # Saturated pixels carry no information, so they count against the range
+            "dynamic_range": min(metrics["dynamic_range"] / self.dynamic_range_ref, 1.0)
+                             * max(1.0 - 2 * metrics["saturated"], 0.0),
+        }
+        if "coverage" in metrics:
+            components["coverage"] = min(metrics["coverage"] / self.min_coverage, 1.0)
+        total_weight = sum(self.weights.get(name, 0.0) for name in components)
+        log_score = sum(self.weights.get(name, 0.0) * math.log(max(value, 1e-3))
+                        for name, value in components.items())
+        metrics["score"] = math.exp(log_score / total_weight) if total_weight else 0.0
+        metrics["ms"] = (time.perf_counter() - start) * 1000
+        return {name: round(value, 4) for name, value in metrics.items()}
@@ -0,0 +1,108 @@
+"""
+Single-process deployment: the coordinator and the ingest, segmentation,
+diagnostic, navigation and TTS servers all live in one process and share one
+event loop. Each server registers its handlers on its `mcp_local.App` exactly
+as in the multi-process mode, and the coordinator reaches them through
+`LocalClient`s that call the handlers directly, so requests and results
+(including NumPy frames) are passed by reference instead of being serialized.
+Servers with a `start()` hook (background work such as the navigation
+guidance refresh) are started when the deployment runs and closed after it.
+
+Run with the same flags as coordinator.py:
+
+    python in_process.py [--pipelined] [--rate=<hz>] [--metrics-file=<path>]
+"""
+import asyncio
+import logging
+import os
+import sys
+from typing import Callable, Dict, Optional
+
+from coordinator import SERVER_NAMES, Coordinator
+from mcp_local import LocalClient
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def default_servers() -> Dict[str, Callable]:
+    """Server factories by name; modules are imported only when a server is built."""
+    def ingest():
+        from ingest_server import UltrasoundIngestServer
+        return UltrasoundIngestServer(
+            frame_store=os.environ.get("INGEST_FRAME_STORE"),
+            order=os.environ.get("INGEST_ORDER", "timestamp")
+        )
+
+    def segmentation():
+        from segmentation_server import SegmentationServer
+        return SegmentationServer(backend=os.environ.get("SEGMENTATION_BACKEND", "stub"))
+
+    def diagnostic():
+        from diagnostic_server import DiagnosticServer
+        return DiagnosticServer()
+
+    def navigation():
+        from navigation_server import NavigationServer
+        return NavigationServer()
+
+    def voice_tts():
+        from voice_tts_server import VoiceTTSServer
+        return VoiceTTSServer()
+
+    return {
+        "ultrasound-ingest": ingest,
+        "segmentation": segmentation,
+        "diagnostic": diagnostic,
+        "navigation": navigation,
+        "voice-tts": voice_tts,
+    }
+
+class InProcessDeployment:
+    def __init__(self, servers: Optional[Dict[str, Optional[Callable]]] = None, **coordinator_options):
+        """
+        `servers` overrides factories by name (None leaves a server out); the
+        remaining keyword arguments go to Coordinator.
+        """
+        factories = {**default_servers(), **(servers or {})}
+        self.servers = {}
+        for name, factory in factories.items():
+            if factory is None:
+                continue
+            try:
+                server = factory()
+            except Exception as e:
+                if name in SERVER_NAMES:
+                    raise
+                # Servers the coordinator does not depend on are optional
+                logger.warning(f"Skipping {name} server: {e}")
+                continue
+            if hasattr(server, "register_handlers"):
+                server.register_handlers()
+            self.servers[name] = server
+
+        self.clients = {name: LocalClient(server.app) for name, server in self.servers.items()}
+        self.coordinator = Coordinator(clients=self.clients, in_process=True, **coordinator_options)
+
+    async def run(self, pipelined: bool = False):
+        for server in self.servers.values():
+            if hasattr(server, "start"):
+                server.start()
+        try:
+            if pipelined:
+                await self.coordinator.run_pipelined()
+            else:
+                await self.coordinator.run()
+        finally:
+            self.close()
+
+    def close(self):
+        for server in self.servers.values():
+            if hasattr(server, "close"):
+                server.close()
+
+if __name__ == "__main__":
+    rate = next((float(arg.split("=", 1)[1]) for arg in sys.argv if arg.startswith("--rate=")), 1.0)
+    metrics_path = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--metrics-file=")),
+                        os.environ.get("METRICS_FILE"))
+    deployment = InProcessDeployment(target_hz=rate, metrics_path=metrics_path)
+    asyncio.run(deployment.run(pipelined="--pipelined" in sys.argv))
@@ -1,80 +1,205 @@
 """
 Simulated Ultrasound-2 image source.
-Runs an MCP server exposing `nextFrame -> {image, settings, timestamp}`.
+Runs an MCP server exposing `nextFrame -> {pixels, settings, timestamp}`.
 Reads PNG/JPEG files that the user drops into `sample_images/` and serves
-them round-robin; no hardware required.
+them round-robin; no hardware required. Cine loops (video, multi-page TIFF,
+raw frame dumps; see cine_source.py) are streamed frame by frame before
+moving on to the next file, and `timestamp` is the time recorded by the
+source (file mtime for still images) rather than the serving time.
+
+Each still image is decoded once into a memory-capped LRU frame cache (see
+frame_cache.py), so serving it is a buffer lookup rather than a disk read
+and PIL decode.
+
+The directory is watched incrementally (see frame_watcher.py): new files
+written by the acquisition side are indexed by modification time and decoded
+in the background before they are requested. Frames are served in timestamp
+order (`order="timestamp"`, round-robin) or newest first (`order="newest"`).
+
+Every response also carries `hash` (a 64-bit perceptual hash, hex) and
+`similarity` (0..1 against the previously served frame; see frame_hash.py)
+so the coordinator can skip work on a held, unchanged probe.
+
+`pixels` is the decoded frame as a read-only NumPy array: in-process
+deployments (see in_process.py) get the cached array by reference, and over
+the binary MCP transport (wire.py) it travels as dtype + shape + raw bytes,
+with no image encoding or base64. `nextFrame({"shared_memory": true})`
+writes the frame into a shared-memory slot instead (see shared_frames.py)
+and returns `{frame, settings, timestamp}` where `frame` is a slot handle
+carrying shape, dtype, mode and sequence number.
 """
 import asyncio
-import base64
-import glob
 import json
 import logging
 import os
-import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+from cine_source import CINE_PATTERNS, CineSource, is_cine
+from frame_cache import DEFAULT_MAX_BYTES, FrameCache
+from frame_hash import FrameChangeDetector
+from frame_watcher import IMAGE_PATTERNS, DirectoryWatcher
 from mcp_local import App
-from PIL import Image
+from shared_frames import SharedFramePool
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class UltrasoundIngestServer:
-    def __init__(self):
+    def __init__(self, cache_bytes: int = DEFAULT_MAX_BYTES, frame_store: Optional[str] = None,
+                 order: str = "timestamp", watch: bool = True):
+        if order not in ("timestamp", "newest"):
+            raise ValueError("order must be 'timestamp' or 'newest'")
         self.app = App("ultrasound-ingest")
-        self.images: List[str] = []
+        self.order = order
+        self.watch = watch
+        self.watcher = DirectoryWatcher(
+            "sample_images",
+            patterns=IMAGE_PATTERNS + CINE_PATTERNS,
+            on_added=self._prefetch
+        )
         self.current_idx = 0
+        # Only frames that arrive after the initial scan are decoded ahead of time
+        self.prefetch_new = False
+        # Cine loop currently being streamed, if any
+        self.cine: Optional[CineSource] = None
+        self.change_detector = FrameChangeDetector()
         self.metadata = {"depth": 70, "gain": 35}
+        # Decoded frames; `frame_store` enables the memory-mapped on-disk fallback
+        self.frame_cache = FrameCache(max_bytes=cache_bytes, store_path=frame_store)
+        # Created on the first shared-memory request
+        self.frame_pool: Optional[SharedFramePool] = None
+
+    @property
+    def images(self) -> List[str]:
+        """Indexed frame paths in timestamp order."""
+        return self.watcher.index.paths()
+
+    def _prefetch(self, image_path: str):
+        """Decode a newly indexed frame on a worker thread."""
+        if not self.prefetch_new:
+            return  # existing files are decoded on first request
+        if is_cine(image_path):
+            return  # cine loops are decoded lazily while streaming
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet; the frame is decoded on first request
+        future = loop.run_in_executor(None, self.frame_cache.get, image_path)
+        future.add_done_callback(lambda f: self._prefetched(image_path, f))
+
+    @staticmethod
+    def _prefetched(image_path: str, future: asyncio.Future):
+        # A cancelled prefetch (e.g. at shutdown) has no exception to report
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to prefetch {image_path}: {future.exception()}")
 
     async def load_images(self):
-        """Load all images from sample_images directory."""
+        """Index all images in the sample_images directory."""
         image_dir = Path("sample_images")
         if not image_dir.exists():
             image_dir.mkdir(exist_ok=True)
             logger.info("Created sample_images directory")
-        
-        self.images = []
-        for ext in ('*.png', '*.jpg', '*.jpeg'):
-            self.images.extend(glob.glob(str(image_dir / ext)))
-        logger.info(f"Loaded {len(self.images)} images from sample_images/")
-
-    async def next_frame(self, _) -> Dict:
-        """Return next image in round-robin fashion with metadata."""
-        if not self.images:
+
+        self.watcher.scan()
+        self.prefetch_new = True
+        logger.info(f"Loaded {len(self.watcher.index)} images from sample_images/")
+
+    def _select_path(self) -> str:
+        index = self.watcher.index
+        # The watcher may have removed the last file since next_frame checked
+        if not index:
+            raise RuntimeError("No images found in sample_images/")
+        if self.order == "newest":
+            return index.newest()
+        self.current_idx %= len(index)
+        image_path = index[self.current_idx]
+        self.current_idx += 1
+        return image_path
+
+    async def _next_cine_frame(self) -> Optional[Dict]:
+        """Next frame of the active cine loop, or None once it is exhausted."""
+        frame = await asyncio.to_thread(self.cine.next)
+        if frame is None:
+            self.cine = None
+            return None
+        return {
+            "path": self.cine.path,
+            "pixels": frame.pixels,
+            "timestamp": frame.timestamp,
+            "frame_index": frame.index,
+        }
+
+    async def next_frame(self, request) -> Dict:
+        """Return the next image (round-robin or newest) with metadata."""
+        index = self.watcher.index
+        if not index:
             await self.load_images()
-            if not self.images:
+            if not index:
                 raise RuntimeError("No images found in sample_images/")
+        if self.watch:
+            self.watcher.start()
 
-        image_path = self.images[self.current_idx]
-        self.current_idx = (self.current_idx + 1) % len(self.images)
-
-        # Load and encode image
-        with Image.open(image_path) as img:
-            # Convert to bytes
-            img_byte_arr = img.convert('RGB')
-            img_bytes = img_byte_arr.tobytes()
-            # Encode as base64 for JSON serialization
-            img_b64 = base64.b64encode(img_bytes).decode('utf-8')
+        source = await self._next_cine_frame() if self.cine else None
+        if source is None:
+            image_path = self._select_path()
+            if is_cine(image_path):
+                self.cine = CineSource(image_path)
+                source = await self._next_cine_frame()
+                if source is None:
+                    raise RuntimeError(f"Cine loop {image_path} contains no frames")
+            else:
+                source = {"path": image_path, "timestamp": os.path.getmtime(image_path)}
 
         response = {
-            "image": img_b64,
             "settings": self.metadata,
-            "timestamp": int(time.time())
+            "timestamp": source["timestamp"]
         }
-        
-        logger.info(f"Serving frame from {image_path}")
+        if "frame_index" in source:
+            response["frame_index"] = source["frame_index"]
+
+        pixels = source.get("pixels")
+        if pixels is None:
+            pixels = self.frame_cache.get(source["path"]).pixels
+        response.update(self.change_detector.tag(pixels))
+
+        if request and request.get("shared_memory"):
+            # Hand over a slot handle; consumers map the pixels without copying
+            if self.frame_pool is None:
+                self.frame_pool = SharedFramePool()
+            response["frame"] = self.frame_pool.write(pixels, mode="RGB" if pixels.ndim == 3 else "L")
+        else:
+            # By reference in process; dtype + shape + raw bytes over the binary transport
+            response["pixels"] = pixels
+
+        logger.info(f"Serving frame from {source['path']}")
         return response
 
+    def register_handlers(self):
+        self.app.register_request("nextFrame", self.next_frame)
+
+    def close(self):
+        self.watcher.stop()
+        if self.cine is not None:
+            self.cine.close()
+        if self.frame_pool is not None:
+            self.frame_pool.close()
+
     def run(self):
         """Start the MCP server."""
-        self.app.register_request("nextFrame", self.next_frame)
-        self.app.run(
-            os.sys.stdin.buffer,
-            os.sys.stdout.buffer,
-            self.app.create_initialization_options()
-        )
+        self.register_handlers()
+        try:
+            self.app.run(
+                os.sys.stdin.buffer,
+                os.sys.stdout.buffer,
+                self.app.create_initialization_options()
+            )
+        finally:
+            self.close()
 
 if __name__ == "__main__":
-    server = UltrasoundIngestServer()
+    server = UltrasoundIngestServer(
+        frame_store=os.environ.get("INGEST_FRAME_STORE"),
+        order=os.environ.get("INGEST_ORDER", "timestamp")
+    )
     server.run()
@@ -0,0 +1,186 @@
+"""
+Shared gateway to the Anthropic API for the diagnostic, navigation and
+report servers and the classification helper (sam/classification.py).
+
+One `LLMGateway` per process (`get_gateway()`) owns a single long-lived
+`anthropic.AsyncAnthropic` client over a pooled `httpx.AsyncClient`, so
+connections (and their TLS sessions) are kept alive and reused across
+requests instead of being set up for every call. The client runs on the
+gateway's own event-loop thread; `complete()` (async) and `complete_sync()`
+(blocking, for synchronous callers) both submit to it, so every caller in
+the process shares the same connection pool and the same concurrency cap,
+whatever event loop or thread it runs on.
+
+Configuration (constructor arguments, or environment for `get_gateway()`):
+- LLM_MODEL: default model,
+- LLM_MAX_CONCURRENCY: requests in flight at once; further calls wait,
+- LLM_TIMEOUT / LLM_CONNECT_TIMEOUT: per-request and connect timeouts (s),
+- LLM_MAX_CONNECTIONS / LLM_KEEPALIVE: pool size and idle keep-alive (s),
+- LLM_MAX_RETRIES: SDK retries on connection errors and 429/5xx.
+Every call is timed in the metrics registry (see metrics.py) under the
+"llm" component.
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Union
+
+import anthropic
+import httpx
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+
+def response_text(response) -> str:
+    """Join the text blocks of a Messages API response."""
+    content = response.content
+    if not isinstance(content, list):
+        return str(content)
+    parts = []
+    for block in content:
+        if isinstance(block, dict):
+            parts.append(block.get("text", ""))
+        else:
+            parts.append(getattr(block, "text", str(block)))
+    return " ".join(parts)
+
+class LLMGateway:
+    def __init__(self, api_key: Optional[str] = None, model: str = DEFAULT_MODEL,
+                 max_concurrency: int = 8, timeout: float = 30.0, connect_timeout: float = 5.0,
+                 max_connections: int = 16, keepalive_expiry: float = 60.0, max_retries: int = 2,
+                 registry: Optional[metrics.MetricsRegistry] = None):
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.max_retries = max_retries
+        self.metrics = registry or metrics.REGISTRY
+        self.in_flight = 0
+        self.waiting = 0
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # Created on the gateway loop by the first request
+        self._client: Optional[anthropic.AsyncAnthropic] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        env = os.environ.get
+        return cls(
+            model=env("LLM_MODEL", DEFAULT_MODEL),
+            max_concurrency=int(env("LLM_MAX_CONCURRENCY", "8")),
+            timeout=float(env("LLM_TIMEOUT", "30")),
+            connect_timeout=float(env("LLM_CONNECT_TIMEOUT", "5")),
+            max_connections=int(env("LLM_MAX_CONNECTIONS", "16")),
+            keepalive_expiry=float(env("LLM_KEEPALIVE", "60")),
+            max_retries=int(env("LLM_MAX_RETRIES", "2")),
+        )
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def _create_client(self) -> anthropic.AsyncAnthropic:
+        api_key = self.api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise RuntimeError("ANTHROPIC_API_KEY is not set in your environment or .env file!")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+        return anthropic.AsyncAnthropic(api_key=api_key, http_client=http_client, max_retries=self.max_retries)
+
+    async def _complete(self, content: Union[str, List[Dict]], max_tokens: int, model: Optional[str],
+                        timeout: Optional[float]) -> str:
+        if self._client is None:
+            self._client = self._create_client()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        model = model or self.model
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            with self.metrics.track("llm", model):
+                options = {"timeout": timeout} if timeout is not None else {}
+                response = await self._client.messages.create(
+                    model=model,
+                    max_tokens=max_tokens,
+                    messages=[{"role": "user", "content": content}],
+                    **options
+                )
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        return response_text(response)
+
+    def submit(self, content: Union[str, List[Dict]], max_tokens: int = 128, model: Optional[str] = None,
+               timeout: Optional[float] = None) -> Future:
+        """Schedule a single-message completion on the gateway loop."""
+        return asyncio.run_coroutine_threadsafe(
+            self._complete(content, max_tokens, model, timeout), self._ensure_loop()
+        )
+
+    async def complete(self, content: Union[str, List[Dict]], max_tokens: int = 128, model: Optional[str] = None,
+                       timeout: Optional[float] = None) -> str:
+        """Text of the reply to one user message (a prompt string or content blocks)."""
+        return await asyncio.wrap_future(self.submit(content, max_tokens, model, timeout))
+
+    def complete_sync(self, content: Union[str, List[Dict]], max_tokens: int = 128, model: Optional[str] = None,
+                      timeout: Optional[float] = None) -> str:
+        """Blocking `complete()` for synchronous callers; must not be called on the gateway loop."""
+        return self.submit(content, max_tokens, model, timeout).result()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+        }
+
+    def close(self):
+        """Close the pooled client and stop the gateway loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        if self._client is not None:
+            client, self._client = self._client, None
+            try:
+                asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Error closing LLM client: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway, configured from the environment on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway.from_env()
+        return _gateway
@@ -0,0 +1,128 @@
+"""
+Compact binary mask encodings, as alternatives to shipping masks as PNG.
+
+- RLE (COCO-style, uncompressed counts): `{"size": [h, w], "counts": [...]}`.
+  Runs alternate background/foreground over the mask in column-major order,
+  starting with a (possibly empty) background run.
+- Bit-packed: `{"shape": [h, w], "bits": bytes}`, each row packed with
+  np.packbits and padded to whole bytes.
+
+Area, bbox and IoU are computed on the encoded form without decoding to a
+full mask. Bboxes use PIL's `getbbox` convention: (left, upper, right, lower)
+with exclusive right/lower edges. `decode_mask` and `mask_area` also accept
+PNG bytes so receivers can handle whichever encoding was requested.
+"""
+import io
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Set-bit count of every byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.int64)
+
+Bbox = Optional[Tuple[int, int, int, int]]
+
+def rle_encode(mask: np.ndarray) -> Dict:
+    mask = np.asarray(mask)
+    height, width = mask.shape
+    flat = (mask > 0).ravel(order="F")
+    # Positions where the value changes, plus both ends
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(bounds)
+    if flat.size and flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [height, width], "counts": counts.tolist()}
+
+def rle_decode(rle: Dict) -> np.ndarray:
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(counts.size) % 2 == 1
+    return np.repeat(values, counts).reshape((height, width), order="F")
+
+def _runs(rle: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and (exclusive) end offsets of the foreground runs."""
+    ends = np.cumsum(np.asarray(rle["counts"], dtype=np.int64))
+    starts = np.concatenate(([0], ends[:-1]))
+    return starts[1::2], ends[1::2]
+
+def rle_area(rle: Dict) -> int:
+    return int(np.sum(np.asarray(rle["counts"], dtype=np.int64)[1::2]))
+
+def rle_bbox(rle: Dict) -> Bbox:
+    height = rle["size"][0]
+    starts, ends = _runs(rle)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep] - 1
+    if starts.size == 0:
+        return None
+    # A run that continues into the next column touches both the bottom and top rows
+    single = starts // height == ends // height
+    top = np.where(single, starts % height, 0).min()
+    bottom = np.where(single, ends % height, height - 1).max()
+    return int(starts[0] // height), int(top), int(ends[-1] // height) + 1, int(bottom) + 1
+
+def rle_iou(a: Dict, b: Dict) -> float:
+    if list(a["size"]) != list(b["size"]):
+        raise ValueError("Masks must have the same size")
+    bounds_a = np.cumsum(np.asarray(a["counts"], dtype=np.int64))
+    bounds_b = np.cumsum(np.asarray(b["counts"], dtype=np.int64))
+    points = np.union1d(bounds_a, bounds_b)
+    points = np.concatenate(([0], points[points > 0]))
+    lengths = np.diff(points)
+    # A segment is foreground when an odd number of boundaries precede it
+    in_a = np.searchsorted(bounds_a, points[:-1], side="right") % 2 == 1
+    in_b = np.searchsorted(bounds_b, points[:-1], side="right") % 2 == 1
+    intersection = int(lengths[in_a & in_b].sum())
+    union = rle_area(a) + rle_area(b) - intersection
+    return intersection / union if union else 0.0
+
+def pack_mask(mask: np.ndarray) -> Dict:
+    mask = np.asarray(mask) > 0
+    return {"shape": list(mask.shape), "bits": np.packbits(mask, axis=1).tobytes()}
+
+def _packed_rows(packed: Dict) -> np.ndarray:
+    height, width = packed["shape"]
+    return np.frombuffer(packed["bits"], dtype=np.uint8).reshape(height, (width + 7) // 8)
+
+def unpack_mask(packed: Dict) -> np.ndarray:
+    width = packed["shape"][1]
+    return np.unpackbits(_packed_rows(packed), axis=1, count=width).astype(bool)
+
+def packed_area(packed: Dict) -> int:
+    return int(_POPCOUNT[_packed_rows(packed)].sum())
+
+def packed_bbox(packed: Dict) -> Bbox:
+    rows = _packed_rows(packed)
+    filled = np.flatnonzero(rows.any(axis=1))
+    if filled.size == 0:
+        return None
+    columns = np.flatnonzero(np.unpackbits(np.bitwise_or.reduce(rows, axis=0), count=packed["shape"][1]))
+    return int(columns[0]), int(filled[0]), int(columns[-1]) + 1, int(filled[-1]) + 1
+
+def packed_iou(a: Dict, b: Dict) -> float:
+    if list(a["shape"]) != list(b["shape"]):
+        raise ValueError("Masks must have the same size")
+    rows_a, rows_b = _packed_rows(a), _packed_rows(b)
+    intersection = int(_POPCOUNT[rows_a & rows_b].sum())
+    union = int(_POPCOUNT[rows_a | rows_b].sum())
+    return intersection / union if union else 0.0
+
+def decode_mask(value) -> np.ndarray:
+    """Boolean mask from an RLE dict, a bit-packed dict, PNG bytes or an array."""
+    if isinstance(value, dict):
+        return rle_decode(value) if "counts" in value else unpack_mask(value)
+    if isinstance(value, (bytes, bytearray)):
+        from PIL import Image
+        return np.asarray(Image.open(io.BytesIO(value))) > 0
+    return np.asarray(value) > 0
+
+def mask_area(value) -> int:
+    if isinstance(value, dict):
+        return rle_area(value) if "counts" in value else packed_area(value)
+    return int(np.count_nonzero(decode_mask(value)))
+
+def mask_shape(value) -> List[int]:
+    if isinstance(value, dict):
+        return list(value.get("size") or value["shape"])
+    return list(decode_mask(value).shape)
@@ -1,20 +1,616 @@
+"""
+Local MCP-style transport used by the servers in this repo.
+
+`App` serves registered request handlers over a pair of byte streams (by
+default the process's stdin/stdout pipes). Messages are length-prefixed
+binary frames (see wire.py), so image bytes and arrays travel unencoded:
+
+    request:  {"id": 7, "method": "segment", "params": {...}}
+    response: {"id": 7, "result": ...}
+              {"id": 7, "error": {"type": "ValueError", "message": "..."}}
+
+Each request is dispatched as its own task, so responses are sent as soon as
+they are ready and may arrive out of order; the `id` ties them to their
+request. Every handler has a bounded number of requests in flight
+(`max_in_flight`); further requests wait for a slot without holding up
+other handlers. Handlers that are async generators stream their results as
+`{"id", "chunk"}` messages followed by `{"id", "done": true}`.
+
+Handlers can opt into two load-shedding behaviours at registration:
+- `coalesce=True`: identical requests (same method and params) that arrive
+  while one is already running share that execution and its result
+  (singleflight). Callers must treat shared results as read-only.
+- `batch_size=N`: the handler takes a list of params and returns a list of
+  results; requests arriving within `batch_wait` seconds of each other are
+  gathered into one call of up to N (see batching.py).
+
+`Client` is the matching caller: `request()` returns one result, `stream()`
+iterates over a streamed one, and `Client.spawn()` starts a server
+subprocess and talks to it over its pipes. Each Client keeps throughput and
+latency statistics for its connection.
+
+With MCP_SOCKET_DIR set, `App.run` listens on the Unix socket
+`<dir>/<app name>.sock` instead of stdin/stdout and accepts any number of
+connections; handler in-flight limits are shared by all of them.
+`PooledClient` connects to such a socket with a small pool of persistent
+connections and multiplexes concurrent requests over them, choosing the
+least-loaded connection and opening another (up to `pool_size`) only when
+all are busy. `LocalClient` offers the same
+interface for an App in the same process (see in_process.py): handlers are
+called directly through `App.call`, with no framing, so arguments and
+results (including NumPy arrays) are passed by reference.
+
+Every App answers a built-in `metrics` request with the latency histograms,
+in-flight gauges and error counts of its handlers (see metrics.py), as a
+JSON-style dict or, with {"format": "prometheus"}, as exposition text.
+"""
 import asyncio
+import hashlib
+import inspect
+import itertools
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+
+import metrics
+import wire
+from batching import DynamicBatcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+class RemoteError(Exception):
+    """A handler on the other side of the connection raised an exception."""
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+        self.message = message
+
+class Connection:
+    """Frame writer shared by the tasks answering requests on one stream."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self._lock = asyncio.Lock()
+
+    async def send(self, message: Dict) -> int:
+        """Write one message; returns the frame size in bytes."""
+        frame = wire.encode(message)
+        async with self._lock:
+            self.writer.write(frame)
+            await self.writer.drain()
+        return len(frame)
+
+    @property
+    def closed(self) -> bool:
+        return self.writer.is_closing()
+
+    def close(self):
+        self.writer.close()
+
+def socket_path(name: str, socket_dir: Optional[str] = None) -> str:
+    """Unix socket path for the app called `name`."""
+    return os.path.join(socket_dir or os.environ.get("MCP_SOCKET_DIR", "/tmp"), f"{name}.sock")
+
+class ConnectionStats:
+    """Request counts, bytes, throughput and latency percentiles for one connection."""
+
+    def __init__(self, window: int = 512):
+        self.opened = time.monotonic()
+        self.requests = 0
+        self.completed = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        # Latencies (ms) of the most recent requests
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.opened, 1e-9)
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else 0.0
+
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "requests_per_s": self.completed / elapsed,
+            "bytes_per_s": (self.bytes_sent + self.bytes_received) / elapsed,
+            "latency_ms_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_max": latencies[-1] if latencies else 0.0,
+        }
+
+def _feed_key(digest, value):
+    if isinstance(value, dict):
+        digest.update(b"m%d" % len(value))
+        for key in sorted(value, key=repr):
+            _feed_key(digest, key)
+            _feed_key(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(b"l%d" % len(value))
+        for item in value:
+            _feed_key(digest, item)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(b"b%d:" % len(value))
+        digest.update(value)
+    elif isinstance(value, np.ndarray):
+        digest.update(f"a{value.dtype.str}{value.shape}:".encode())
+        digest.update(np.ascontiguousarray(value).data)
+    else:
+        digest.update(f"{type(value).__name__}:{value!r};".encode())
+
+def request_key(request_name: str, params: Any) -> str:
+    """Digest identifying a request by method and content (dict order ignored)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(request_name.encode())
+    _feed_key(digest, params)
+    return digest.hexdigest()
+
+async def open_stdio(stdin, stdout):
+    """Asyncio streams over binary pipe file objects such as sys.stdin.buffer."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stdin)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, stdout)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return reader, writer
 
 class App:
-    def __init__(self, name):
+    def __init__(self, name, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_pending: int = 256,
+                 registry: Optional[metrics.MetricsRegistry] = None):
         self.name = name
+        # Per-handler latency, in-flight and error metrics (the process-wide registry by default)
+        self.metrics = registry or metrics.REGISTRY
+        self.max_in_flight = max_in_flight
+        # Requests read but not yet answered, per connection; reading pauses beyond this
+        self.max_pending = max_pending
         self._handlers = {}
+        self._limits: Dict[str, int] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._coalesced_handlers = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        # Callers still waiting on each shared (coalesced) execution
+        self._callers: Dict[asyncio.Task, int] = {}
+        self.batchers: Dict[str, DynamicBatcher] = {}
+        self.coalesced: Dict[str, int] = {}
+        self.register_request("metrics", self.metrics_report)
 
-    def register_request(self, request_name, handler):
+    def register_request(self, request_name, handler, max_in_flight: Optional[int] = None,
+                         coalesce: bool = False, batch_size: Optional[int] = None, batch_wait: float = 0.005):
+        if (coalesce or batch_size) and inspect.isasyncgenfunction(handler):
+            raise ValueError("Streaming handlers cannot be coalesced or batched")
         self._handlers[request_name] = handler
+        self._limits[request_name] = max_in_flight or self.max_in_flight
+        if coalesce:
+            self._coalesced_handlers.add(request_name)
+            self.coalesced[request_name] = 0
+        if batch_size:
+            self.batchers[request_name] = DynamicBatcher(
+                lambda items, name=request_name: self._run_batch(name, items),
+                max_batch_size=batch_size, max_wait=batch_wait
+            )
+
+    def stats(self) -> Dict[str, Dict]:
+        """Coalescing and batching counters per handler."""
+        return {
+            "coalesced": dict(self.coalesced),
+            "batches": {name: batcher.stats() for name, batcher in self.batchers.items()},
+        }
+
+    async def metrics_report(self, request: Dict) -> Any:
+        """The `metrics` request: {"format": "json" | "prometheus", "profiles": bool}."""
+        if request.get("format") == "prometheus":
+            return self.metrics.to_prometheus()
+        return self.metrics.to_dict(include_profiles=bool(request.get("profiles")))
 
     def create_initialization_options(self):
         return {}
 
+    def _semaphore(self, request_name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(request_name)
+        if semaphore is None:
+            semaphore = self._semaphores[request_name] = asyncio.Semaphore(self._limits[request_name])
+        return semaphore
+
+    def _handler(self, request_name: str) -> Callable:
+        handler = self._handlers.get(request_name)
+        if handler is None:
+            raise ValueError(f"Unknown request '{request_name}' for app '{self.name}'")
+        return handler
+
+    @staticmethod
+    async def _limited_stream(stream, semaphore: asyncio.Semaphore):
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            semaphore.release()
+
+    async def _run_batch(self, request_name: str, items: List[Dict]) -> List[Any]:
+        async with self._semaphore(request_name):
+            results = self._handlers[request_name](items)
+            if inspect.isawaitable(results):
+                results = await results
+        if len(results) != len(items):
+            raise RuntimeError(f"Batch handler '{request_name}' returned {len(results)} results for {len(items)} requests")
+        return results
+
+    @staticmethod
+    async def _tracked_stream(stream, span: metrics.Span):
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception:
+            span.finish(failed=True)
+            raise
+        finally:
+            span.finish()
+
+    async def call(self, request_name: str, params: Dict) -> Any:
+        """
+        Run a handler within its in-flight limit and return its result. For
+        streaming handlers the (limited) async generator is returned; the slot
+        is held until it is exhausted or closed. Coalesced handlers share the
+        result of an identical request already running. Every call is timed
+        in `self.metrics` under (app name, request name), streams until their
+        last chunk.
+        """
+        self._handler(request_name)  # unknown requests are not recorded
+        span = self.metrics.start(self.name, request_name)
+        try:
+            result = await self._call(request_name, params)
+        except Exception:
+            span.finish(failed=True)
+            raise
+        except BaseException:
+            span.finish()
+            raise
+        if inspect.isasyncgen(result):
+            return self._tracked_stream(result, span)
+        span.finish()
+        return result
+
+    async def _call(self, request_name: str, params: Dict) -> Any:
+        if request_name not in self._coalesced_handlers:
+            return await self._execute(request_name, params)
+        key = request_key(request_name, params)
+        # The shared execution is its own task: a caller that is cancelled
+        # (e.g. its connection closed) leaves it running for the others
+        task = self._running.get(key)
+        if task is None:
+            task = asyncio.create_task(self._execute(request_name, params))
+            self._running[key] = task
+            self._callers[task] = 0
+            task.add_done_callback(lambda t, key=key: self._shared_done(key, t))
+        else:
+            self.coalesced[request_name] += 1
+        self._callers[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+                if not task.done():
+                    task.cancel()  # nobody is left waiting for it
+
+    def _shared_done(self, key: str, task: asyncio.Task):
+        if self._running.get(key) is task:
+            del self._running[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here even if every caller was cancelled
+
+    async def _execute(self, request_name: str, params: Dict) -> Any:
+        handler = self._handler(request_name)
+        batcher = self.batchers.get(request_name)
+        if batcher is not None:
+            return await batcher.submit(params)
+        semaphore = self._semaphore(request_name)
+        await semaphore.acquire()
+        try:
+            result = handler(params)
+            if inspect.isasyncgen(result):
+                stream, semaphore = self._limited_stream(result, semaphore), None
+                return stream
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    async def _respond(self, connection: Connection, message: Dict):
+        request_id = message.get("id")
+        method = message.get("method")
+        try:
+            result = await self.call(method, message.get("params") or {})
+            if inspect.isasyncgen(result):
+                async for chunk in result:
+                    await connection.send({"id": request_id, "chunk": chunk})
+                await connection.send({"id": request_id, "done": True})
+                return
+            await connection.send({"id": request_id, "result": result})
+        except ConnectionError:
+            raise
+        except Exception as e:
+            logger.error(f"Request '{method}' failed: {e}")
+            try:
+                await connection.send({"id": request_id, "error": {"type": type(e).__name__, "message": str(e)}})
+            except ConnectionError:
+                pass
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer requests arriving on `reader` until the stream ends."""
+        connection = Connection(writer)
+        pending = asyncio.Semaphore(self.max_pending)
+        tasks = set()
+
+        def finished(task: asyncio.Task):
+            tasks.discard(task)
+            pending.release()
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Lost response: {task.exception()}")
+
+        try:
+            while True:
+                try:
+                    message = await wire.read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                await pending.acquire()
+                task = asyncio.create_task(self._respond(connection, message))
+                tasks.add(task)
+                task.add_done_callback(finished)
+            # Let requests already read finish and send their responses
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            connection.close()
+
+    async def serve_stdio(self, stdin, stdout):
+        reader, writer = await open_stdio(stdin, stdout)
+        await self.serve(reader, writer)
+
+    async def start_unix_server(self, path: str) -> asyncio.AbstractServer:
+        """Listen on a Unix socket; every accepted connection is served concurrently."""
+        if os.path.exists(path):
+            os.unlink(path)  # left behind by a previous run
+        return await asyncio.start_unix_server(self.serve, path)
+
+    async def serve_unix(self, path: str):
+        server = await self.start_unix_server(path)
+        logger.info(f"[MCP] App '{self.name}' listening on {path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
     def run(self, stdin=None, stdout=None, init_options=None):
-        print(f"[MCP] Starting app '{self.name}' with handlers: {list(self._handlers.keys())}")
-        # Minimal event loop to keep the server alive
+        """
+        Serve requests over `stdin`/`stdout` (the process's own pipes by
+        default), or on a Unix socket when MCP_SOCKET_DIR is set.
+        """
+        logger.info(f"[MCP] Starting app '{self.name}' with handlers: {list(self._handlers.keys())}")
         try:
-            asyncio.get_event_loop().run_forever()
+            if os.environ.get("MCP_SOCKET_DIR"):
+                asyncio.run(self.serve_unix(socket_path(self.name)))
+            else:
+                asyncio.run(self.serve_stdio(stdin or sys.stdin.buffer, stdout or sys.stdout.buffer))
         except KeyboardInterrupt:
-            print("[MCP] App stopped.")
+            pass
+        logger.info(f"[MCP] App '{self.name}' stopped.")
+
+class Client:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, name: str = "client"):
+        self.name = name
+        self.reader = reader
+        self.connection = Connection(writer)
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._ids = itertools.count(1)
+        self._responses: Dict[int, asyncio.Queue] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self.stats = ConnectionStats()
+
+    @property
+    def closed(self) -> bool:
+        return self.connection.closed or (self._reader_task is not None and self._reader_task.done())
+
+    @classmethod
+    async def spawn(cls, *args, name: Optional[str] = None, **kwargs) -> "Client":
+        """Start a server process (e.g. `sys.executable, "segmentation_server.py"`) and connect to it."""
+        process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, **kwargs
+        )
+        client = cls(process.stdout, process.stdin, name or str(args[-1]))
+        client.process = process
+        return client
+
+    async def _read_responses(self):
+        try:
+            while True:
+                payload, codec = await wire.read_frame(self.reader)
+                self.stats.bytes_received += len(payload) + wire.HEADER.size
+                message = wire.decode(payload, codec)
+                if not isinstance(message, dict):
+                    raise wire.FrameError(f"Expected a message dict, got {type(message).__name__}")
+                queue = self._responses.get(message.get("id"))
+                if queue is not None:
+                    queue.put_nowait(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            error = ConnectionError(f"Connection to '{self.name}' closed")
+        except Exception as e:
+            # Undecodable stream: the framing can no longer be trusted
+            logger.error(f"Dropping connection to '{self.name}': {e}")
+            error = ConnectionError(f"Connection to '{self.name}' failed: {e}")
+            self.connection.close()
+        for queue in self._responses.values():
+            queue.put_nowait({"connection_error": error})
+
+    async def _send(self, method: str, params: Optional[Dict]) -> int:
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_responses())
+        elif self._reader_task.done():
+            raise ConnectionError(f"Connection to '{self.name}' closed")
+        request_id = next(self._ids)
+        self._responses[request_id] = asyncio.Queue()
+        self.stats.requests += 1
+        self.stats.bytes_sent += await self.connection.send({"id": request_id, "method": method, "params": params or {}})
+        return request_id
+
+    def _finish(self, request_id: int, started: float, failed: bool):
+        self._responses.pop(request_id, None)
+        self.stats.in_flight -= 1
+        if failed:
+            self.stats.errors += 1
+        else:
+            self.stats.completed += 1
+            self.stats.latencies.append((time.perf_counter() - started) * 1000)
+
+    @staticmethod
+    def _check(message: Dict):
+        if "connection_error" in message:
+            raise message["connection_error"]
+        if "error" in message:
+            raise RemoteError(message["error"]["type"], message["error"]["message"])
+
+    async def request(self, method: str, params: Optional[Dict] = None) -> Any:
+        """Send a request and wait for its result (a streamed result is collected into a list)."""
+        started = time.perf_counter()
+        self.stats.in_flight += 1
+        request_id, failed = None, True
+        try:
+            request_id = await self._send(method, params)
+            queue = self._responses[request_id]
+            chunks = []
+            while True:
+                message = await queue.get()
+                self._check(message)
+                if "chunk" in message:
+                    chunks.append(message["chunk"])
+                    continue
+                failed = False
+                return chunks if message.get("done") else message.get("result")
+        finally:
+            self._finish(request_id, started, failed)
+
+    async def stream(self, method: str, params: Optional[Dict] = None) -> AsyncIterator[Any]:
+        """Send a request and yield its streamed chunks as they arrive."""
+        started = time.perf_counter()
+        self.stats.in_flight += 1
+        request_id, failed = None, True
+        try:
+            request_id = await self._send(method, params)
+            queue = self._responses[request_id]
+            while True:
+                message = await queue.get()
+                self._check(message)
+                if "chunk" in message:
+                    yield message["chunk"]
+                    continue
+                failed = False
+                if not message.get("done"):
+                    yield message.get("result")
+                return
+        finally:
+            self._finish(request_id, started, failed)
+
+    async def close(self):
+        self.connection.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self.process is not None:
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+
+class PooledClient:
+    """Client for an App on a Unix socket, multiplexing requests over pooled connections."""
+
+    def __init__(self, path: str, pool_size: int = 2, name: Optional[str] = None):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.path = path
+        self.pool_size = pool_size
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self.connections: List[Client] = []
+        self._opened = 0
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    async def _connection(self) -> Client:
+        self.connections = [c for c in self.connections if not c.closed]
+        least_loaded = min(self.connections, key=lambda c: c.stats.in_flight, default=None)
+        if least_loaded is not None and (least_loaded.stats.in_flight == 0
+                                         or len(self.connections) >= self.pool_size):
+            return least_loaded
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if len(self.connections) >= self.pool_size:
+                return min(self.connections, key=lambda c: c.stats.in_flight)
+            reader, writer = await asyncio.open_unix_connection(self.path)
+            self._opened += 1
+            client = Client(reader, writer, f"{self.name}#{self._opened}")
+            self.connections.append(client)
+            return client
+
+    async def request(self, method: str, params: Optional[Dict] = None) -> Any:
+        client = await self._connection()
+        return await client.request(method, params)
+
+    async def stream(self, method: str, params: Optional[Dict] = None) -> AsyncIterator[Any]:
+        client = await self._connection()
+        async for chunk in client.stream(method, params):
+            yield chunk
+
+    def stats(self) -> List[Dict]:
+        """Per-connection throughput and latency statistics."""
+        return [{"connection": c.name, "closed": c.closed, **c.stats.snapshot()} for c in self.connections]
+
+    async def close(self):
+        for client in self.connections:
+            await client.close()
+        self.connections = []
+
+class LocalClient:
+    """Client interface over an App in the same process; no serialization."""
+
+    def __init__(self, app: App):
+        self.app = app
+        self.name = app.name
+
+    async def request(self, method: str, params: Optional[Dict] = None) -> Any:
+        result = await self.app.call(method, params or {})
+        if inspect.isasyncgen(result):
+            return [chunk async for chunk in result]
+        return result
+
+    async def stream(self, method: str, params: Optional[Dict] = None) -> AsyncIterator[Any]:
+        result = await self.app.call(method, params or {})
+        if inspect.isasyncgen(result):
+            async for chunk in result:
+                yield chunk
+        else:
+            yield result
+
+    async def close(self):
+        pass
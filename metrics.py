@@ -0,0 +1,241 @@
+"""
+Latency instrumentation for App handlers and coordinator stages.
+
+`MetricsRegistry.track(component, operation)` is a context manager that
+times one request and updates, per (component, operation):
+- a latency histogram (fixed millisecond buckets, plus sum and count),
+- an in-flight gauge,
+- request and error counters.
+Requests whose lifetime is not one block (streamed responses) use
+`start()` and finish the returned span themselves.
+`to_json()` returns a snapshot with approximate p50/p95/p99 latencies, and
+`to_prometheus()` renders the text exposition format (durations in seconds).
+
+Slow-request profiling: with `slow_threshold_ms` set (SLOW_REQUEST_MS for
+the shared `REGISTRY`), a sampling thread records the stacks of all threads
+every `sample_interval` seconds while any tracked request is in flight. When
+a request exceeds the threshold, the samples taken during it are folded into
+"frame;frame;frame count" lines and kept in `slow_profiles` (the most recent
+`max_profiles`), ready for flame-graph tools.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf overflow bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest finite bound if beyond)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return float(self.buckets[-1])
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total, out = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+class OperationMetrics:
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+class StackSampler:
+    """Background thread sampling every thread's stack while requests are in flight."""
+
+    def __init__(self, interval: float = 0.005, max_samples: int = 20000):
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self):
+        with self._lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._wake.set()
+
+    def end(self):
+        with self._lock:
+            self._active -= 1
+            if self._active == 0:
+                self._wake.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = ";".join(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})"
+                                 for f in traceback.extract_stack(frame))
+                self.samples.append((now, f"{names.get(ident, ident)};{stack}"))
+            time.sleep(self.interval)
+
+    def folded(self, start: float, end: float) -> Dict[str, int]:
+        """Folded stack counts of the samples taken between `start` and `end`."""
+        return dict(Counter(stack for taken, stack in list(self.samples) if start <= taken <= end))
+
+class Span:
+    """One in-flight request; created by `MetricsRegistry.start`."""
+
+    def __init__(self, registry: "MetricsRegistry", metrics: OperationMetrics, component: str, operation: str):
+        self.registry = registry
+        self.metrics = metrics
+        self.component = component
+        self.operation = operation
+        self.finished = False
+        metrics.in_flight += 1
+        metrics.requests += 1
+        self.sampler = registry.sampler
+        if self.sampler is not None:
+            self.sampler.begin()
+        self.started = time.perf_counter()
+
+    def finish(self, failed: bool = False):
+        if self.finished:
+            return
+        self.finished = True
+        end = time.perf_counter()
+        elapsed_ms = (end - self.started) * 1000
+        self.metrics.in_flight -= 1
+        self.metrics.latency.observe(elapsed_ms)
+        if failed:
+            self.metrics.errors += 1
+        if self.sampler is not None:
+            self.sampler.end()
+            if elapsed_ms >= self.registry.slow_threshold_ms:
+                self.registry.slow_profiles.append({
+                    "component": self.component,
+                    "operation": self.operation,
+                    "duration_ms": round(elapsed_ms, 3),
+                    "at": time.time(),
+                    "stacks": self.sampler.folded(self.started, end),
+                })
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS, slow_threshold_ms: Optional[float] = None,
+                 sample_interval: float = 0.005, max_profiles: int = 20):
+        self.buckets = tuple(buckets)
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sampler = StackSampler(sample_interval) if slow_threshold_ms is not None else None
+        self.slow_profiles = deque(maxlen=max_profiles)
+        self._operations: Dict[Tuple[str, str], OperationMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _operation(self, component: str, operation: str) -> OperationMetrics:
+        key = (component, operation)
+        metrics = self._operations.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._operations.setdefault(key, OperationMetrics(self.buckets))
+        return metrics
+
+    def start(self, component: str, operation: str) -> "Span":
+        """Begin timing one request; call `finish()` on the returned span when it ends."""
+        return Span(self, self._operation(component, operation), component, operation)
+
+    @contextmanager
+    def track(self, component: str, operation: str):
+        """Time the enclosed block as one request of `component`/`operation`."""
+        span = self.start(component, operation)
+        try:
+            yield span
+        except Exception:
+            span.finish(failed=True)
+            raise
+        except BaseException:  # cancelled: timed, but not an error
+            span.finish()
+            raise
+        span.finish()
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict]]:
+        out: Dict[str, Dict[str, Dict]] = {}
+        for (component, operation), metrics in sorted(self._operations.items()):
+            latency = metrics.latency
+            out.setdefault(component, {})[operation] = {
+                "requests": metrics.requests,
+                "errors": metrics.errors,
+                "in_flight": metrics.in_flight,
+                "latency_ms_avg": latency.sum / latency.count if latency.count else 0.0,
+                "latency_ms_p50": latency.quantile(0.5),
+                "latency_ms_p95": latency.quantile(0.95),
+                "latency_ms_p99": latency.quantile(0.99),
+                "buckets": {("+Inf" if bound == float("inf") else str(bound)): count
+                            for bound, count in latency.cumulative()},
+            }
+        return out
+
+    def to_dict(self, include_profiles: bool = False) -> Dict:
+        data = {"operations": self.snapshot()}
+        if include_profiles:
+            data["slow_profiles"] = list(self.slow_profiles)
+        return data
+
+    def to_json(self, include_profiles: bool = False) -> str:
+        return json.dumps(self.to_dict(include_profiles))
+
+    def to_prometheus(self, prefix: str = "triage") -> str:
+        lines = [
+            f"# HELP {prefix}_request_duration_seconds Request latency.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        gauges, requests, errors = [], [], []
+        for (component, operation), metrics in sorted(self._operations.items()):
+            labels = f'component="{component}",operation="{operation}"'
+            for bound, count in metrics.latency.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound / 1000)
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{labels}}} {metrics.latency.sum / 1000}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{labels}}} {metrics.latency.count}")
+            gauges.append(f"{prefix}_requests_in_flight{{{labels}}} {metrics.in_flight}")
+            requests.append(f"{prefix}_requests_total{{{labels}}} {metrics.requests}")
+            errors.append(f"{prefix}_request_errors_total{{{labels}}} {metrics.errors}")
+        lines += [f"# TYPE {prefix}_requests_in_flight gauge"] + gauges
+        lines += [f"# TYPE {prefix}_requests_total counter"] + requests
+        lines += [f"# TYPE {prefix}_request_errors_total counter"] + errors
+        return "\n".join(lines) + "\n"
+
+def _threshold_from_env() -> Optional[float]:
+    value = os.environ.get("SLOW_REQUEST_MS")
+    return float(value) if value else None
+
+# Shared by every App and Coordinator in the process unless one is given its own
+REGISTRY = MetricsRegistry(slow_threshold_ms=_threshold_from_env())
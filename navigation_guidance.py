@@ -0,0 +1,159 @@
+"""
+Pre-generated navigation guidance for the navigation server.
+
+The generic navigation prompt (`prompts.create_navigation_prompt`) depends
+only on the target organ (and optionally the organ currently imaged), not
+on the frame, so its answer is generated ahead of time instead of on every
+frame that misses the target. `GuidanceStore` asks the LLM gateway for the
+guidance of each organ in `organs` when it starts, keeps the answers in
+memory and regenerates them every `refresh_interval` seconds on a background
+thread. `get()` returns stored guidance instantly; `guidance()` does the same
+and, for an organ pair not generated yet, makes one live call (shared by
+concurrent callers) whose answer is then stored and refreshed like the rest.
+Those live pairs are kept in LRU order and capped at `max_pairs`; the least
+recently requested pair beyond the cap is dropped along with its guidance,
+while the configured `organs` are always kept.
+
+A refresh that fails keeps the previous guidance.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+
+from llm_gateway import LLMGateway, get_gateway
+from prompts import create_navigation_prompt
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORGANS = ("liver", "kidney", "spleen", "heart", "bladder")
+
+GuidanceKey = Tuple[str, Optional[str]]
+
+class GuidanceStore:
+    def __init__(self, llm: Optional[LLMGateway] = None, organs: Iterable[str] = DEFAULT_ORGANS,
+                 refresh_interval: Optional[float] = 3600.0, max_tokens: int = 128,
+                 max_pairs: int = 64):
+        self.llm = llm or get_gateway()
+        self.refresh_interval = refresh_interval
+        self.max_tokens = max_tokens
+        # (target organ, current organ) -> (guidance, generated at)
+        self._entries: Dict[GuidanceKey, Tuple[str, float]] = {}
+        self._organs = {self._key(organ) for organ in organs}
+        # Pairs first requested through guidance(), least recently requested first
+        self._requested: "OrderedDict[GuidanceKey, None]" = OrderedDict()
+        self.max_pairs = max_pairs
+        self._pending: Dict[GuidanceKey, Future] = {}
+        # Reentrant: a generation that is already done runs _finished inside _generate
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+
+    @staticmethod
+    def _key(target_organ: str, current_organ: Optional[str] = None) -> GuidanceKey:
+        return target_organ.strip().lower(), current_organ.strip().lower() if current_organ else None
+
+    def _generate(self, key: GuidanceKey) -> Future:
+        """Start (or join) generation of the guidance for `key`."""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self.llm.submit(create_navigation_prompt(*key), max_tokens=self.max_tokens)
+                self._pending[key] = future
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+            return future
+
+    def _finished(self, key: GuidanceKey, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+                error = "cancelled" if future.cancelled() else future.exception()
+                logger.warning(f"Could not generate navigation guidance for {key[0]}: {error}")
+                return
+            if key not in self._organs and key not in self._requested:
+                return  # dropped from the LRU while it was being generated
+            self._entries[key] = (future.result(), time.time())
+            self.generated += 1
+
+    def refresh(self):
+        """Regenerate the guidance for every known organ pair; blocks until done."""
+        with self._lock:
+            keys = list(self._organs) + [key for key in self._requested if key not in self._organs]
+        futures = [self._generate(key) for key in keys]
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # logged in _finished; the previous guidance stays
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            if not self.refresh_interval:
+                return
+            self._stop.wait(self.refresh_interval)
+
+    def start(self):
+        """Generate the guidance in the background now and then every `refresh_interval`."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="guidance-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop refreshing; waits up to `timeout` seconds for a refresh in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning("Navigation guidance refresh still running after stop()")
+            self._thread = None
+
+    def get(self, target_organ: str, current_organ: Optional[str] = None) -> Optional[str]:
+        """Stored guidance, or None if it has not been generated yet."""
+        entry = self._entries.get(self._key(target_organ, current_organ))
+        return entry[0] if entry is not None else None
+
+    async def guidance(self, target_organ: str, current_organ: Optional[str] = None) -> str:
+        """Stored guidance, generated live (and kept from then on) if missing."""
+        key = self._key(target_organ, current_organ)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._touch(key)
+            return entry[0]
+        self.misses += 1
+        self._touch(key)
+        return await asyncio.wrap_future(self._generate(key))
+
+    def _touch(self, key: GuidanceKey):
+        """Mark a requested pair as recently used, dropping the least recent beyond `max_pairs`."""
+        if key in self._organs:
+            return
+        with self._lock:
+            self._requested[key] = None
+            self._requested.move_to_end(key)
+            while len(self._requested) > self.max_pairs:
+                dropped, _ = self._requested.popitem(last=False)
+                self._entries.pop(dropped, None)
+
+    def stats(self) -> Dict[str, float]:
+        now = time.time()
+        ages = [now - generated_at for _, generated_at in self._entries.values()]
+        return {
+            "organs": len(self._organs | self._requested.keys()),
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "failures": self.failures,
+            "oldest_s": max(ages) if ages else 0.0,
+        }
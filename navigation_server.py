@@ -1,7 +1,15 @@
 """
 Navigation Agent MCP server for ultrasound guidance.
 Given an ultrasound image and target organ, determines if the organ is present.
-If not, uses Claude LLM to generate step-by-step navigation instructions.
+If not, returns step-by-step navigation instructions for the organ from the
+guidance store (navigation_guidance.py), which generates them with Claude
+when the server starts and refreshes them in the background. Requests with
+`image_guidance: true` instead get a live Claude call that sees the current
+frame. An optional `current_organ` tailors the instructions to the organ
+being imaged.
+
+Settings: NAVIGATION_ORGANS (comma-separated organs generated at startup)
+and NAVIGATION_REFRESH (seconds between refreshes, 0 = never).
 """
 import os
 from dotenv import load_dotenv
@@ -11,46 +19,58 @@ import asyncio
 import base64
 import logging
 import sys
-from typing import Dict
+from typing import Dict, Optional
 
+from llm_gateway import LLMGateway, get_gateway
 from mcp_local import App
+from navigation_guidance import DEFAULT_ORGANS, GuidanceStore
 from PIL import Image
 import io
-import httpx
-import anthropic
 
 # Import classification logic and prompt engineering
 sys.path.append(os.path.join(os.path.dirname(__file__), 'sam'))
-from classification import identify_entity_in_image
+from classification import identification_cache, identify_entity_in_image_async
 from prompts import create_navigation_prompt
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Real Claude API call using Anthropic SDK
-async def call_claude_llm(prompt: str) -> str:
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise RuntimeError("ANTHROPIC_API_KEY is not set in your environment or .env file!")
-    client = anthropic.AsyncAnthropic(api_key=api_key)
-    response = await client.messages.create(
-        model="claude-3-7-sonnet-20250219",
-        max_tokens=128,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    # The SDK returns message.content as a list of dicts, join if needed
-    if isinstance(response.content, list):
-        return " ".join([c["text"] if isinstance(c, dict) and "text" in c else str(c) for c in response.content])
-    return str(response.content)
+# Claude call through the shared, pooled gateway (see llm_gateway.py)
+async def call_claude_llm(prompt, llm: Optional[LLMGateway] = None) -> str:
+    return await (llm or get_gateway()).complete(prompt, max_tokens=128)
+
+def image_guidance_content(image_bytes: bytes, media_type: str, target_organ: str,
+                           current_organ: Optional[str] = None) -> list:
+    """Message content asking for navigation guidance conditioned on the current frame."""
+    return [
+        {
+            "type": "image",
+            "source": {"type": "base64", "media_type": media_type,
+                       "data": base64.b64encode(image_bytes).decode("utf-8")}
+        },
+        {
+            "type": "text",
+            "text": create_navigation_prompt(target_organ, current_organ)
+                    + "\nBase the next step on the attached current ultrasound frame."
+        },
+    ]
 
 class NavigationServer:
-    def __init__(self):
+    def __init__(self, llm: Optional[LLMGateway] = None, organs=None, refresh_interval: Optional[float] = None):
         self.app = App("navigation")
+        self.llm = llm or get_gateway()
+        if organs is None:
+            organs = os.environ.get("NAVIGATION_ORGANS", ",".join(DEFAULT_ORGANS)).split(",")
+        if refresh_interval is None:
+            refresh_interval = float(os.environ.get("NAVIGATION_REFRESH", "3600"))
+        self.guidance = GuidanceStore(self.llm, organs=[o for o in organs if o.strip()],
+                                      refresh_interval=refresh_interval)
 
     async def navigate(self, request: Dict) -> Dict:
         """
         Given a base64 image and target organ, determines if the organ is present.
-        If not, generates navigation instructions using Claude.
+        If not, returns stored navigation instructions, or live image-conditioned
+        ones from Claude when `image_guidance` is set.
         """
         image_b64 = request.get("image")
         target_organ = request.get("target_organ")
@@ -58,29 +78,56 @@ class NavigationServer:
             return {"error": "Missing image or target_organ in request."}
         # Decode image
         image_bytes = base64.b64decode(image_b64)
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        image = Image.open(io.BytesIO(image_bytes))
+        media_type = Image.MIME.get(image.format, "image/png")
+        image = image.convert("RGB")
         # Use classification logic
-        found = identify_entity_in_image(image, target_organ)
+        found = await identify_entity_in_image_async(image, target_organ, llm=self.llm)
         if found:
             return {
                 "found": True,
                 "message": f"The {target_organ} is visible in the scan. Proceed with evaluation."
             }
-        # If not found, generate navigation instructions
-        navigation_prompt = create_navigation_prompt(target_organ)
-        instructions = await call_claude_llm(navigation_prompt)
+        current_organ = request.get("current_organ")
+        if request.get("image_guidance"):
+            content = image_guidance_content(image_bytes, media_type, target_organ, current_organ)
+            instructions = await call_claude_llm(content, llm=self.llm)
+        else:
+            instructions = await self.guidance.guidance(target_organ, current_organ)
         return {
             "found": False,
             "message": instructions
         }
 
+    async def stats(self, request: Dict) -> Dict:
+        return {
+            "identification_cache": identification_cache.stats(),
+            "guidance": self.guidance.stats(),
+        }
+
+    def register_handlers(self):
+        self.app.register_request("navigate", self.navigate, coalesce=True)
+        self.app.register_request("stats", self.stats)
+
+    def start(self):
+        """Pre-generate guidance in the background while the server starts taking requests."""
+        self.guidance.start()
+
+    def close(self):
+        self.guidance.stop()
+        identification_cache.flush()
+
     def run(self):
-        self.app.register_request("navigate", self.navigate)
-        self.app.run(
-            os.sys.stdin.buffer,
-            os.sys.stdout.buffer,
-            self.app.create_initialization_options()
-        )
+        self.register_handlers()
+        self.start()
+        try:
+            self.app.run(
+                os.sys.stdin.buffer,
+                os.sys.stdout.buffer,
+                self.app.create_initialization_options()
+            )
+        finally:
+            self.close()
 
 if __name__ == "__main__":
     server = NavigationServer()
@@ -0,0 +1,115 @@
+"""
+Vectorized NumPy overlay rendering for segmentation output.
+`OverlayRenderer` blends one or more coloured masks onto a frame in a single
+call, writing into an RGBA output buffer that is reused between frames of the
+same size instead of allocating several frame-sized PIL images per call.
+Masks can be filled (with alpha blending) or drawn as contours only.
+
+The output is handled as one little-endian uint32 per pixel, so converting the
+frame to RGBA and painting opaque masks are single vectorized passes, and
+blending/contour work is restricted to each mask's bounding box.
+"""
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+Color = Tuple[int, int, int]
+
+OPAQUE = np.uint32(0xFF000000)
+
+def _pack(color: Color) -> np.uint32:
+    r, g, b = color
+    return np.uint32(r | (g << 8) | (b << 16) | 0xFF000000)
+
+def _bbox(region: np.ndarray) -> Optional[Tuple[slice, slice]]:
+    rows = np.flatnonzero(region.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(region.any(axis=0))
+    return slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+
+def mask_contour(mask: np.ndarray, thickness: int = 1) -> np.ndarray:
+    """Boolean boundary of a mask: pixels inside it with a 4-neighbour outside."""
+    inside = np.asarray(mask) > 0
+    interior = inside.copy()
+    for _ in range(thickness):
+        eroded = interior.copy()
+        eroded[1:, :] &= interior[:-1, :]
+        eroded[:-1, :] &= interior[1:, :]
+        eroded[:, 1:] &= interior[:, :-1]
+        eroded[:, :-1] &= interior[:, 1:]
+        # Pixels on the edge have an outside neighbour
+        eroded[0, :] = eroded[-1, :] = False
+        eroded[:, 0] = eroded[:, -1] = False
+        interior = eroded
+    return inside & ~interior
+
+class OverlayRenderer:
+    def __init__(self):
+        self._buffer: Optional[np.ndarray] = None
+
+    def _output(self, height: int, width: int) -> np.ndarray:
+        if self._buffer is None or self._buffer.shape[:2] != (height, width):
+            self._buffer = np.empty((height, width, 4), dtype=np.uint8)
+        return self._buffer
+
+    @staticmethod
+    def _fill_base(image: np.ndarray, pixels: np.ndarray):
+        """Write `image` into the uint32 pixel view as opaque RGBA."""
+        if image.ndim == 2:
+            np.multiply(image, np.uint32(0x010101), out=pixels, dtype=np.uint32)
+            pixels |= OPAQUE
+        elif image.shape[2] == 4:
+            pixels[...] = np.ascontiguousarray(image).view("<u4")[..., 0]
+        else:
+            # Read each RGB triple as an unaligned uint32 (the 4th byte belongs to
+            # the next pixel and is overwritten by the alpha bits)
+            flat = np.ascontiguousarray(image).reshape(-1)
+            out = pixels.reshape(-1)
+            count = out.size
+            if count > 1:
+                src = np.ndarray((count - 1,), dtype="<u4", buffer=flat, strides=(3,))
+                np.bitwise_or(src, OPAQUE, out=out[:-1])
+            r, g, b = (int(v) for v in flat[-3:])
+            out[-1] = _pack((r, g, b))
+
+    def render(self, image: np.ndarray, masks: Iterable[Tuple[np.ndarray, Color]],
+               alpha: float = 1.0, contour: bool = False, thickness: int = 1) -> np.ndarray:
+        """
+        Blend `(mask, color)` pairs over `image` (H x W gray, RGB or RGBA uint8).
+        Returns the shared RGBA output buffer, valid until the next call.
+        """
+        image = np.asarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        out = self._output(height, width)
+        pixels = out.view("<u4")[..., 0]
+        self._fill_base(image, pixels)
+
+        for mask, color in masks:
+            region = np.asarray(mask) > 0
+            window = _bbox(region)
+            if window is None:
+                continue
+            region = region[window]
+            if contour:
+                region = mask_contour(region, thickness)
+            if alpha >= 1.0:
+                np.copyto(pixels[window], _pack(color), where=region)
+            elif alpha > 0.0:
+                # 8-bit fixed-point blend of just the masked pixels
+                target = pixels[window]
+                selected = target[region].view(np.uint8).reshape(-1, 4)
+                weight = int(round(alpha * 256))
+                blended = selected.astype(np.uint16) * (256 - weight)
+                blended += np.array(tuple(color) + (255,), dtype=np.uint16) * weight
+                blended >>= 8
+                blended[:, 3] = selected[:, 3]
+                target[region] = blended.astype(np.uint8).view("<u4")[:, 0]
+        return out
+
+def render_overlay(image: np.ndarray, mask: np.ndarray, color: Color = (255, 0, 0),
+                   alpha: float = 1.0, contour: bool = False,
+                   renderer: Optional[OverlayRenderer] = None) -> np.ndarray:
+    """One-mask convenience wrapper around OverlayRenderer.render."""
+    renderer = renderer or OverlayRenderer()
+    return renderer.render(image, [(mask, color)], alpha=alpha, contour=contour)
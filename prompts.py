@@ -1,15 +1,18 @@
-def create_health_assessment_prompt(target_organ, ultrasound_image_data):
+def create_health_assessment_prompt(target_organ, ultrasound_image_data=None):
     prompt = (
         f"You are an astronaut assistant providing ultrasound image analysis for the {target_organ}. "
         f"The astronaut has successfully located and imaged the {target_organ}. "
         "Analyze the current ultrasound image and provide a concise health assessment.\n\n"
     )
 
-    # Add the ultrasound image data for analysis
-    prompt += (
-        "Current ultrasound image data:\n"
-        f"{ultrasound_image_data}\n\n"
-    )
+    # Add the ultrasound image data for analysis; without it the image is sent as an attached block
+    if ultrasound_image_data is None:
+        prompt += "The current ultrasound image is attached.\n\n"
+    else:
+        prompt += (
+            "Current ultrasound image data:\n"
+            f"{ultrasound_image_data}\n\n"
+        )
 
     prompt += (
         "Your response should:\n"
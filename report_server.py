@@ -1,7 +1,8 @@
 import os
 import logging
-import anthropic
+from typing import Optional
 from dotenv import load_dotenv
+from llm_gateway import LLMGateway, get_gateway
 from prompts import create_report_prompt
 
 load_dotenv()
@@ -10,11 +11,11 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ReportServer:
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
+    def __init__(self, llm: Optional[LLMGateway] = None):
+        if llm is None and not os.getenv("ANTHROPIC_API_KEY"):
             raise RuntimeError("ANTHROPIC_API_KEY is not set in your environment or .env file!")
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        # Shared, pooled LLM client (see llm_gateway.py)
+        self.llm = llm or get_gateway()
 
     async def generate_report(self, report_data: dict) -> str:
         """
@@ -23,14 +24,7 @@ class ReportServer:
         """
         prompt = create_report_prompt(report_data)
         try:
-            response = await self.client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                max_tokens=256,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            report = response.content
-            if isinstance(report, list):
-                report = " ".join([c["text"] if isinstance(c, dict) and "text" in c else str(c) for c in report])
+            report = await self.llm.complete(prompt, max_tokens=256)
         except Exception as e:
             logger.error(f"Error in Claude API call: {str(e)}")
             report = "Unable to generate report at this time."
@@ -10,11 +10,15 @@ from PIL import Image
 import os
 from openai import OpenAI
 from src.prompts import get_navigation_prompt, get_ultrasound_diagnostic_prompt
+from src.entity_cache import EntityCache
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 openai_client = OpenAI(api_key=OPENAI_API_KEY)
 
+# Identification results by perceptual image hash + entity name (ENTITY_CACHE_* settings)
+identification_cache = EntityCache.from_env(os.environ)
+
 app = FastAPI(title="Image and Text Processing API")
 
 # Pydantic models for request validation
@@ -49,7 +53,18 @@ def decode_image(base64_string):
 def identify_entity_in_image(image, entity_name):
     """
     Identify if the specified entity is present in the image using OpenAI's API.
+    Results are cached per (image, entity); failed calls are not cached.
     """
+    try:
+        return identification_cache.cached_identify(image, entity_name, lambda: ask_entity_in_image(image, entity_name))
+    except Exception as e:
+        # Log the error (in a production environment)
+        print(f"Error in OpenAI API call: {str(e)}")
+        # Default to False on error
+        return False
+
+def ask_entity_in_image(image, entity_name):
+    """One uncached vision call; raises if the API call fails."""
     # Convert OpenCV image to base64 for API request
     if isinstance(image, np.ndarray):
         # Convert from BGR to RGB (OpenCV uses BGR by default)
@@ -86,23 +101,16 @@ def identify_entity_in_image(image, entity_name):
         "max_tokens": 10  # Keep response concise
     }
 
-    try:
-        response = openai_client.chat.completions.create(**payload)
-        response_text = response.choices[0].message.content
-        
-        # Determine if the entity was found based on the response
-        if "true" in response_text.lower():
-            return True
-        elif "false" in response_text.lower():
-            return False
-        else:
-            # If response is unclear, default to False
-            return False
-            
-    except Exception as e:
-        # Log the error (in a production environment)
-        print(f"Error in OpenAI API call: {str(e)}")
-        # Default to False on error
+    response = openai_client.chat.completions.create(**payload)
+    response_text = response.choices[0].message.content
+    
+    # Determine if the entity was found based on the response
+    if "true" in response_text.lower():
+        return True
+    elif "false" in response_text.lower():
+        return False
+    else:
+        # If response is unclear, default to False
         return False
 
 # Helper function for image description
@@ -342,6 +350,19 @@ async def describe_image(target_organ: str = Form(...), image: UploadFile = File
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Commit identification results still pending in the SQLite cache
+@app.on_event("shutdown")
+def close_identification_cache():
+    identification_cache.close()
+
+# Identification cache statistics
+@app.get("/cache_stats", response_class=JSONResponse)
+async def cache_stats():
+    """
+    Hit rate and size of the identification result cache.
+    """
+    return identification_cache.stats()
+
 # Root endpoint for API information
 @app.get("/", response_class=JSONResponse)
 async def root():
@@ -355,7 +376,8 @@ async def root():
             {"path": "/identify", "method": "POST", "description": "Identify entities in images"},
             {"path": "/identify_base64", "method": "POST", "description": "Identify entities in base64-encoded images"},
             {"path": "/navigate", "method": "POST", "description": "Process navigation for entities in images"},
-            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"}
+            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"},
+            {"path": "/cache_stats", "method": "GET", "description": "Identification cache hit rate"}
         ]
     }
 
@@ -1,23 +1,25 @@
-import os
 from dotenv import load_dotenv
 load_dotenv()
 
 import base64
 import io
+import os
 import numpy as np
 from PIL import Image
 import cv2
-import httpx
-import anthropic
 
-def identify_entity_in_image(image, entity_name):
-    """
-    Identify if the specified entity is present in the image using Claude's Vision API (Anthropic SDK).
-    """
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise RuntimeError("ANTHROPIC_API_KEY is not set in your environment or .env file!")
-    client = anthropic.Anthropic(api_key=api_key)
+try:
+    # Shared, pooled Anthropic client (llm_gateway.py at the repository root)
+    from llm_gateway import LLMGateway, get_gateway
+except ImportError:
+    # sam/ on its own (e.g. its Docker image): a local client with the same interface
+    from src.llm_client import LLMClient as LLMGateway, get_gateway
+from src.entity_cache import EntityCache
+
+# Results by perceptual image hash + entity name; see src/entity_cache.py
+identification_cache = EntityCache.from_env(os.environ)
+
+def create_identification_prompt(image, entity_name):
     # Convert OpenCV image to base64 for API request
     if isinstance(image, np.ndarray):
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -28,26 +30,43 @@ def identify_entity_in_image(image, entity_name):
     image_pil.save(buffer, format="JPEG")
     base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
 
-    # Use Anthropic SDK for vision
-    prompt = (
+    return (
         f"Is there a {entity_name} in this image? Please respond with only 'true' or 'false'.\n"
         f"<image data:image/jpeg;base64,{base64_image}>"
     )
+
+def parse_identification(response_text):
+    if "true" in response_text.lower():
+        return True
+    elif "false" in response_text.lower():
+        return False
+    else:
+        return False
+
+def identify_entity_in_image(image, entity_name, llm: LLMGateway = None, cache: EntityCache = None):
+    """
+    Identify if the specified entity is present in the image using Claude's Vision API (Anthropic SDK).
+    Results are cached per (image, entity); failed calls return False and are not cached.
+    Blocking; async callers should use identify_entity_in_image_async.
+    """
+    def ask():
+        prompt = create_identification_prompt(image, entity_name)
+        return parse_identification((llm or get_gateway()).complete_sync(prompt, max_tokens=10))
+
+    try:
+        return (cache or identification_cache).cached_identify(image, entity_name, ask)
+    except Exception as e:
+        print(f"Error in Claude API call: {str(e)}")
+        return False
+
+async def identify_entity_in_image_async(image, entity_name, llm: LLMGateway = None, cache: EntityCache = None):
+    """identify_entity_in_image without blocking the event loop."""
+    async def ask():
+        prompt = create_identification_prompt(image, entity_name)
+        return parse_identification(await (llm or get_gateway()).complete(prompt, max_tokens=10))
+
     try:
-        message = client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=10,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        response_text = message.content
-        if isinstance(response_text, list):
-            response_text = " ".join([c["text"] if isinstance(c, dict) and "text" in c else str(c) for c in response_text])
-        if "true" in response_text.lower():
-            return True
-        elif "false" in response_text.lower():
-            return False
-        else:
-            return False
+        return await (cache or identification_cache).cached_identify_async(image, entity_name, ask)
     except Exception as e:
         print(f"Error in Claude API call: {str(e)}")
         return False
@@ -0,0 +1,212 @@
+"""
+Content-addressed cache for entity identification results
+(`identify_entity_in_image` in sam/classification.py and sam/app.py).
+
+Results are keyed by a perceptual hash of the image plus the normalized
+entity name, so byte-identical and visually identical frames (a held probe)
+share one vision call. The hash is a difference hash (dHash) of a small
+grayscale thumbnail, as in frame_hash.py, but longer (`hash_size`**2 bits,
+256 by default) so that distinct scans do not collide; the thumbnail is
+taken from a strided view of one channel, so keying a frame costs well under
+a millisecond rather than a full-resolution resize.
+
+`cached_identify()` / `cached_identify_async()` wrap an identification call:
+the cached result, or the call's result stored on a miss.
+
+Entries expire after `ttl` seconds and the least recently used ones are
+evicted beyond `max_entries`. With `db_path` set, results are also written
+to a SQLite table and read back on a memory miss, so they survive restarts.
+Disk writes happen outside the memory lock and are committed in batches:
+after `commit_every` writes, or by a timer `commit_interval` seconds after
+the first uncommitted write, and on `flush()`, `close()` and interpreter
+exit. A hit never waits for a commit.
+`stats()` reports hits (memory and disk), misses and the hit rate.
+"""
+import atexit
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+# Side of the strided view the hash thumbnail is built from
+SAMPLE_SIDE = 128
+
+def perceptual_hash(image, hash_size: int = 16) -> str:
+    """Hex dHash of a PIL image or (H, W[, C]) array; identical for RGB and BGR frames."""
+    pixels = np.asarray(image)
+    step = max(1, max(pixels.shape[:2]) // SAMPLE_SIDE)
+    sample = pixels[::step, ::step]
+    if sample.ndim == 3:
+        # Green sits in the middle of both RGB and BGR, and ultrasound frames are gray anyway
+        sample = sample[..., 1 if sample.shape[2] >= 3 else 0]
+    small = np.asarray(
+        Image.fromarray(np.ascontiguousarray(sample, dtype=np.uint8)).resize((hash_size + 1, hash_size), Image.BOX),
+        dtype=np.int16
+    )
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return np.packbits(bits).tobytes().hex()
+
+class EntityCache:
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 300.0,
+                 db_path: Optional[str] = None, hash_size: int = 16,
+                 commit_every: int = 64, commit_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hash_size = hash_size
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        # key -> (found, wall-clock time stored)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes use of the SQLite connection; never held together with _lock
+        self._db_lock = threading.Lock()
+        self._uncommitted = 0
+        self._flush_timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entity_results (key TEXT PRIMARY KEY, found INTEGER, created REAL)"
+            )
+            if ttl is not None:
+                self.db.execute("DELETE FROM entity_results WHERE created < ?", (time.time() - ttl,))
+            self.db.commit()
+            atexit.register(self.flush)
+
+    def key(self, image, entity_name: str) -> str:
+        return f"{perceptual_hash(image, self.hash_size)}:{entity_name.strip().lower()}"
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl is None or time.time() - created < self.ttl
+
+    def get(self, key: str) -> Optional[bool]:
+        """Cached result for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.expired += 1
+        row = None
+        with self._db_lock:
+            if self.db is not None:
+                row = self.db.execute("SELECT found, created FROM entity_results WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is not None and self._fresh(row[1]):
+                self._store(key, bool(row[0]), row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return bool(row[0])
+            self.misses += 1
+            return None
+
+    def _store(self, key: str, found: bool, created: float):
+        self._entries[key] = (found, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, found: bool):
+        created = time.time()
+        with self._lock:
+            self._store(key, found, created)
+        with self._db_lock:
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entity_results (key, found, created) VALUES (?, ?, ?)",
+                    (key, int(found), created)
+                )
+                self._uncommitted += 1
+                if self._uncommitted >= self.commit_every:
+                    self._commit()
+                elif self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.commit_interval, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+
+    def _commit(self):
+        """Commit pending disk writes; called with _db_lock held."""
+        self.db.commit()
+        self._uncommitted = 0
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def flush(self):
+        """Commit disk writes not committed yet."""
+        with self._db_lock:
+            if self.db is not None and self._uncommitted:
+                self._commit()
+
+    def cached_identify(self, image, entity_name: str, compute: Callable[[], bool]) -> bool:
+        """
+        Cached result for (image, entity_name), or `compute()` stored on a
+        miss. Exceptions from `compute` propagate and nothing is stored.
+        """
+        key = self.key(image, entity_name)
+        found = self.get(key)
+        if found is None:
+            found = compute()
+            self.put(key, found)
+        return found
+
+    async def cached_identify_async(self, image, entity_name: str,
+                                    compute: Callable[[], Awaitable[bool]]) -> bool:
+        """`cached_identify` for a coroutine function `compute`."""
+        key = self.key(image, entity_name)
+        found = self.get(key)
+        if found is None:
+            found = await compute()
+            self.put(key, found)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        with self._db_lock:
+            if self.db is not None:
+                self.db.execute("DELETE FROM entity_results")
+                self._commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self.db is not None:
+                self._commit()
+                self.db.close()
+                self.db = None
+        atexit.unregister(self.flush)
+
+    @classmethod
+    def from_env(cls, environ) -> "EntityCache":
+        """ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL (seconds, 0 = no expiry) and ENTITY_CACHE_DB."""
+        ttl = float(environ.get("ENTITY_CACHE_TTL", "300"))
+        return cls(
+            max_entries=int(environ.get("ENTITY_CACHE_SIZE", "1024")),
+            ttl=ttl or None,
+            db_path=environ.get("ENTITY_CACHE_DB") or None,
+        )
@@ -0,0 +1,51 @@
+"""
+Local Anthropic client for sam/ when it runs on its own (the sam/ Docker
+image, or `uvicorn app:app` from this directory), where the repository's
+shared `llm_gateway.py` is not importable. It offers the part of the
+`LLMGateway` interface that classification.py uses: `complete_sync()`,
+`complete()` and a process-wide `get_gateway()`. The client is created once
+and reused, so its connection pool is kept alive across calls; async callers
+run the blocking call in a worker thread.
+"""
+import asyncio
+import os
+import threading
+from typing import Optional
+
+import anthropic
+
+DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+
+class LLMClient:
+    def __init__(self, model: Optional[str] = None, timeout: float = 30.0, max_retries: int = 2):
+        self.model = model or DEFAULT_MODEL
+        self.client = anthropic.Anthropic(timeout=timeout, max_retries=max_retries)
+
+    def complete_sync(self, content, max_tokens: int = 128, model: Optional[str] = None) -> str:
+        response = self.client.messages.create(
+            model=model or self.model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": content}],
+        )
+        return " ".join(block.text for block in response.content if getattr(block, "text", None))
+
+    async def complete(self, content, max_tokens: int = 128, model: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.complete_sync, content, max_tokens, model)
+
+    def close(self):
+        self.client.close()
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+def get_gateway() -> LLMClient:
+    """The process-wide client (LLM_MODEL, LLM_TIMEOUT and LLM_MAX_RETRIES, as for llm_gateway)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                model=os.environ.get("LLM_MODEL") or None,
+                timeout=float(os.environ.get("LLM_TIMEOUT", "30")),
+                max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+            )
+        return _client
@@ -1,31 +1,215 @@
-import torch
+"""
+CPU SAM2 segmentation engine.
+The model is built once and kept warm. Image embeddings are cached per frame
+(keyed by a digest of the pixels), so repeated point or box prompts on the
+same frame only run the mask decoder. Encoder and decoder latencies are
+measured separately.
+
+Run as a script to segment a single image:
+
+    python model.py input.png [masked_output.png]
+"""
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
+import torch
 from PIL import Image
 
 from sam2.build_sam import build_sam2
 from sam2.sam2_image_predictor import SAM2ImagePredictor
 from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
 
-# Load the model and predictor
-checkpoint = "finetuned_models/sam2_hiera_small.pt"
-model_cfg = "../sam2/configs/sam2/sam2_hiera_s.yaml"
-predictor = SAM2AutomaticMaskGenerator(build_sam2(model_cfg, checkpoint))
-
-# Load your image (as a NumPy array or PIL Image, convert to RGB if needed)
-your_image = Image.open("../heart_ultrasound__96373.png").convert("RGB")
-image_np = np.array(your_image)
-
-# Run prediction
-with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
-    masks = predictor.generate(image_np)
-    
-
-# Convert mask to uint8 and apply
-mask = masks[0] # Use the first mask
-mask = mask["segmentation"]
-masked_image = image_np.copy()
-masked_image[mask == 0] = 0  # Black out background
-
-# Save the masked image
-result = Image.fromarray(masked_image)
-result.save("masked_output.png")
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT = "finetuned_models/sam2_hiera_small.pt"
+DEFAULT_CONFIG = "../sam2/configs/sam2/sam2_hiera_s.yaml"
+
+# SAM2ImagePredictor attributes that make up its current-image state
+PREDICTOR_STATE = ("_features", "_orig_hw", "_is_image_set", "_is_batch")
+
+def image_key(image_np: np.ndarray) -> str:
+    """Digest identifying a frame's pixels."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(image_np.shape).encode())
+    digest.update(np.ascontiguousarray(image_np).data)
+    return digest.hexdigest()
+
+class SAM2Engine:
+    def __init__(self, checkpoint: str = DEFAULT_CHECKPOINT, model_cfg: str = DEFAULT_CONFIG,
+                 device: str = "cpu", embedding_cache_size: int = 4):
+        start = time.perf_counter()
+        self.device = device
+        self.model = build_sam2(model_cfg, checkpoint, device=device)
+        self.model.eval()
+        self.predictor = SAM2ImagePredictor(self.model)
+        self._generator: Optional[SAM2AutomaticMaskGenerator] = None
+        self.embedding_cache_size = embedding_cache_size
+        self._embeddings: "OrderedDict[str, Dict]" = OrderedDict()
+        self._current_key: Optional[str] = None
+        self._generator_encoder_ms = 0.0
+        # Low-resolution logits of the last predicted mask, usable as `mask_input`
+        self.last_logits: Optional[np.ndarray] = None
+        self.stats = {"encoder_runs": 0, "embedding_hits": 0, "decoder_runs": 0,
+                      "encoder_ms_total": 0.0, "decoder_ms_total": 0.0}
+        logger.info(f"SAM2 model loaded on {device} in {time.perf_counter() - start:.1f}s")
+
+    @property
+    def generator(self) -> SAM2AutomaticMaskGenerator:
+        if self._generator is None:
+            self._generator = SAM2AutomaticMaskGenerator(self.model)
+            # Time the image encoder inside the generator separately from mask decoding
+            set_image = self._generator.predictor.set_image
+
+            def timed_set_image(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return set_image(*args, **kwargs)
+                finally:
+                    self._generator_encoder_ms += (time.perf_counter() - start) * 1000
+
+            self._generator.predictor.set_image = timed_set_image
+        return self._generator
+
+    def set_image(self, image_np: np.ndarray) -> float:
+        """Make `image_np` the predictor's current image; returns encoder time in ms (0 on a cache hit)."""
+        key = image_key(image_np)
+        if key == self._current_key:
+            self.stats["embedding_hits"] += 1
+            return 0.0
+        cached = self._embeddings.get(key)
+        if cached is not None:
+            self._embeddings.move_to_end(key)
+            # Restore every state attribute, so nothing left by a batch encode survives
+            for name, value in cached.items():
+                setattr(self.predictor, name, value)
+            self._current_key = key
+            self.stats["embedding_hits"] += 1
+            return 0.0
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            self.predictor.set_image(image_np)
+        encoder_ms = (time.perf_counter() - start) * 1000
+        self._embeddings[key] = {name: getattr(self.predictor, name) for name in PREDICTOR_STATE}
+        if len(self._embeddings) > self.embedding_cache_size:
+            self._embeddings.popitem(last=False)
+        self._current_key = key
+        self.stats["encoder_runs"] += 1
+        self.stats["encoder_ms_total"] += encoder_ms
+        return encoder_ms
+
+    def predict(self, image_np: np.ndarray, point_coords=None, point_labels=None,
+                box=None, mask_input=None) -> Tuple[np.ndarray, float, Dict[str, float]]:
+        """
+        Prompted segmentation; returns (best mask, score, timings in ms).
+        `mask_input` takes low-resolution logits such as `last_logits` from a
+        previous frame to seed the decoder.
+        """
+        encoder_ms = self.set_image(image_np)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            masks, scores, logits = self.predictor.predict(
+                point_coords=None if point_coords is None else np.asarray(point_coords, dtype=np.float32),
+                point_labels=None if point_labels is None else np.asarray(point_labels, dtype=np.int32),
+                box=None if box is None else np.asarray(box, dtype=np.float32),
+                mask_input=mask_input,
+                multimask_output=mask_input is None,
+            )
+        decoder_ms = (time.perf_counter() - start) * 1000
+        self.stats["decoder_runs"] += 1
+        self.stats["decoder_ms_total"] += decoder_ms
+        best = int(np.argmax(scores))
+        self.last_logits = logits[best][None]
+        return masks[best] > 0, float(scores[best]), {"encoder_ms": encoder_ms, "decoder_ms": decoder_ms}
+
+    def predict_batch(self, images_np, point_coords=None, point_labels=None,
+                      boxes=None) -> List[Tuple[np.ndarray, float, Dict[str, float]]]:
+        """
+        Prompted segmentation of several same-size frames in one encoder batch.
+        Prompt arguments are per-frame lists (entries may be None). Latencies
+        are amortized over the batch.
+        """
+        count = len(images_np)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            self.predictor.set_image_batch(list(images_np))
+        encoder_ms = (time.perf_counter() - start) * 1000
+        # The single-image embedding no longer matches the predictor state
+        self._current_key = None
+
+        def as_array(values, dtype):
+            return None if values is None else [None if v is None else np.asarray(v, dtype=dtype) for v in values]
+
+        start = time.perf_counter()
+        with torch.inference_mode():
+            masks_batch, scores_batch, _ = self.predictor.predict_batch(
+                point_coords_batch=as_array(point_coords, np.float32),
+                point_labels_batch=as_array(point_labels, np.int32),
+                box_batch=as_array(boxes, np.float32),
+                multimask_output=True,
+            )
+        decoder_ms = (time.perf_counter() - start) * 1000
+        self.stats["encoder_runs"] += 1
+        self.stats["encoder_ms_total"] += encoder_ms
+        self.stats["decoder_runs"] += 1
+        self.stats["decoder_ms_total"] += decoder_ms
+        self.last_logits = None
+
+        timings = {"encoder_ms": encoder_ms / count, "decoder_ms": decoder_ms / count, "batch_size": count}
+        results = []
+        for masks, scores in zip(masks_batch, scores_batch):
+            best = int(np.argmax(scores))
+            results.append((masks[best] > 0, float(scores[best]), dict(timings)))
+        return results
+
+    def generate(self, image_np: np.ndarray) -> Tuple[np.ndarray, float, Dict[str, float]]:
+        """Automatic (unprompted) segmentation; returns the highest-confidence mask."""
+        generator = self.generator
+        self._generator_encoder_ms = 0.0
+        start = time.perf_counter()
+        with torch.inference_mode():
+            masks = generator.generate(image_np)
+        total_ms = (time.perf_counter() - start) * 1000
+        encoder_ms = self._generator_encoder_ms
+        timings = {"encoder_ms": encoder_ms, "decoder_ms": total_ms - encoder_ms}
+        self.stats["encoder_runs"] += 1
+        self.stats["encoder_ms_total"] += encoder_ms
+        self.stats["decoder_runs"] += 1
+        self.stats["decoder_ms_total"] += timings["decoder_ms"]
+        self.last_logits = None
+        if not masks:
+            return np.zeros(image_np.shape[:2], dtype=bool), 0.0, timings
+        best = max(masks, key=lambda m: m["predicted_iou"])
+        return best["segmentation"], float(best["predicted_iou"]), timings
+
+    def latency_stats(self) -> Dict[str, float]:
+        encoder_runs = max(self.stats["encoder_runs"], 1)
+        decoder_runs = max(self.stats["decoder_runs"], 1)
+        return {
+            **self.stats,
+            "encoder_ms_avg": self.stats["encoder_ms_total"] / encoder_runs,
+            "decoder_ms_avg": self.stats["decoder_ms_total"] / decoder_runs,
+        }
+
+if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    input_path = sys.argv[1] if len(sys.argv) > 1 else "../heart_ultrasound__96373.png"
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "masked_output.png"
+
+    engine = SAM2Engine(
+        os.environ.get("SAM2_CHECKPOINT", DEFAULT_CHECKPOINT),
+        os.environ.get("SAM2_CONFIG", DEFAULT_CONFIG),
+    )
+    image_np = np.array(Image.open(input_path).convert("RGB"))
+    mask, score, timings = engine.generate(image_np)
+
+    masked_image = image_np.copy()
+    masked_image[~mask] = 0  # Black out background
+    Image.fromarray(masked_image).save(output_path)
+    print(f"Saved {output_path} (score {score:.2f}, {timings})")
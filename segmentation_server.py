@@ -1,25 +1,251 @@
 """
-Stub PyTorch "model" that draws a central circle mask on the input image and
-returns confidence 0.8. Exposes one MCP request: `segment(image: bytes)`.
+Segmentation MCP server. Exposes one MCP request: `segment(image: bytes)`.
+Instead of `image`, a request may carry `frame`, a shared-memory slot handle
+from the ingest server, which is mapped without copying the pixels, or (in
+the in-process mode) `pixels`, the decoded NumPy frame itself.
+
+Two backends are available (SEGMENTATION_BACKEND):
+- `stub` (default): draws a central circle mask and returns confidence 0.8.
+  The mask depends only on the frame geometry, so it is cached per
+  (size, mode) together with its PNG encoding and bbox.
+- `sam2`: a real SAM2 model on CPU (sam/src/model.py), loaded once at startup.
+  Requests may add `points` + `labels` or `box` prompts; without prompts the
+  automatic mask generator is used. Image embeddings are cached, so repeated
+  prompts on the same frame skip the encoder.
+
+Streaming mode: requests carrying a `session` id share per-session state (the
+previous frame's thumbnail, mask, score and decoder logits). A nearly
+identical frame reuses the previous mask outright; a moderately changed frame
+is segmented with a single prompted decode seeded by the previous mask's box
+and logits; a full re-segmentation runs only when the scene changes, the
+confidence drops, or after `max_propagated` propagated frames. Send
+`"reset": true` to drop a session's state.
+
+Batch mode: `segmentBatch` takes `{"frames": [request, ...], "fields": ...}`
+where each entry is a `segment`-style request (image or frame handle plus
+optional prompts). Frames from concurrent calls are gathered by a dynamic
+batcher (up to `max_batch_size` frames, waiting at most `max_batch_wait`
+seconds); same-size prompted frames go through the SAM2 encoder as one
+tensor batch. Results are streamed back as `{"index": i, ...fields}` in
+completion order; a frame that fails yields `{"index": i, "error": ...}`.
+
+Pyramid mode: `"pyramid": true` (or a scale, or `{"scale", "band",
+"verify", "refine"}`) segments a frame downscaled by `scale` and re-decides
+only a `band`-pixel strip around the coarse mask boundary at full
+resolution (see pyramid.py). By default the band is re-decided from the
+coarse pass's mask logits upsampled to full resolution, or with a local
+intensity heuristic when the backend returned no logits; neither runs the
+encoder again. `"refine": "model"` re-runs the backend on the full-resolution
+window instead (one more encoder pass), and the stub backend keeps the
+upsampled coarse mask. Pyramid mode cannot be combined with a streaming
+`session`. The `pyramid` field reports the tradeoff: coarse and refine
+times, the fraction of the frame refined and the pixels changed; with
+`verify` the full-resolution mask is also computed and its IoU against the
+pyramid result and its latency are included.
+
+Decoding, inference and encoding never run on the event loop. They are
+dispatched to a CPUExecutor (cpu_executor.py), by default its thread pool
+(PIL, NumPy and torch release the GIL); model calls are serialized by a lock
+while decode and encode work overlaps. With SEGMENTATION_EXECUTOR=process,
+`segment` requests run in a process pool instead, each worker holding its own
+warm model (streaming sessions are then per worker). Queue-wait and execution
+times are reported by the `stats` request.
+
+Callers may pass `fields` to choose which outputs are computed, either as a
+list of names or as a mapping of name to encoding:
+
+    {"image": ..., "fields": {"score": "float", "mask": "png"}}
+
+Available fields and encodings (first is the default):
+    mask:    png | array | rle | bits   (rle/bits: compact forms, see mask_codec.py)
+    bbox:    list
+    score:   float
+    overlay: png | array   (rendered with the NumPy engine in overlay.py)
+    contour: points | png | array
+    timings: ms            (encoder/decoder latency of the backend)
+    stream:  info          (streaming mode used: reused | propagated | full)
+    pyramid: info          (coarse-to-fine accuracy/latency report)
+Fields nobody asked for are never computed. Without `fields`, the response
+keeps its original shape: mask, bbox, score and overlay.
 """
 import asyncio
 import io
 import json
 import logging
 import os
-from typing import Dict
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+from batching import DynamicBatcher
+from cpu_executor import CPUExecutor
 from mcp_local import App
+from frame_hash import similarity, thumbnail
+from mask_codec import pack_mask, rle_encode
+from overlay import OverlayRenderer, mask_contour
 from PIL import Image, ImageDraw
+from pyramid import (
+    band_window, downscale, mask_iou, merge_band, parse_pyramid, refine_coarse_mask, refine_logits,
+    scale_prompts, upscale_mask, window_prompts
+)
+from shape_cache import ShapeCache
+from shared_frames import check_frame, frame_view
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class SegmentationServer:
+FIELD_ENCODINGS = {
+    "mask": ("png", "array", "rle", "bits"),
+    "bbox": ("list",),
+    "score": ("float",),
+    "overlay": ("png", "array"),
+    "contour": ("points", "png", "array"),
+    "timings": ("ms",),
+    "stream": ("info",),
+    "pyramid": ("info",),
+}
+DEFAULT_FIELDS = ("mask", "bbox", "score", "overlay")
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def parse_fields(fields) -> Dict[str, str]:
+    """Normalize a `fields` request entry into {field: encoding}."""
+    if fields is None:
+        fields = DEFAULT_FIELDS
+    if not isinstance(fields, dict):
+        fields = {name: None for name in fields}
+    parsed = {}
+    for name, encoding in fields.items():
+        if name not in FIELD_ENCODINGS:
+            raise ValueError(f"Unknown segmentation field '{name}'")
+        encoding = encoding or FIELD_ENCODINGS[name][0]
+        if encoding not in FIELD_ENCODINGS[name]:
+            raise ValueError(f"Field '{name}' cannot be encoded as '{encoding}'")
+        parsed[name] = encoding
+    return parsed
+
+class MaskEntry:
+    """A mask with its encodings, built lazily and at most once per frame geometry."""
+
+    def __init__(self, mask: Image.Image):
+        self.mask = mask
+        self.array = np.asarray(mask)
+        self._bbox = None
+        self._png = None
+        self._rle = None
+        self._bits = None
+        self._contour = None
+
+    @property
+    def bbox(self):
+        if self._bbox is None:
+            self._bbox = self.mask.getbbox()
+        return self._bbox
+
+    @property
+    def png(self) -> bytes:
+        if self._png is None:
+            self._png = encode_png(self.mask)
+        return self._png
+
+    @property
+    def rle(self) -> Dict:
+        if self._rle is None:
+            self._rle = rle_encode(self.array)
+        return self._rle
+
+    @property
+    def bits(self) -> Dict:
+        if self._bits is None:
+            self._bits = pack_mask(self.array)
+        return self._bits
+
+    @property
+    def contour(self) -> np.ndarray:
+        if self._contour is None:
+            self._contour = mask_contour(self.array)
+        return self._contour
+
+class SegmentationResult:
+    def __init__(self, entry: MaskEntry, score: float, timings: Optional[Dict[str, float]] = None,
+                 logits: Optional[np.ndarray] = None):
+        self.entry = entry
+        self.score = score
+        self.timings = timings or {}
+        self.logits = logits
+        self.stream: Dict = {}
+        self.pyramid: Dict = {}
+
+class StreamSession:
+    """Temporal state carried from one frame of a stream to the next."""
+
     def __init__(self):
+        self.thumb: Optional[np.ndarray] = None
+        self.result: Optional[SegmentationResult] = None
+        self.frames_since_full = 0
+        self.counts = {"reused": 0, "propagated": 0, "full": 0}
+
+def load_sam2_engine():
+    """Build the SAM2 engine from sam/src/model.py (needs torch and sam2)."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sam', 'src'))
+    from model import DEFAULT_CHECKPOINT, DEFAULT_CONFIG, SAM2Engine
+    return SAM2Engine(
+        os.environ.get("SAM2_CHECKPOINT", DEFAULT_CHECKPOINT),
+        os.environ.get("SAM2_CONFIG", DEFAULT_CONFIG),
+        device="cpu",
+    )
+
+class SegmentationServer:
+    def __init__(self, mask_cache_size: int = 8, backend: str = "stub", engine=None,
+                 reuse_similarity: float = 0.99, propagate_similarity: float = 0.85,
+                 min_stream_score: float = 0.5, max_propagated: int = 30, max_sessions: int = 16,
+                 max_batch_size: int = 8, max_batch_wait: float = 0.01,
+                 executor: Optional[CPUExecutor] = None, executor_kind: str = "thread",
+                 pyramid_scale: float = 0.5, pyramid_band: int = 6):
+        if backend not in ("stub", "sam2"):
+            raise ValueError("backend must be 'stub' or 'sam2'")
+        if executor_kind not in ("thread", "process"):
+            raise ValueError("executor_kind must be 'thread' or 'process'")
         self.app = App("segmentation")
         self.confidence = 0.8
+        # Keyed by (image.size, image.mode)
+        self.mask_cache = ShapeCache(max_entries=mask_cache_size)
+        # Renderers reuse their output buffer, so each worker thread gets its own
+        self._local = threading.local()
+        self.executor_kind = executor_kind
+        self.executor = executor or CPUExecutor(process_initializer=init_worker,
+                                                process_initargs=(backend,))
+        # The engine and the caches around it are not thread-safe
+        self.model_lock = threading.RLock()
+        # Model is loaded once here and kept warm for every request
+        self.engine = engine if engine is not None or backend == "stub" else load_sam2_engine()
+
+        # Streaming mode policy and per-session state
+        self.reuse_similarity = reuse_similarity
+        self.propagate_similarity = propagate_similarity
+        self.min_stream_score = min_stream_score
+        self.max_propagated = max_propagated
+        self.sessions = ShapeCache(max_entries=max_sessions)
+
+        # Coarse-to-fine defaults for requests asking for `pyramid`
+        self.pyramid_scale = pyramid_scale
+        self.pyramid_band = pyramid_band
+
+        # Frames from concurrent segmentBatch calls are segmented together
+        self.batcher = DynamicBatcher(self.run_batch, max_batch_size=max_batch_size,
+                                      max_wait=max_batch_wait)
+
+    @property
+    def overlay_renderer(self) -> OverlayRenderer:
+        renderer = getattr(self._local, "renderer", None)
+        if renderer is None:
+            renderer = self._local.renderer = OverlayRenderer()
+        return renderer
 
     def create_circular_mask(self, image: Image.Image) -> Image.Image:
         """Create a circular mask in the center of the image."""
@@ -44,61 +270,392 @@ class SegmentationServer:
         
         return mask
 
-    def overlay_mask_on_image(self, image: Image.Image, mask: Image.Image, color=(255, 0, 0), alpha=1.0) -> Image.Image:
-        """Overlay the mask on the image with the given color and high visibility (fully opaque)."""
-        if image.mode != 'RGBA':
+    def get_mask(self, image: Image.Image) -> MaskEntry:
+        """Cached mask, PNG bytes and bbox for the image geometry."""
+        return self.mask_cache.get(
+            (image.size, image.mode),
+            lambda: MaskEntry(self.create_circular_mask(image))
+        )
+
+    def overlay_mask_on_image(self, image: Image.Image, mask: Image.Image, color=(255, 0, 0), alpha=1.0,
+                              contour=False) -> Image.Image:
+        """
+        Overlay the mask on the image with the given color (fully opaque by default).
+        The returned image shares the renderer's buffer and is only valid until the next call.
+        """
+        if image.mode not in ('L', 'RGB', 'RGBA'):
             image = image.convert('RGBA')
-        overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-        mask_rgb = Image.new('RGBA', image.size, color + (0,))
-        mask_alpha = mask.point(lambda p: 255 if p > 0 else 0)  # Fully opaque where mask > 0
-        overlay = Image.composite(mask_rgb, overlay, mask_alpha)
-        return Image.alpha_composite(image, overlay)
+        out = self.overlay_renderer.render(
+            np.asarray(image), [(np.asarray(mask), color)], alpha=alpha, contour=contour
+        )
+        return Image.fromarray(out)
+
+    def load_image(self, request: Dict) -> Image.Image:
+        """Decode the request image, or map its shared-memory frame handle."""
+        pixels = request.get("pixels")
+        if pixels is not None:
+            return Image.fromarray(pixels)
+        frame = request.get("frame")
+        if frame:
+            # Image.fromarray copies multi-band pixels but shares the buffer of
+            # single-band ones; either way the image must own its pixels before
+            # the slot is validated, so copy only once
+            view = frame_view(frame)
+            image = Image.fromarray(view)
+            if view.ndim == 2:
+                image = image.copy()
+            check_frame(frame)
+            return image
 
-    async def segment(self, request: Dict) -> Dict:
-        """Process image and return mask with bbox, confidence score, and overlay."""
-        logger.info("Processing segmentation request")
-        
         # Convert bytes to image
         image_bytes = request.get("image")
         if not image_bytes:
             raise ValueError("No image data provided")
-            
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Create mask
-        mask = self.create_circular_mask(image)
-        
-        # Get bounding box
-        bbox = mask.getbbox()
-        
-        # Convert mask to PNG bytes
-        mask_bytes = io.BytesIO()
-        mask.save(mask_bytes, format='PNG')
-        
-        # Create overlay image
-        overlay_img = self.overlay_mask_on_image(image, mask)
-        overlay_bytes = io.BytesIO()
-        overlay_img.save(overlay_bytes, format='PNG')
-        
-        response = {
-            "mask": mask_bytes.getvalue(),
-            "bbox": list(bbox),
-            "score": self.confidence,
-            "overlay": overlay_bytes.getvalue()
+        return Image.open(io.BytesIO(image_bytes))
+
+    def run_model(self, image: Image.Image, request: Dict) -> SegmentationResult:
+        """Segment with the configured backend."""
+        if self.engine is None:
+            # Mask and its encodings come from the shape cache
+            return SegmentationResult(self.get_mask(image), self.confidence)
+
+        image_np = np.asarray(image.convert('RGB'))
+        if request.get("points") is not None or request.get("box") is not None:
+            points = request.get("points")
+            labels = request.get("labels")
+            if points is not None and labels is None:
+                labels = [1] * len(points)
+            mask, score, timings = self.engine.predict(image_np, points, labels, request.get("box"))
+        else:
+            mask, score, timings = self.engine.generate(image_np)
+        logger.info(f"SAM2 encoder {timings['encoder_ms']:.1f} ms, decoder {timings['decoder_ms']:.1f} ms")
+        entry = MaskEntry(Image.fromarray(np.asarray(mask, dtype=np.uint8) * 255))
+        return SegmentationResult(entry, score, timings, getattr(self.engine, "last_logits", None))
+
+    @staticmethod
+    def _has_prompt(request: Dict) -> bool:
+        return request.get("points") is not None or request.get("box") is not None
+
+    def run_model_batch(self, items: List) -> List:
+        """
+        Segment a list of (image, request) pairs. Prompted frames of the same
+        size share one encoder batch; everything else runs frame by frame.
+        Failures are returned in place of the frame's result.
+        """
+        results: List = [None] * len(items)
+        groups: Dict = {}
+        for i, (image, request) in enumerate(items):
+            if self.engine is not None and self._has_prompt(request) and hasattr(self.engine, "predict_batch"):
+                groups.setdefault(image.size, []).append(i)
+
+        for indices in groups.values():
+            if len(indices) < 2:
+                continue
+            images, points, labels, boxes = [], [], [], []
+            for i in indices:
+                image, request = items[i]
+                images.append(np.asarray(image.convert('RGB')))
+                frame_points = request.get("points")
+                frame_labels = request.get("labels")
+                if frame_points is not None and frame_labels is None:
+                    frame_labels = [1] * len(frame_points)
+                points.append(frame_points)
+                labels.append(frame_labels)
+                boxes.append(request.get("box"))
+            try:
+                batch = self.engine.predict_batch(
+                    images,
+                    points if any(p is not None for p in points) else None,
+                    labels if any(l is not None for l in labels) else None,
+                    boxes if any(b is not None for b in boxes) else None,
+                )
+            except Exception as e:
+                for i in indices:
+                    results[i] = e
+                continue
+            logger.info(f"SAM2 batch of {len(indices)} frames, encoder "
+                        f"{batch[0][2].get('encoder_ms', 0.0):.1f} ms/frame")
+            for i, (mask, score, timings) in zip(indices, batch):
+                entry = MaskEntry(Image.fromarray(np.asarray(mask, dtype=np.uint8) * 255))
+                results[i] = SegmentationResult(entry, score, timings)
+
+        for i, (image, request) in enumerate(items):
+            if results[i] is None:
+                try:
+                    results[i] = self.run_model(image, request)
+                except Exception as e:
+                    results[i] = e
+        return results
+
+    def _run_model_batch_locked(self, items: List) -> List:
+        with self.model_lock:
+            return self.run_model_batch(items)
+
+    async def run_batch(self, items: List) -> List:
+        return await self.executor.run(self._run_model_batch_locked, items)
+
+    def propagate(self, image: Image.Image, previous: SegmentationResult) -> SegmentationResult:
+        """Prompted decode seeded with the previous frame's box and logits."""
+        bbox = previous.entry.bbox
+        mask, score, timings = self.engine.predict(
+            np.asarray(image.convert('RGB')), None, None,
+            list(bbox) if bbox else None,
+            mask_input=previous.logits
+        )
+        entry = MaskEntry(Image.fromarray(np.asarray(mask, dtype=np.uint8) * 255))
+        return SegmentationResult(entry, score, timings, getattr(self.engine, "last_logits", None))
+
+    def run_streaming(self, image: Image.Image, request: Dict) -> SegmentationResult:
+        """Segment a frame of a stream, reusing or propagating the previous result when possible."""
+        if request.get("reset"):
+            self.sessions.discard(request["session"])
+        session = self.sessions.get(request["session"], StreamSession)
+
+        thumb = thumbnail(np.asarray(image))
+        frame_similarity = similarity(thumb, session.thumb) if session.thumb is not None else 0.0
+        session.thumb = thumb
+        previous = session.result
+
+        result, mode = None, "full"
+        if (previous is not None and previous.score >= self.min_stream_score
+                and previous.entry.mask.size == image.size
+                and session.frames_since_full < self.max_propagated):
+            if frame_similarity >= self.reuse_similarity:
+                result = SegmentationResult(previous.entry, previous.score, {}, previous.logits)
+                mode = "reused"
+            elif frame_similarity >= self.propagate_similarity and self.engine is not None:
+                result = self.propagate(image, previous)
+                mode = "propagated"
+                if result.score < self.min_stream_score:
+                    result = None  # confidence dropped, fall back to a full pass
+
+        if result is None:
+            result = self.run_model(image, request)
+            mode = "full"
+            session.frames_since_full = 0
+        else:
+            session.frames_since_full += 1
+
+        session.result = result
+        session.counts[mode] += 1
+        result.stream = {"mode": mode, "similarity": round(frame_similarity, 4), **session.counts}
+        return result
+
+    def run_pyramid(self, image: Image.Image, request: Dict, config: Dict) -> SegmentationResult:
+        """Segment a downscaled frame, then refine a band around the mask boundary at full resolution."""
+        image.load()  # decoding is not part of either pass
+        start = time.perf_counter()
+        scale, band_width = config["scale"], config["band"]
+        coarse_result = self.run_model(downscale(image, scale), scale_prompts(request, scale))
+        coarse_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        coarse = coarse_result.entry.array > 0
+        refine = self.refine_mode(config["refine"], coarse_result)
+        if refine == "logits":
+            refined, band_pixels, changed = self.refine_with_logits(image, coarse, band_width, coarse_result.logits)
+        elif refine == "intensity":
+            refined, band_pixels, changed = refine_coarse_mask(image, coarse, band_width)
+        elif refine == "model":
+            refined, band_pixels, changed = self.refine_with_model(image, request, coarse, band_width)
+        else:
+            refined, band_pixels, changed = upscale_mask(coarse, image.size), 0, 0
+        refine_ms = (time.perf_counter() - start) * 1000
+
+        report = {
+            "scale": scale,
+            "band": band_width,
+            "refine": refine,
+            "coarse_ms": round(coarse_ms, 3),
+            "refine_ms": round(refine_ms, 3),
+            "total_ms": round(coarse_ms + refine_ms, 3),
+            "band_fraction": round(band_pixels / float(image.width * image.height), 4),
+            "refined_pixels": changed,
         }
-        
-        logger.info(f"Segmentation complete with score {self.confidence}")
+        if config["verify"]:
+            start = time.perf_counter()
+            full = self.run_model(image, request)
+            full_ms = (time.perf_counter() - start) * 1000
+            report["full_ms"] = round(full_ms, 3)
+            report["iou_vs_full"] = round(float(mask_iou(refined, full.entry.array > 0)), 4)
+            report["speedup"] = round(full_ms / max(coarse_ms + refine_ms, 1e-6), 2)
+
+        entry = MaskEntry(Image.fromarray(refined.astype(np.uint8) * 255))
+        timings = {**coarse_result.timings, "coarse_ms": coarse_ms, "refine_ms": refine_ms}
+        result = SegmentationResult(entry, coarse_result.score, timings)
+        result.pyramid = report
+        return result
+
+    def refine_mode(self, requested: str, coarse_result: SegmentationResult) -> str:
+        """The refinement actually used for `requested` (see pyramid.py)."""
+        if self.engine is None:
+            # Stub masks are not derived from the image: nothing to refine against
+            return "none"
+        if requested in ("auto", "logits"):
+            return "logits" if coarse_result.logits is not None else "intensity"
+        return requested
+
+    def refine_with_logits(self, image: Image.Image, coarse: np.ndarray, band_width: int,
+                           logits: np.ndarray) -> Tuple[np.ndarray, int, int]:
+        """
+        Re-decide the boundary band from the coarse pass's mask logits,
+        upsampled to full resolution. Returns (mask, band pixels, pixels changed).
+        """
+        mask = upscale_mask(coarse, image.size)
+        window = band_window(coarse, image.size, band_width)
+        if window is None:
+            return mask, 0, 0
+        box, band, _ = window
+        changed = refine_logits(logits, mask, box, band)
+        return mask, int(np.count_nonzero(band)), changed
+
+    def refine_with_model(self, image: Image.Image, request: Dict, coarse: np.ndarray,
+                          band_width: int) -> Tuple[np.ndarray, int, int]:
+        """
+        Re-run the backend on the full-resolution window around `coarse`,
+        prompted with the coarse box, and take its mask inside the boundary
+        band. Returns (mask, band pixels, pixels changed).
+        """
+        mask = upscale_mask(coarse, image.size)
+        window = band_window(coarse, image.size, band_width)
+        if window is None:
+            return mask, 0, 0
+        box, band, _ = window
+        window_result = self.run_model(image.crop(box), window_prompts(request, mask, box))
+        changed = merge_band(mask, box, band, window_result.entry.array > 0)
+        return mask, int(np.count_nonzero(band)), changed
+
+    def encode_field(self, name: str, encoding: str, image: Image.Image, result: SegmentationResult):
+        """Compute a single requested output field."""
+        entry = result.entry
+        if name == "score":
+            return result.score
+        if name == "timings":
+            return result.timings
+        if name == "stream":
+            return result.stream
+        if name == "pyramid":
+            return result.pyramid
+        if name == "bbox":
+            return list(entry.bbox) if entry.bbox else []
+        if name == "mask":
+            if encoding == "rle":
+                return entry.rle
+            if encoding == "bits":
+                return entry.bits
+            return entry.png if encoding == "png" else entry.array
+        if name == "overlay":
+            overlay_img = self.overlay_mask_on_image(image, entry.mask)
+            return encode_png(overlay_img) if encoding == "png" else np.array(overlay_img)
+        if name == "contour":
+            if encoding == "points":
+                return np.argwhere(entry.contour)[:, ::-1].tolist()
+            if encoding == "png":
+                return encode_png(Image.fromarray(entry.contour))
+            return entry.contour
+        raise ValueError(f"Unknown segmentation field '{name}'")
+
+    def encode_fields(self, fields: Dict[str, str], image: Image.Image, result: SegmentationResult) -> Dict:
+        return {
+            name: self.encode_field(name, encoding, image, result)
+            for name, encoding in fields.items()
+        }
+
+    def segment_sync(self, request: Dict) -> Dict:
+        """Blocking body of `segment`; runs in an executor worker."""
+        fields = parse_fields(request.get("fields"))
+        pyramid = parse_pyramid(request.get("pyramid"), self.pyramid_scale, self.pyramid_band)
+        if pyramid is not None and request.get("session") is not None:
+            raise ValueError("pyramid cannot be combined with a streaming session")
+        image = self.load_image(request)
+
+        with self.model_lock:
+            if request.get("session") is not None:
+                result = self.run_streaming(image, request)
+            elif pyramid is not None:
+                result = self.run_pyramid(image, request, pyramid)
+            else:
+                result = self.run_model(image, request)
+
+        response = self.encode_fields(fields, image, result)
+
+        logger.info(f"Segmentation complete with score {result.score}")
         return response
 
+    async def segment(self, request: Dict) -> Dict:
+        """Process image and return the requested fields (mask, bbox, score, overlay by default)."""
+        logger.info("Processing segmentation request")
+        if self.executor_kind == "process":
+            return await self.executor.run(segment_in_worker, request, kind="process")
+        return await self.executor.run(self.segment_sync, request)
+
+    async def segment_batch(self, request: Dict):
+        """Segment several frames, yielding each frame's fields as soon as it is done."""
+        frames = request.get("frames")
+        if not frames:
+            raise ValueError("No frames provided")
+        fields = parse_fields(request.get("fields"))
+        logger.info(f"Processing segmentation batch of {len(frames)} frames")
+
+        async def run_one(index: int, frame_request: Dict):
+            try:
+                image = await self.executor.run(self.load_image, frame_request)
+                result = await self.batcher.submit((image, frame_request))
+                return index, await self.executor.run(self.encode_fields, fields, image, result)
+            except Exception as e:
+                logger.error(f"Batch frame {index} failed: {e}")
+                return index, {"error": str(e)}
+
+        pending = [asyncio.ensure_future(run_one(i, frame)) for i, frame in enumerate(frames)]
+        try:
+            for completed in asyncio.as_completed(pending):
+                index, response = await completed
+                yield {"index": index, **response}
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stats(self, request: Dict) -> Dict:
+        """Executor queue-wait/execution times, batching and cache counters."""
+        return {
+            "executor": self.executor.stats(),
+            "batcher": self.batcher.stats(),
+            "mask_cache": self.mask_cache.stats(),
+            "sessions": self.sessions.stats(),
+        }
+
+    def close(self):
+        self.batcher.close()
+        self.executor.shutdown(wait=False)
+
+    def register_handlers(self):
+        # The same frame sent twice while the first is still running is segmented once
+        self.app.register_request("segment", self.segment, coalesce=True)
+        self.app.register_request("segmentBatch", self.segment_batch)
+        self.app.register_request("stats", self.stats)
+
     def run(self):
         """Start the MCP server."""
-        self.app.register_request("segment", self.segment)
+        self.register_handlers()
         self.app.run(
             os.sys.stdin.buffer,
             os.sys.stdout.buffer,
             self.app.create_initialization_options()
         )
 
+# Per-process server used by the process-pool executor
+_worker_server: Optional[SegmentationServer] = None
+
+def init_worker(backend: str):
+    global _worker_server
+    _worker_server = SegmentationServer(backend=backend)
+
+def segment_in_worker(request: Dict) -> Dict:
+    return _worker_server.segment_sync(request)
+
 if __name__ == "__main__":
-    server = SegmentationServer()
+    server = SegmentationServer(
+        backend=os.environ.get("SEGMENTATION_BACKEND", "stub"),
+        executor_kind=os.environ.get("SEGMENTATION_EXECUTOR", "thread"),
+    )
     server.run()
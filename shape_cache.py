@@ -0,0 +1,50 @@
+"""
+Small LRU cache for artefacts that depend only on the frame geometry
+(image size and mode), such as the stub segmentation mask or, later,
+per-resolution model inputs. Also holds per-stream segmentation sessions.
+Keeps hit/miss counters for monitoring.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+class ShapeCache:
+    def __init__(self, max_entries: int = 8):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Return the entry for `key`, building it with `factory()` on a miss."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = factory()
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def discard(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
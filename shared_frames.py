@@ -0,0 +1,213 @@
+"""
+Shared-memory frame pool for zero-copy handoff between the MCP servers.
+The ingest server writes each frame into one of a ring of
+`multiprocessing.shared_memory` slots, prefixed by a small header
+(sequence number, shape, dtype, mode), and sends only a slot handle:
+
+    {"name": "usframe-1234-0-1", "seq": 17, "shape": [480, 640, 3],
+     "dtype": "|u1", "mode": "RGB"}
+
+A slot is reused after `slots` further frames, so the ring must be deeper
+than the number of frames in flight. The header sequence number works as a
+seqlock: the writer clears it before copying pixels in and publishes the new
+value afterwards, and readers check it both before and after taking the
+pixels, raising StaleFrameError if the slot was (or is being) overwritten.
+
+`read_frame` returns a validated copy. Consumers that copy or convert the
+pixels anyway (e.g. into a PIL image) can use `frame_view` for the
+zero-copy mapping instead and must call `check_frame` once they are done
+with it.
+"""
+import logging
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"USFR"
+# magic, sequence number, height, width, channels, dtype, PIL mode
+HEADER = struct.Struct("<4sQIII8s4s")
+HEADER_SIZE = 64  # keep pixel data aligned
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 4  # after the magic
+# Sequence numbers start at 1; 0 marks a slot being written
+WRITING = 0
+
+# Blocks created by pools in this process; their tracker registration is the pool's to release
+_owned_names = set()
+
+class StaleFrameError(RuntimeError):
+    """The slot referenced by a handle has been overwritten by a newer frame."""
+
+def _open_shm(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing block without letting this process unlink it at exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no `track` argument
+        shm = shared_memory.SharedMemory(name=name)
+        if name in _owned_names:
+            return shm
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+class SharedFramePool:
+    """Ring of shared-memory slots owned by the producing (ingest) process."""
+
+    def __init__(self, slots: int = 8, prefix: Optional[str] = None):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.prefix = prefix or f"usframe-{os.getpid()}"
+        self.slots: List[Optional[shared_memory.SharedMemory]] = [None] * slots
+        self._generation = [0] * slots
+        self.seq = 0
+
+    def _slot_for(self, index: int, nbytes: int) -> shared_memory.SharedMemory:
+        shm = self.slots[index]
+        if shm is not None and shm.size >= HEADER_SIZE + nbytes:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+            _owned_names.discard(shm.name)
+        # A new name per resize so readers never map a block of the wrong size
+        self._generation[index] += 1
+        name = f"{self.prefix}-{index}-{self._generation[index]}"
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + nbytes)
+        _owned_names.add(name)
+        self.slots[index] = shm
+        return shm
+
+    def write(self, pixels: np.ndarray, mode: str = "RGB") -> Dict:
+        """Copy `pixels` into the next slot and return its handle."""
+        pixels = np.ascontiguousarray(pixels)
+        self.seq += 1
+        index = self.seq % len(self.slots)
+        shm = self._slot_for(index, pixels.nbytes)
+
+        height, width = pixels.shape[:2]
+        channels = pixels.shape[2] if pixels.ndim == 3 else 1
+        # Invalidate the slot first so readers of the previous frame see it change
+        HEADER.pack_into(
+            shm.buf, 0, MAGIC, WRITING, height, width, channels,
+            pixels.dtype.str.encode(), mode.encode()
+        )
+        target = np.ndarray(pixels.shape, dtype=pixels.dtype, buffer=shm.buf, offset=HEADER_SIZE)
+        target[...] = pixels
+        SEQ.pack_into(shm.buf, SEQ_OFFSET, self.seq)
+        return {
+            "name": shm.name,
+            "seq": self.seq,
+            "shape": list(pixels.shape),
+            "dtype": pixels.dtype.str,
+            "mode": mode,
+        }
+
+    def close(self):
+        """Release and unlink every slot."""
+        for index, shm in enumerate(self.slots):
+            if shm is None:
+                continue
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+            _owned_names.discard(shm.name)
+            self.slots[index] = None
+
+def _slot_of(name: str) -> str:
+    """Slot part of a block name: the pool prefix and index, without the resize generation."""
+    return name.rsplit("-", 1)[0]
+
+class SharedFrameReader:
+    """
+    Maps frame handles to NumPy views, keeping attached blocks open for reuse.
+    When a pool resizes a slot under a new block name, the block attached for
+    the old name is closed and dropped.
+    """
+
+    def __init__(self):
+        # Slot -> attached block, whose name is that of the slot's latest generation seen
+        self._attached: Dict[str, shared_memory.SharedMemory] = {}
+        # Replaced blocks that still had live views when they were dropped
+        self._retired: List[shared_memory.SharedMemory] = []
+
+    def _attach(self, name: str) -> shared_memory.SharedMemory:
+        slot = _slot_of(name)
+        shm = self._attached.get(slot)
+        if shm is not None and shm.name == name:
+            return shm
+        if shm is not None:
+            self._retired.append(shm)
+        self._close_retired()
+        shm = _open_shm(name)
+        self._attached[slot] = shm
+        return shm
+
+    def _close_retired(self):
+        retired, self._retired = self._retired, []
+        for shm in retired:
+            try:
+                shm.close()
+            except BufferError:
+                self._retired.append(shm)  # views still alive; retried on the next replacement
+
+    def check(self, handle: Dict):
+        """Raise StaleFrameError if the slot no longer holds the frame of `handle`."""
+        (seq,) = SEQ.unpack_from(self._attach(handle["name"]).buf, SEQ_OFFSET)
+        if seq != handle["seq"]:
+            state = "is being overwritten" if seq == WRITING else f"was overwritten by frame {seq}"
+            raise StaleFrameError(f"Frame {handle['seq']} {state}")
+
+    def view(self, handle: Dict) -> np.ndarray:
+        """
+        Zero-copy read-only view of the frame referenced by `handle`. The slot
+        can be overwritten while the view is in use: call `check(handle)` after
+        the last use to make sure what was read is intact.
+        """
+        shm = self._attach(handle["name"])
+        magic, seq, height, width, channels, dtype, mode = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Shared memory block {handle['name']} is not a frame slot")
+        self.check(handle)
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        view = np.ndarray(shape, dtype=np.dtype(dtype.rstrip(b"\0").decode()), buffer=shm.buf, offset=HEADER_SIZE)
+        view.flags.writeable = False
+        return view
+
+    def read(self, handle: Dict) -> np.ndarray:
+        """Return a read-only copy of the frame referenced by `handle`, validated after copying."""
+        pixels = np.array(self.view(handle))
+        self.check(handle)
+        pixels.flags.writeable = False
+        return pixels
+
+    def close(self):
+        for shm in list(self._attached.values()) + self._retired:
+            try:
+                shm.close()
+            except BufferError:
+                logger.warning(f"Frame views into {shm.name} are still alive; leaving it mapped")
+        self._attached.clear()
+        self._retired.clear()
+
+# Process-wide reader used by the consuming servers
+frame_reader = SharedFrameReader()
+
+def read_frame(handle: Dict) -> np.ndarray:
+    """Copy the frame of a handle from the ingest server, raising StaleFrameError if torn."""
+    return frame_reader.read(handle)
+
+def frame_view(handle: Dict) -> np.ndarray:
+    """Map a frame handle without copying; follow up with `check_frame(handle)`."""
+    return frame_reader.view(handle)
+
+def check_frame(handle: Dict):
+    frame_reader.check(handle)
@@ -0,0 +1,36 @@
+"""Tests for multi-frame cine-loop sources."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import json
+import numpy as np
+from PIL import Image
+
+from cine_source import CineSource, iter_frames
+
+def test_multipage_tiff_streams_with_read_ahead(tmp_path):
+    path = str(tmp_path / "loop.tiff")
+    pages = [Image.fromarray(np.full((8, 8), v, dtype=np.uint8)) for v in (10, 20, 30)]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    with open(path + ".json", "w") as f:
+        json.dump({"fps": 10, "start_time": 100.0}, f)
+
+    source = CineSource(path, read_ahead=1)
+    frames = []
+    while (frame := source.next()) is not None:
+        frames.append(frame)
+    assert [int(f.pixels[0, 0, 0]) for f in frames] == [10, 20, 30]
+    assert [f.timestamp for f in frames] == [100.0, 100.1, 100.2]
+    assert frames[0].pixels.shape == (8, 8, 3)
+
+def test_raw_dump_uses_sidecar_timestamps(tmp_path):
+    path = str(tmp_path / "probe.raw")
+    np.arange(2 * 4 * 6 * 3, dtype=np.uint8).tofile(path)
+    with open(path + ".json", "w") as f:
+        json.dump({"width": 6, "height": 4, "channels": 3, "timestamps": [5.0, 5.05]}, f)
+
+    frames = list(iter_frames(path))
+    assert len(frames) == 2
+    assert frames[1].pixels.shape == (4, 6, 3)
+    assert frames[1].timestamp == 5.05
+    assert int(frames[1].pixels[0, 0, 0]) == 4 * 6 * 3
@@ -28,3 +28,111 @@ async def test_coordinator_loop():
         await asyncio.wait_for(mock_run(), timeout=5)
     except asyncio.TimeoutError:
         pytest.fail("Coordinator failed to complete two iterations")
+
+@pytest.mark.asyncio
+async def test_coordinator_pipelined_drops_oldest():
+    """Pipelined mode keeps queues bounded when the assess stage is slow."""
+    coordinator = Coordinator(queue_size=1, target_hz=100)
+
+    async def fetch(name, params):
+        return {"image": b"frame", "settings": {}, "timestamp": 0}
+
+    async def segment(name, params):
+        return {"score": 0.8, "mask": b"mask"}
+
+    async def slow_assess(name, params):
+        await asyncio.sleep(0.2)
+        return {"image_quality": 0.72, "landmarks": ["liver"], "diagnosis": "No abnormal findings"}
+
+    async def speak(name, params):
+        return {}
+
+    coordinator.ingest_client.request = fetch
+    coordinator.segmentation_client.request = segment
+    coordinator.diagnostic_client.request = slow_assess
+    coordinator.tts_client.request = speak
+
+    try:
+        await asyncio.wait_for(coordinator.run_pipelined(stats_interval=None), timeout=0.5)
+    except asyncio.TimeoutError:
+        pass
+
+    stats = coordinator.pipeline_stats()
+    assert stats["ingest"]["processed"] > stats["assess"]["processed"]
+    assert stats["assess"]["dropped"] > 0
+    for stage in ("segment", "assess", "speak"):
+        assert stats[stage]["depth"] <= 1
+
+@pytest.mark.asyncio
+async def test_coordinator_reuses_result_for_static_frames():
+    """Unchanged frames skip segmentation, diagnostics and TTS."""
+    coordinator = Coordinator()
+    calls = {"segment": 0, "speak": 0}
+
+    frames = [
+        {"image": b"frame", "hash": "00000000000000ff", "similarity": 0.0},
+        {"image": b"frame", "hash": "00000000000000ff", "similarity": 0.999},
+        {"image": b"frame", "hash": "ffffffff000000ff", "similarity": 0.999},
+    ]
+
+    async def fetch(name, params):
+        return frames.pop(0)
+
+    async def segment(name, params):
+        calls["segment"] += 1
+        return {"score": 0.2, "mask": b"mask"}
+
+    async def speak(name, params):
+        calls["speak"] += 1
+        return {}
+
+    coordinator.ingest_client.request = fetch
+    coordinator.segmentation_client.request = segment
+    coordinator.tts_client.request = speak
+
+    for _ in range(3):
+        await coordinator.process_frame()
+
+    # Second frame is reused; third has drifted too far from the processed one
+    assert coordinator.reused_frames == 1
+    assert calls == {"segment": 2, "speak": 2}
+
+@pytest.mark.asyncio
+async def test_coordinator_skips_assessment_for_unusable_frames():
+    """Frames failing the local quality gate never reach the diagnostic server."""
+    import numpy as np
+    coordinator = Coordinator()
+    flat = np.full((64, 64), 3, dtype=np.uint8)
+    calls = {"assess": 0}
+
+    async def assess(name, params):
+        calls["assess"] += 1
+        return {"image_quality": 0.9, "landmarks": ["liver"], "diagnosis": "No abnormal findings"}
+
+    coordinator.diagnostic_client.request = assess
+    coordinator.quality_scorer.score = lambda image, mask: {
+        "score": 0.1, "sharpness": 0.0, "dynamic_range": 0.0, "saturated": 0.0
+    }
+    text = await coordinator.assess_frame({"image": flat}, {"score": 0.9, "mask": None})
+    assert calls["assess"] == 0
+    assert coordinator.skipped_assessments == 1
+    assert "gain" in text
+
+@pytest.mark.asyncio
+async def test_coordinator_sends_quality_with_the_assessment():
+    """The quality gate's metrics travel with the frame so they are not computed twice."""
+    import numpy as np
+    coordinator = Coordinator()
+    frame = np.full((64, 64), 90, dtype=np.uint8)
+    quality = {"score": 0.8, "sharpness": 1.0, "dynamic_range": 100.0, "saturated": 0.0}
+    sent = []
+
+    async def assess(name, params):
+        sent.append(params)
+        return {"image_quality": params["quality"]["score"], "landmarks": ["liver"], "diagnosis": "No abnormal findings"}
+
+    coordinator.diagnostic_client.request = assess
+    coordinator.quality_scorer.score = lambda image, mask: quality
+    text = await coordinator.assess_frame({"image": frame}, {"score": 0.9, "mask": None})
+    assert sent[0]["quality"] == quality
+    assert text.startswith("Image quality is 80%")
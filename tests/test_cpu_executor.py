@@ -0,0 +1,48 @@
+"""Thread and process pools of the CPU executor."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import math
+import threading
+import time
+
+import pytest
+
+from cpu_executor import CPUExecutor
+
+@pytest.mark.asyncio
+async def test_thread_pool_runs_off_the_event_loop():
+    executor = CPUExecutor(thread_workers=2)
+    loop_thread = threading.get_ident()
+    result = await executor.run(threading.get_ident)
+    assert result != loop_thread
+    stats = executor.stats()["thread"]
+    assert stats["workers"] == 2
+    assert stats["completed"] == 1
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_shows_up_as_queue_wait():
+    executor = CPUExecutor(thread_workers=1)
+    await asyncio.gather(*(executor.run(time.sleep, 0.05) for _ in range(3)))
+    stats = executor.stats()["thread"]
+    assert stats["completed"] == 3
+    assert stats["exec_ms_avg"] >= 45
+    # The last call waited for the two ahead of it
+    assert stats["queue_wait_ms_max"] >= 90
+    assert stats["in_flight"] == 0 and stats["waiting"] == 0
+    executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_process_pool_and_failures_are_counted():
+    executor = CPUExecutor(process_workers=1)
+    assert await executor.run(math.factorial, 20, kind="process") == math.factorial(20)
+    with pytest.raises(ValueError):
+        await executor.run(math.factorial, -1, kind="process")
+    stats = executor.stats()["process"]
+    assert stats["completed"] == 1
+    assert stats["failed"] == 1
+    with pytest.raises(ValueError):
+        await executor.run(math.factorial, 3, kind="gpu")
+    executor.shutdown()
@@ -3,7 +3,12 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import asyncio
 import base64
+import io
+import numpy as np
+import pytest
+from PIL import Image
 from diagnostic_server import DiagnosticServer
+from shared_frames import SharedFramePool
 
 # Dummy image and mask data for testing
 dummy_image = "dummy-ultrasound-image-data"
@@ -23,5 +28,59 @@ async def test_diagnostic():
     assert isinstance(response["diagnosis"], str)
     assert target_organ in response["landmarks"]
 
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def complete(self, prompt, max_tokens=128):
+        self.prompts.append(prompt)
+        return "No abnormal findings"
+
+def _attached_pixels(content):
+    """Pixels of the image block in a message content list."""
+    image_block, text_block = content
+    assert image_block["type"] == "image" and text_block["type"] == "text"
+    png = base64.b64decode(image_block["source"]["data"])
+    return np.asarray(Image.open(io.BytesIO(png)))
+
+@pytest.mark.asyncio
+async def test_diagnostic_reuses_quality_from_request():
+    server = DiagnosticServer(llm=FakeLLM())
+    scored = []
+    server.quality_scorer.score = lambda image, mask: scored.append(image) or {"score": 0.5}
+    quality = {"score": 0.9, "sharpness": 1.0}
+    response = await server.assess({**{"image": dummy_image, "mask": dummy_mask, "target_organ": target_organ},
+                                    "quality": quality})
+    assert response["image_quality"] == 0.9 and response["quality"] == quality
+    assert scored == []
+    # Without it the frame is scored on the executor
+    response = await server.assess({"image": dummy_image, "mask": dummy_mask, "target_organ": target_organ})
+    assert response["image_quality"] == 0.5 and len(scored) == 1
+    assert server.executor.stats()["thread"]["completed"] == 1
+    server.close()
+
+@pytest.mark.asyncio
+async def test_diagnostic_attaches_shared_memory_frame_as_image():
+    llm = FakeLLM()
+    server = DiagnosticServer(llm=llm)
+    pool = SharedFramePool()
+    pixels = np.random.default_rng(0).integers(0, 255, size=(24, 32, 3), dtype=np.uint8)
+    try:
+        await server.assess({"frame": pool.write(pixels, mode="RGB"), "mask": dummy_mask,
+                             "target_organ": target_organ, "quality": {"score": 0.9}})
+    finally:
+        pool.close()
+        server.close()
+    np.testing.assert_array_equal(_attached_pixels(llm.prompts[0]), pixels)
+
+@pytest.mark.asyncio
+async def test_diagnostic_attaches_in_process_pixels_as_image():
+    llm = FakeLLM()
+    server = DiagnosticServer(llm=llm)
+    pixels = np.random.default_rng(1).integers(0, 255, size=(24, 32), dtype=np.uint8)
+    await server.assess({"pixels": pixels, "mask": dummy_mask, "target_organ": target_organ})
+    server.close()
+    np.testing.assert_array_equal(_attached_pixels(llm.prompts[0]), pixels)
+
 if __name__ == "__main__":
     asyncio.run(test_diagnostic())
@@ -0,0 +1,142 @@
+"""Perceptual-hash keyed cache of entity identification results."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sam')))
+import asyncio
+import sqlite3
+import subprocess
+import time
+
+import numpy as np
+import pytest
+
+from src.entity_cache import EntityCache, perceptual_hash
+
+def _scan(seed=0, shape=(480, 640, 3)):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 255, size=(shape[0] // 16, shape[1] // 16), dtype=np.uint8)
+    frame = np.kron(base, np.ones((16, 16), dtype=np.uint8))
+    return np.stack([frame] * shape[2], axis=-1) if len(shape) == 3 else frame
+
+def test_key_is_perceptual_and_per_entity():
+    cache = EntityCache()
+    frame = _scan()
+    noisy = np.clip(frame.astype(np.int16) + 1, 0, 255).astype(np.uint8)
+    assert cache.key(frame, "Liver") == cache.key(frame.copy(), " liver ")
+    assert cache.key(frame, "liver") == cache.key(noisy, "liver")
+    # Channel order (BGR vs RGB) does not change the hash
+    assert perceptual_hash(frame[..., ::-1]) == perceptual_hash(frame)
+    assert cache.key(frame, "liver") != cache.key(frame, "kidney")
+    assert cache.key(frame, "liver") != cache.key(_scan(seed=1), "liver")
+    assert len(perceptual_hash(frame)) == 64
+
+def test_hits_misses_and_lru_eviction():
+    cache = EntityCache(max_entries=2)
+    keys = [cache.key(_scan(seed=i), "liver") for i in range(3)]
+    assert cache.get(keys[0]) is None
+    cache.put(keys[0], True)
+    cache.put(keys[1], False)
+    assert cache.get(keys[0]) is True
+    cache.put(keys[2], True)  # evicts keys[1], the least recently used
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is True
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 2, 1, 2)
+    assert stats["hit_rate"] == 0.5
+
+def test_entries_expire():
+    cache = EntityCache(ttl=0.05)
+    key = cache.key(_scan(), "liver")
+    cache.put(key, True)
+    assert cache.get(key) is True
+    time.sleep(0.06)
+    assert cache.get(key) is None
+    assert cache.stats()["expired"] == 1
+
+def test_sqlite_backing_survives_restart(tmp_path):
+    db_path = str(tmp_path / "entities.db")
+    cache = EntityCache(db_path=db_path)
+    key = cache.key(_scan(), "heart")
+    cache.put(key, False)
+    cache.close()
+
+    restarted = EntityCache(db_path=db_path)
+    assert restarted.get(key) is False
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.get(key) is False  # now served from memory
+    assert restarted.stats()["disk_hits"] == 1
+    restarted.close()
+
+def test_cached_identify_computes_once_and_skips_failures():
+    cache = EntityCache()
+    frame = _scan()
+    calls = []
+
+    def ask():
+        calls.append(1)
+        return True
+
+    assert cache.cached_identify(frame, "liver", ask) is True
+    assert cache.cached_identify(frame.copy(), "Liver", ask) is True
+    assert len(calls) == 1
+
+    def fail():
+        raise RuntimeError("API down")
+
+    with pytest.raises(RuntimeError):
+        cache.cached_identify(frame, "kidney", fail)
+    assert cache.get(cache.key(frame, "kidney")) is None
+
+    async def ask_async():
+        calls.append(1)
+        return False
+
+    assert asyncio.run(cache.cached_identify_async(frame, "spleen", ask_async)) is False
+    assert asyncio.run(cache.cached_identify_async(frame, "spleen", ask_async)) is False
+    assert len(calls) == 2
+
+def test_disk_writes_are_committed_in_batches(tmp_path):
+    db_path = str(tmp_path / "entities.db")
+    cache = EntityCache(db_path=db_path, commit_every=3, commit_interval=60.0)
+    keys = [cache.key(_scan(seed=i), "liver") for i in range(3)]
+
+    def committed():
+        with sqlite3.connect(db_path) as db:
+            return db.execute("SELECT COUNT(*) FROM entity_results").fetchone()[0]
+
+    cache.put(keys[0], True)
+    cache.put(keys[1], True)
+    assert committed() == 0
+    cache.put(keys[2], True)
+    assert committed() == 3
+    cache.put(cache.key(_scan(seed=3), "liver"), False)
+    cache.flush()
+    assert committed() == 4
+    cache.close()
+
+def test_pending_writes_are_committed_by_timer_and_at_exit(tmp_path):
+    db_path = str(tmp_path / "entities.db")
+
+    def committed():
+        with sqlite3.connect(db_path) as db:
+            return db.execute("SELECT COUNT(*) FROM entity_results").fetchone()[0]
+
+    cache = EntityCache(db_path=db_path, commit_every=64, commit_interval=0.05)
+    cache.put(cache.key(_scan(), "liver"), True)
+    assert committed() == 0
+    time.sleep(0.2)
+    assert committed() == 1
+    cache.close()
+
+    # A process that exits without flush() or close() still keeps its results
+    script = (
+        "import sys; sys.path.insert(0, {sam!r})\n"
+        "import numpy as np\n"
+        "from src.entity_cache import EntityCache\n"
+        "cache = EntityCache(db_path={db!r}, commit_interval=60.0)\n"
+        "for i in range(5):\n"
+        "    frame = np.random.default_rng(i).integers(0, 255, size=(64, 64), dtype=np.uint8)\n"
+        "    cache.cached_identify(frame, 'liver', lambda: True)\n"
+    ).format(sam=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sam'), db=db_path)
+    subprocess.run([sys.executable, "-c", script], check=True)
+    assert committed() == 6
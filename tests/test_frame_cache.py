@@ -0,0 +1,97 @@
+"""Tests for the pre-decoded frame cache."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import base64
+import threading
+import time
+import numpy as np
+from PIL import Image
+
+import frame_cache
+from frame_cache import FrameCache, MmapFrameStore
+
+def _write_image(path, value, size=(32, 16)):
+    Image.fromarray(np.full((size[1], size[0], 3), value, dtype=np.uint8)).save(path)
+    return str(path)
+
+def test_frame_cache_decodes_once(tmp_path):
+    path = _write_image(tmp_path / "a.png", 7)
+    cache = FrameCache()
+    first = cache.get_b64(path)
+    second = cache.get_b64(path)
+    assert first is second
+    assert base64.b64decode(first) == bytes([7]) * (32 * 16 * 3)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+def test_concurrent_gets_share_one_decode(tmp_path, monkeypatch):
+    path = _write_image(tmp_path / "a.png", 5)
+    decodes = []
+    decode_rgb = frame_cache.decode_rgb
+
+    def slow_decode(p):
+        decodes.append(p)
+        time.sleep(0.05)
+        return decode_rgb(p)
+
+    monkeypatch.setattr(frame_cache, "decode_rgb", slow_decode)
+    cache = FrameCache()
+    frames = []
+    threads = [threading.Thread(target=lambda: frames.append(cache.get(path))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(decodes) == 1
+    assert all(frame is frames[0] for frame in frames)
+
+def test_concurrent_payloads_are_counted_once(tmp_path):
+    path = _write_image(tmp_path / "a.png", 3)
+    cache = FrameCache()
+    cache.get(path)
+    payloads = []
+    threads = [threading.Thread(target=lambda: payloads.append(cache.get_b64(path))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(payload is payloads[0] for payload in payloads)
+    assert cache.stats()["bytes"] == 32 * 16 * 3 + len(payloads[0])
+
+def test_frame_cache_evicts_lru_and_reloads_from_store(tmp_path):
+    paths = [_write_image(tmp_path / f"{i}.png", i) for i in range(3)]
+    frame_bytes = 32 * 16 * 3
+    cache = FrameCache(max_bytes=2 * frame_bytes, store_path=str(tmp_path / "store" / "frames.raw"))
+    for path in paths:
+        cache.get(path)
+    assert len(cache) == 2
+    assert paths[0] not in cache
+    assert cache.stats()["evictions"] == 1
+
+    frame = cache.get(paths[0])
+    assert cache.stats()["store_hits"] == 1
+    assert isinstance(frame.pixels, np.memmap)
+    assert frame.size == (32, 16)
+    assert int(frame.pixels[0, 0, 0]) == 0
+
+    # Memory-mapped pixels do not count against the memory cap
+    assert frame.nbytes == 0
+    assert cache.stats()["bytes"] == 2 * frame_bytes
+
+def test_store_index_is_appended_and_survives_a_torn_record(tmp_path):
+    store_path = str(tmp_path / "frames.raw")
+    store = MmapFrameStore(store_path)
+    for i in range(3):
+        store.put(f"k{i}", np.full((4, 5, 3), i, dtype=np.uint8))
+    with open(store.index_path) as f:
+        assert len(f.readlines()) == 3
+    with open(store.index_path, "a") as f:
+        f.write('{"key": "k3", "off')
+
+    reopened = MmapFrameStore(store_path)
+    assert len(reopened) == 3
+    assert int(reopened.get("k2")[0, 0, 0]) == 2
+    assert "k3" not in reopened
+    reopened.put("k3", np.full((4, 5, 3), 3, dtype=np.uint8))
+    assert int(MmapFrameStore(store_path).get("k3")[0, 0, 0]) == 3
@@ -0,0 +1,22 @@
+"""Tests for perceptual-hash change detection."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+
+from frame_hash import FrameChangeDetector, hamming
+
+def test_change_detector_scores_similarity():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(128, 128, 3), dtype=np.uint8)
+    noisy = np.clip(frame.astype(int) + rng.integers(-2, 3, size=frame.shape), 0, 255).astype(np.uint8)
+    other = rng.integers(0, 255, size=(128, 128, 3), dtype=np.uint8)
+
+    detector = FrameChangeDetector()
+    first = detector.tag(frame)
+    assert first["similarity"] == 0.0
+    second = detector.tag(noisy)
+    assert second["similarity"] > 0.99
+    assert hamming(int(first["hash"], 16), int(second["hash"], 16)) <= 6
+    third = detector.tag(other)
+    assert third["similarity"] < second["similarity"]
@@ -0,0 +1,45 @@
+"""Tests for the deadline-driven frame scheduler."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import pytest
+
+from frame_scheduler import FrameScheduler
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.mark.asyncio
+async def test_scheduler_skips_stale_slots_and_counts_late():
+    clock = FakeClock()
+    scheduler = FrameScheduler(target_hz=10, deadline=0.05, clock=clock)
+
+    await scheduler.wait_next()
+    clock.now += 0.35  # frame overran three and a half slots
+    assert scheduler.frame_done() is True
+
+    await scheduler.wait_next()  # runs immediately, slots 1 and 2 dropped
+    assert scheduler.dropped == 2
+    clock.now += 0.01
+    assert scheduler.frame_done() is False
+
+    stats = scheduler.stats()
+    assert stats["frames"] == 2
+    assert stats["late"] == 1
+    assert stats["target_hz"] == 10
+
+@pytest.mark.asyncio
+async def test_scheduler_waits_when_there_is_slack():
+    scheduler = FrameScheduler(target_hz=20)
+    await scheduler.wait_next()
+    scheduler.frame_done()
+    start = asyncio.get_running_loop().time()
+    await scheduler.wait_next()
+    scheduler.frame_done()
+    assert asyncio.get_running_loop().time() - start >= 0.04
+    assert scheduler.dropped == 0
@@ -0,0 +1,56 @@
+"""Tests for the incremental sample_images watcher."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import pytest
+
+from frame_watcher import DirectoryWatcher, FrameIndex
+
+def _touch(path, mtime):
+    path.write_bytes(b"")
+    os.utime(path, ns=(mtime, mtime))
+
+def test_index_orders_by_timestamp(tmp_path):
+    _touch(tmp_path / "b.png", 2_000_000_000)
+    _touch(tmp_path / "a.png", 3_000_000_000)
+    _touch(tmp_path / "notes.txt", 1_000_000_000)
+    watcher = DirectoryWatcher(str(tmp_path))
+    assert watcher.scan() == 2
+    assert [os.path.basename(p) for p in watcher.index.paths()] == ["b.png", "a.png"]
+    assert os.path.basename(watcher.index.newest()) == "a.png"
+
+def test_index_paths_are_cached_until_changed():
+    index = FrameIndex()
+    index.add("b.png", 2)
+    index.add("a.png", 3)
+    paths = index.paths()
+    assert paths == ["b.png", "a.png"]
+    assert index.paths() is paths
+    assert index.paths(newest_first=True) == ["a.png", "b.png"]
+
+    index.add("b.png", 4)  # rewritten: moves to the end
+    assert index.paths() == ["a.png", "b.png"]
+    index.add("c.png", 1)
+    index.remove("a.png")
+    assert index.paths() == ["c.png", "b.png"]
+    assert paths == ["b.png", "a.png"]  # earlier results are not modified
+    assert "a.png" not in index and len(index) == 2
+
+@pytest.mark.asyncio
+async def test_polling_watcher_sees_new_files(tmp_path):
+    added = []
+    watcher = DirectoryWatcher(str(tmp_path), poll_interval=0.01, on_added=added.append, use_inotify=False)
+    watcher.scan()
+    watcher.start()
+    try:
+        (tmp_path / "new.jpg").write_bytes(b"")
+        os.utime(tmp_path, ns=(1, 1))  # force a directory mtime change
+        for _ in range(100):
+            if added:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        watcher.stop()
+    assert [os.path.basename(p) for p in added] == ["new.jpg"]
+    assert len(watcher.index) == 1
@@ -0,0 +1,59 @@
+"""Local image quality metrics."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+from image_quality import ImageQualityScorer, laplacian_ratio, load_pixels, to_gray
+from mask_codec import rle_encode
+
+def _speckle(size=(480, 640), seed=0):
+    """Synthetic ultrasound-like frame: Rayleigh speckle over a bright region."""
+    rng = np.random.default_rng(seed)
+    base = np.full(size, 40.0)
+    base[100:380, 150:500] = 120.0
+    return np.clip(base * rng.rayleigh(0.8, size), 0, 255).astype(np.uint8)
+
+def _blur(image, passes=6):
+    out = image.astype(np.float32)
+    for _ in range(passes):
+        out[1:-1, 1:-1] = (out[:-2, 1:-1] + out[2:, 1:-1] + out[1:-1, :-2] + out[1:-1, 2:] + out[1:-1, 1:-1]) / 5
+    return out.astype(np.uint8)
+
+def test_sharp_frame_outscores_blurred_dark_and_saturated():
+    scorer = ImageQualityScorer()
+    frame = _speckle()
+    good = scorer.score(frame)
+    assert good["score"] > 0.8
+    assert scorer.score(_blur(frame))["sharpness"] < good["sharpness"] / 4
+    assert scorer.score(_blur(frame))["score"] < good["score"]
+    assert scorer.score((frame // 16).astype(np.uint8))["score"] < 0.5
+    saturated = scorer.score(np.clip(frame.astype(np.int32) * 4, 0, 255).astype(np.uint8))
+    assert saturated["saturated"] > 0.2
+    assert saturated["score"] < good["score"]
+
+def test_mask_coverage_uses_encoded_mask():
+    scorer = ImageQualityScorer()
+    frame = _speckle()
+    mask = np.zeros(frame.shape, dtype=bool)
+    mask[100:380, 150:500] = True
+    quality = scorer.score(frame, rle_encode(mask))
+    assert abs(quality["coverage"] - mask.mean()) < 1e-3
+    tiny = np.zeros(frame.shape, dtype=bool)
+    tiny[0, 0] = True
+    assert scorer.score(frame, rle_encode(tiny))["score"] < quality["score"]
+
+def test_accepts_encoded_images_and_is_fast():
+    frame = np.stack([_speckle()] * 3, axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format="PNG")
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    np.testing.assert_array_equal(load_pixels(encoded), frame)
+    assert max(to_gray(frame).shape) <= 256
+    assert laplacian_ratio(np.zeros((8, 8), dtype=np.float32)) == 0.0
+    quality = ImageQualityScorer().score(frame)
+    assert quality["ms"] < 50
@@ -0,0 +1,58 @@
+"""In-process deployment: coordinator and servers in one event loop."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+import pytest
+from PIL import Image
+
+from in_process import InProcessDeployment
+from mcp_local import App
+
+class FakeDiagnostic:
+    def __init__(self):
+        self.app = App("diagnostic")
+        self.requests = []
+
+    async def assess(self, request):
+        self.requests.append(request)
+        return {"image_quality": 0.9, "landmarks": [request["target_organ"]], "diagnosis": "No abnormal findings"}
+
+    def register_handlers(self):
+        self.app.register_request("assess", self.assess)
+
+class FakeTTS:
+    def __init__(self):
+        self.app = App("voice-tts")
+        self.spoken = []
+
+    def register_handlers(self):
+        async def speak(request):
+            self.spoken.append(request["text"])
+            return {"audio": b""}
+        self.app.register_request("speak", speak)
+
+@pytest.mark.asyncio
+async def test_frames_flow_by_reference(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sample_images").mkdir()
+    rng = np.random.default_rng(0)
+    frame = np.clip(rng.rayleigh(60, (120, 160)), 0, 255).astype(np.uint8)
+    Image.fromarray(np.stack([frame] * 3, axis=-1)).save(tmp_path / "sample_images" / "scan.png")
+
+    diagnostic, tts = FakeDiagnostic(), FakeTTS()
+    deployment = InProcessDeployment(
+        servers={"diagnostic": lambda: diagnostic, "voice-tts": lambda: tts, "navigation": None},
+        reuse_threshold=None, min_quality=None,
+    )
+    try:
+        await deployment.coordinator.process_frame()
+    finally:
+        deployment.close()
+
+    ingest = deployment.servers["ultrasound-ingest"]
+    request = diagnostic.requests[0]
+    # The very array cached by the ingest server reached the diagnostic handler
+    assert request["pixels"] is ingest.frame_cache.get(ingest.images[0]).pixels
+    assert request["mask"]["size"] == [120, 160]
+    assert tts.spoken and "liver" in tts.spoken[0]
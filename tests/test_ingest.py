@@ -3,7 +3,14 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import asyncio
+from concurrent.futures import Future
+import numpy as np
+import pytest
+from PIL import Image
+import wire
+from image_quality import load_pixels
 from ingest_server import UltrasoundIngestServer
+from segmentation_server import SegmentationServer
 
 async def test_next_frame():
     server = UltrasoundIngestServer()
@@ -12,5 +19,56 @@ async def test_next_frame():
     print("Test next_frame response:")
     print({k: (v[:60] + '...') if k == 'image' else v for k, v in response.items()})
 
+def test_cancelled_prefetch_is_not_reported(caplog):
+    cancelled = Future()
+    cancelled.cancel()
+    UltrasoundIngestServer._prefetched("a.png", cancelled)
+    failed = Future()
+    failed.set_exception(OSError("truncated file"))
+    UltrasoundIngestServer._prefetched("b.png", failed)
+    assert "a.png" not in caplog.text
+    assert "Failed to prefetch b.png: truncated file" in caplog.text
+
+@pytest.mark.asyncio
+async def test_frame_crosses_binary_transport_as_raw_pixels(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sample_images").mkdir()
+    pixels = np.random.default_rng(0).integers(0, 255, size=(12, 16, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(tmp_path / "sample_images" / "a.png")
+    server = UltrasoundIngestServer(watch=False)
+    response = await server.next_frame({})
+    server.close()
+    assert "image" not in response
+
+    frame = wire.encode(response)
+    length, codec = wire.HEADER.unpack(frame[:wire.HEADER.size])
+    received = wire.decode(frame[wire.HEADER.size:], codec)["pixels"]
+    np.testing.assert_array_equal(load_pixels(received), pixels)
+    image = SegmentationServer().load_image({"pixels": received})
+    np.testing.assert_array_equal(np.asarray(image), pixels)
+
+@pytest.mark.asyncio
+async def test_only_frames_added_after_the_initial_scan_are_prefetched(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sample_images").mkdir()
+    for name in ("a.png", "b.png"):
+        Image.new("RGB", (8, 8)).save(tmp_path / "sample_images" / name)
+    server = UltrasoundIngestServer(watch=False)
+    await server.load_images()
+    await asyncio.sleep(0.05)
+    assert len(server.frame_cache) == 0
+
+    Image.new("RGB", (8, 8), (9, 9, 9)).save(tmp_path / "sample_images" / "c.png")
+    server.watcher.scan()
+    await asyncio.sleep(0.05)
+    assert len(server.frame_cache) == 1
+
+    for name in ("a.png", "b.png", "c.png"):
+        os.remove(tmp_path / "sample_images" / name)
+    server.watcher.scan()
+    with pytest.raises(RuntimeError, match="No images found"):
+        server._select_path()
+    server.close()
+
 if __name__ == "__main__":
     asyncio.run(test_next_frame())
\ No newline at end of file
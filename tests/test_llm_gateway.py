@@ -0,0 +1,82 @@
+"""Shared LLM gateway: one client, a concurrency cap, sync and async callers."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("anthropic")
+pytest.importorskip("httpx")
+
+from llm_gateway import LLMGateway, response_text
+from metrics import MetricsRegistry
+
+class FakeMessages:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.loops = set()
+
+    async def create(self, model, max_tokens, messages, **options):
+        self.loops.add(id(asyncio.get_running_loop()))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=f"echo {messages[0]['content']}")])
+
+class FakeClient:
+    def __init__(self):
+        self.messages = FakeMessages()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+@pytest.fixture
+def gateway(monkeypatch):
+    created = []
+
+    def create_client(self):
+        created.append(FakeClient())
+        return created[-1]
+
+    monkeypatch.setattr(LLMGateway, "_create_client", create_client)
+    gateway = LLMGateway(max_concurrency=2, registry=MetricsRegistry())
+    gateway.created = created
+    yield gateway
+    gateway.close()
+
+def test_response_text_joins_blocks():
+    response = SimpleNamespace(content=[SimpleNamespace(text="a"), {"text": "b"}])
+    assert response_text(response) == "a b"
+
+def test_calls_share_one_client_within_the_cap(gateway):
+    async def burst():
+        return await asyncio.gather(*(gateway.complete(f"q{i}") for i in range(6)))
+
+    assert asyncio.run(burst()) == [f"echo q{i}" for i in range(6)]
+    # A second event loop and a plain thread reuse the same client and loop
+    assert asyncio.run(gateway.complete("again")) == "echo again"
+    results = []
+    thread = threading.Thread(target=lambda: results.append(gateway.complete_sync("sync")))
+    thread.start()
+    thread.join()
+    assert results == ["echo sync"]
+
+    assert len(gateway.created) == 1
+    messages = gateway.created[0].messages
+    assert messages.peak == 2
+    assert len(messages.loops) == 1
+    assert gateway.stats() == {"max_concurrency": 2, "in_flight": 0, "waiting": 0}
+    assert gateway.metrics.snapshot()["llm"][gateway.model]["requests"] == 8
+
+def test_close_closes_the_client(gateway):
+    gateway.complete_sync("hello")
+    client = gateway.created[0]
+    gateway.close()
+    assert client.closed
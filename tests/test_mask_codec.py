@@ -0,0 +1,63 @@
+"""RLE and bit-packed mask encodings."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from mask_codec import (decode_mask, mask_area, pack_mask, packed_area, packed_bbox, packed_iou,
+                        rle_area, rle_bbox, rle_decode, rle_encode, rle_iou, unpack_mask)
+
+def _masks():
+    rng = np.random.default_rng(0)
+    blob = np.zeros((37, 29), dtype=bool)
+    blob[5:20, 3:11] = True
+    full = np.ones((4, 9), dtype=bool)
+    empty = np.zeros((6, 5), dtype=bool)
+    corner = np.zeros((8, 8), dtype=bool)
+    corner[0, 0] = corner[7, 7] = True
+    return [blob, rng.random((37, 29)) > 0.7, full, empty, corner]
+
+def _bbox(mask):
+    return Image.fromarray(mask.astype(np.uint8) * 255).getbbox()
+
+def _iou(a, b):
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 0.0
+
+@pytest.mark.parametrize("mask", _masks())
+def test_rle_round_trip_and_metrics(mask):
+    rle = rle_encode(mask)
+    assert rle["counts"][0] >= 0 and sum(rle["counts"]) == mask.size
+    np.testing.assert_array_equal(rle_decode(rle), mask)
+    assert rle_area(rle) == np.count_nonzero(mask)
+    assert rle_bbox(rle) == _bbox(mask)
+
+@pytest.mark.parametrize("mask", _masks())
+def test_packed_round_trip_and_metrics(mask):
+    packed = pack_mask(mask)
+    assert len(packed["bits"]) == mask.shape[0] * ((mask.shape[1] + 7) // 8)
+    np.testing.assert_array_equal(unpack_mask(packed), mask)
+    assert packed_area(packed) == np.count_nonzero(mask)
+    assert packed_bbox(packed) == _bbox(mask)
+
+def test_iou_on_encoded_masks():
+    rng = np.random.default_rng(1)
+    a = rng.random((40, 30)) > 0.5
+    b = rng.random((40, 30)) > 0.5
+    assert rle_iou(rle_encode(a), rle_encode(b)) == pytest.approx(_iou(a, b))
+    assert packed_iou(pack_mask(a), pack_mask(b)) == pytest.approx(_iou(a, b))
+    assert rle_iou(rle_encode(a), rle_encode(a)) == 1.0
+    with pytest.raises(ValueError):
+        rle_iou(rle_encode(a), rle_encode(a[:10]))
+
+def test_decode_any_encoding():
+    mask = _masks()[0]
+    buffer = io.BytesIO()
+    Image.fromarray(mask.astype(np.uint8) * 255).save(buffer, format="PNG")
+    for value in (rle_encode(mask), pack_mask(mask), buffer.getvalue(), mask):
+        np.testing.assert_array_equal(decode_mask(value), mask)
+        assert mask_area(value) == np.count_nonzero(mask)
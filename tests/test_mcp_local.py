@@ -0,0 +1,267 @@
+"""Binary framing and concurrent dispatch of the local MCP transport."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import textwrap
+
+import numpy as np
+import pytest
+
+import wire
+from mcp_local import App, Client, RemoteError
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+def test_tagged_codec_round_trip():
+    value = {
+        "id": 3, "ok": True, "none": None, "score": 0.25, "name": "liver",
+        "image": b"\x00\xff" * 10, "points": [(1, 2), [3, 4]], 5: "int key",
+        "mask": np.arange(12, dtype=np.uint16).reshape(3, 4), "scalar": np.float32(1.5),
+    }
+    frame = wire.encode(value, codec=wire.CODEC_TAGGED)
+    length, codec = wire.HEADER.unpack(frame[:wire.HEADER.size])
+    assert length == len(frame) - wire.HEADER.size
+    decoded = wire.decode(frame[wire.HEADER.size:], codec)
+    np.testing.assert_array_equal(decoded.pop("mask"), value.pop("mask"))
+    assert decoded.pop("points") == [[1, 2], [3, 4]]
+    value.pop("points")
+    assert decoded == {**value, "scalar": 1.5}
+    with pytest.raises(TypeError):
+        wire.encode({"bad": object()}, codec=wire.CODEC_TAGGED)
+
+async def _connected(app, tmp_path):
+    path = str(tmp_path / "app.sock")
+    server = await asyncio.start_unix_server(app.serve, path)
+    reader, writer = await asyncio.open_unix_connection(path)
+    return server, Client(reader, writer, app.name)
+
+@pytest.mark.asyncio
+async def test_concurrent_dispatch_out_of_order(tmp_path):
+    app = App("test")
+    order = []
+
+    async def slow(params):
+        await asyncio.sleep(params["delay"])
+        order.append(params["delay"])
+        return {"echo": params["payload"]}
+
+    app.register_request("slow", slow)
+    server, client = await _connected(app, tmp_path)
+    payload = np.ones((4, 4), dtype=np.uint8)
+    results = await asyncio.gather(
+        client.request("slow", {"delay": 0.1, "payload": b"first"}),
+        client.request("slow", {"delay": 0.0, "payload": payload}),
+    )
+    assert order == [0.0, 0.1]
+    assert results[0] == {"echo": b"first"}
+    np.testing.assert_array_equal(results[1]["echo"], payload)
+    await client.close()
+    server.close()
+
+@pytest.mark.asyncio
+async def test_in_flight_limit_per_handler(tmp_path):
+    app = App("test")
+    active = {"limited": 0, "free": 0}
+    peak = {"limited": 0, "free": 0}
+
+    def tracked(name):
+        async def handler(params):
+            active[name] += 1
+            peak[name] = max(peak[name], active[name])
+            await asyncio.sleep(0.02)
+            active[name] -= 1
+            return name
+        return handler
+
+    app.register_request("limited", tracked("limited"), max_in_flight=2)
+    app.register_request("free", tracked("free"))
+    server, client = await _connected(app, tmp_path)
+    await asyncio.gather(*(client.request(name) for name in ["limited"] * 6 + ["free"] * 6))
+    assert peak == {"limited": 2, "free": 6}
+    await client.close()
+    server.close()
+
+@pytest.mark.asyncio
+async def test_errors_and_streamed_results(tmp_path):
+    app = App("test")
+
+    async def fail(params):
+        raise ValueError("no image")
+
+    async def count(params):
+        for i in range(params["n"]):
+            yield {"index": i}
+
+    app.register_request("fail", fail)
+    app.register_request("count", count)
+    server, client = await _connected(app, tmp_path)
+    with pytest.raises(RemoteError) as error:
+        await client.request("fail")
+    assert error.value.error_type == "ValueError"
+    with pytest.raises(RemoteError):
+        await client.request("missing")
+    assert [chunk async for chunk in client.stream("count", {"n": 3})] == [{"index": i} for i in range(3)]
+    assert await client.request("count", {"n": 2}) == [{"index": 0}, {"index": 1}]
+    await client.close()
+    server.close()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply", [
+    wire.HEADER.pack(1, 9) + b"N",            # unknown codec
+    wire.HEADER.pack(1, wire.CODEC_TAGGED) + b"?",  # unknown value tag
+    wire.encode(["not", "a", "message"], codec=wire.CODEC_TAGGED),
+])
+async def test_undecodable_response_fails_pending_requests(tmp_path, reply):
+    async def garbage(reader, writer):
+        await wire.read_message(reader)
+        writer.write(reply)
+        await writer.drain()
+        await asyncio.sleep(1)
+        writer.close()
+
+    path = str(tmp_path / "bad.sock")
+    server = await asyncio.start_unix_server(garbage, path)
+    reader, writer = await asyncio.open_unix_connection(path)
+    client = Client(reader, writer, "bad")
+    try:
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(client.request("segment", {}), timeout=0.5)
+        assert client.closed
+    finally:
+        await client.close()
+        server.close()
+
+@pytest.mark.asyncio
+async def test_spawned_server_over_stdio(tmp_path):
+    script = tmp_path / "echo_server.py"
+    script.write_text(textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {ROOT!r})
+        from mcp_local import App
+
+        async def echo(params):
+            return params
+
+        app = App("echo")
+        app.register_request("echo", echo)
+        app.run()
+    """))
+    client = await Client.spawn(sys.executable, str(script))
+    try:
+        assert await asyncio.wait_for(client.request("echo", {"image": b"\x89PNG"}), 10) == {"image": b"\x89PNG"}
+    finally:
+        await client.close()
+    assert client.process.returncode == 0
+
+@pytest.mark.asyncio
+async def test_pooled_unix_client_multiplexes_and_reports_stats(tmp_path):
+    from mcp_local import PooledClient, socket_path
+
+    app = App("pooled")
+
+    async def work(params):
+        await asyncio.sleep(0.02)
+        return params["n"]
+
+    app.register_request("work", work)
+    path = socket_path(app.name, str(tmp_path))
+    server = await app.start_unix_server(path)
+    client = PooledClient(path, pool_size=2)
+    try:
+        results = await asyncio.gather(*(client.request("work", {"n": n}) for n in range(10)))
+        assert results == list(range(10))
+        stats = client.stats()
+        assert len(stats) == 2
+        assert sum(s["completed"] for s in stats) == 10
+        assert all(s["in_flight"] == 0 and s["bytes_sent"] > 0 for s in stats)
+        assert max(s["latency_ms_max"] for s in stats) >= 20
+        # Idle connections are reused rather than reopened
+        await client.request("work", {"n": 0})
+        assert len(client.stats()) == 2
+    finally:
+        await client.close()
+        server.close()
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced():
+    app = App("test")
+    runs = []
+
+    async def segment(params):
+        runs.append(params)
+        await asyncio.sleep(0.02)
+        return {"score": len(runs)}
+
+    app.register_request("segment", segment, coalesce=True)
+    frame = np.arange(6, dtype=np.uint8)
+    results = await asyncio.gather(
+        app.call("segment", {"pixels": frame, "fields": ["score"]}),
+        app.call("segment", {"fields": ["score"], "pixels": frame.copy()}),
+        app.call("segment", {"pixels": frame[::-1].copy(), "fields": ["score"]}),
+    )
+    assert len(runs) == 2
+    assert results[0] is results[1]
+    assert app.stats()["coalesced"] == {"segment": 1}
+    # Finished requests are not cached: a later identical call runs again
+    await app.call("segment", {"pixels": frame, "fields": ["score"]})
+    assert len(runs) == 3
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_coalesced_followers():
+    app = App("test")
+    release = asyncio.Event()
+    runs = []
+
+    async def segment(params):
+        runs.append(params)
+        try:
+            await release.wait()
+        except asyncio.CancelledError:
+            runs.append("cancelled")
+            raise
+        return {"score": 0.9}
+
+    app.register_request("segment", segment, coalesce=True)
+    leader = asyncio.create_task(app.call("segment", {"frame": 1}))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(app.call("segment", {"frame": 1}))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    await asyncio.sleep(0.01)
+    release.set()
+    assert await follower == {"score": 0.9}
+    assert leader.cancelled()
+    assert runs == [{"frame": 1}]
+
+    # With every caller gone the shared execution is cancelled too
+    release.clear()
+    only = asyncio.create_task(app.call("segment", {"frame": 2}))
+    await asyncio.sleep(0.01)
+    only.cancel()
+    await asyncio.sleep(0.01)
+    assert runs[-1] == "cancelled"
+    assert not app._running and not app._callers
+
+@pytest.mark.asyncio
+async def test_batchable_handler_receives_lists():
+    app = App("test")
+    batches = []
+
+    async def navigate(requests):
+        batches.append(len(requests))
+        return [f"guidance for {r['organ']}" for r in requests]
+
+    app.register_request("navigate", navigate, batch_size=4, batch_wait=0.02)
+    organs = ["liver", "kidney", "heart", "spleen", "bladder"]
+    results = await asyncio.gather(*(app.call("navigate", {"organ": o}) for o in organs))
+    assert results == [f"guidance for {o}" for o in organs]
+    assert batches == [4, 1]
+
+    async def stream(params):
+        yield params
+
+    with pytest.raises(ValueError):
+        app.register_request("stream", stream, coalesce=True)
+    for batcher in app.batchers.values():
+        batcher.close()
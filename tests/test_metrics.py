@@ -0,0 +1,93 @@
+"""Latency histograms, Prometheus output and slow-request profiles."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import time
+
+import pytest
+
+from mcp_local import App, LocalClient
+from metrics import Histogram, MetricsRegistry
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(1, 10, 100))
+    for value in (0.5, 5, 5, 50, 500):
+        histogram.observe(value)
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(560.5)
+    assert histogram.cumulative() == [(1, 1), (10, 3), (100, 4), (float("inf"), 5)]
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(0.99) == 100
+
+def test_track_counts_errors_and_in_flight():
+    registry = MetricsRegistry()
+    with registry.track("coordinator", "segment"):
+        assert registry.snapshot()["coordinator"]["segment"]["in_flight"] == 1
+    with pytest.raises(ValueError):
+        with registry.track("coordinator", "segment"):
+            raise ValueError("boom")
+    stats = registry.snapshot()["coordinator"]["segment"]
+    assert (stats["requests"], stats["errors"], stats["in_flight"]) == (2, 1, 0)
+    assert stats["buckets"]["+Inf"] == 2
+
+def test_prometheus_text():
+    registry = MetricsRegistry(buckets=(10,))
+    with registry.track("segmentation", "segment"):
+        pass
+    text = registry.to_prometheus()
+    labels = 'component="segmentation",operation="segment"'
+    assert "# TYPE triage_request_duration_seconds histogram" in text
+    assert f'triage_request_duration_seconds_bucket{{{labels},le="0.01"}} 1' in text
+    assert f'triage_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"triage_requests_in_flight{{{labels}}} 0" in text
+    assert f"triage_request_errors_total{{{labels}}} 0" in text
+
+def _busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_slow_requests_are_profiled():
+    registry = MetricsRegistry(slow_threshold_ms=30, sample_interval=0.001)
+    with registry.track("diagnostic", "fast"):
+        pass
+    with registry.track("diagnostic", "slow"):
+        _busy_wait(0.08)
+    assert len(registry.slow_profiles) == 1
+    profile = registry.slow_profiles[0]
+    assert profile["operation"] == "slow" and profile["duration_ms"] >= 80
+    assert any("_busy_wait" in stack for stack in profile["stacks"])
+
+@pytest.mark.asyncio
+async def test_app_handlers_are_instrumented():
+    registry = MetricsRegistry()
+    app = App("test", registry=registry)
+
+    async def echo(request):
+        return request
+
+    async def fail(request):
+        raise RuntimeError("nope")
+
+    async def count(request):
+        for i in range(3):
+            yield i
+
+    app.register_request("echo", echo)
+    app.register_request("fail", fail)
+    app.register_request("count", count)
+    client = LocalClient(app)
+
+    await client.request("echo", {"x": 1})
+    with pytest.raises(RuntimeError):
+        await client.request("fail", {})
+    stream = client.stream("count", {})
+    assert [chunk async for chunk in stream] == [0, 1, 2]
+
+    report = await client.request("metrics", {})
+    ops = report["operations"]["test"]
+    assert ops["echo"]["requests"] == 1 and ops["echo"]["errors"] == 0
+    assert ops["fail"]["errors"] == 1
+    assert ops["count"]["requests"] == 1 and ops["count"]["in_flight"] == 0
+    text = await client.request("metrics", {"format": "prometheus"})
+    assert 'operation="echo"' in text
@@ -0,0 +1,93 @@
+"""Navigation guidance pre-generated per organ and served from memory."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("anthropic")
+
+from navigation_guidance import GuidanceStore
+
+class FakeLLM:
+    def __init__(self, delay=0.01, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.pool = ThreadPoolExecutor(4)
+
+    def _answer(self, prompt):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("API down")
+        return f"guidance #{len(self.calls)}"
+
+    def submit(self, content, max_tokens=128):
+        self.calls.append(content)
+        return self.pool.submit(self._answer, content)
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+def test_guidance_is_pregenerated_and_refreshed():
+    llm = FakeLLM()
+    store = GuidanceStore(llm, organs=["liver", "Kidney"], refresh_interval=0.05)
+    assert store.get("liver") is None
+    store.start()
+    _wait_for(lambda: store.get("liver") and store.get("kidney"))
+    _wait_for(lambda: len(llm.calls) >= 4)  # a second round of refreshes
+    thread = store._thread
+    store.stop()
+    assert not thread.is_alive()
+    assert all("liver" in prompt or "kidney" in prompt for prompt in llm.calls)
+
+    calls = len(llm.calls)
+    assert asyncio.run(store.guidance("LIVER")) == store.get("liver")
+    assert len(llm.calls) == calls
+    assert store.stats()["hits"] == 1
+
+def test_missing_guidance_is_generated_once_and_kept():
+    llm = FakeLLM(delay=0.05)
+    store = GuidanceStore(llm, organs=[], refresh_interval=None)
+
+    async def burst():
+        return await asyncio.gather(*(store.guidance("spleen", "liver") for _ in range(5)))
+
+    answers = asyncio.run(burst())
+    assert len(set(answers)) == 1 and len(llm.calls) == 1
+    assert "currently imaging the liver" in llm.calls[0]
+    assert store.get("spleen", "liver") == answers[0]
+    assert store.stats()["organs"] == 1  # refreshed with the others from now on
+
+def test_failed_refresh_keeps_previous_guidance():
+    llm = FakeLLM()
+    store = GuidanceStore(llm, organs=["heart"], refresh_interval=None)
+    store.refresh()
+    previous = store.get("heart")
+    llm.fail = True
+    store.refresh()
+    assert store.get("heart") == previous
+    assert store.stats()["failures"] == 1
+
+def test_requested_pairs_are_capped_least_recent_first():
+    llm = FakeLLM(delay=0)
+    store = GuidanceStore(llm, organs=["liver"], refresh_interval=None, max_pairs=2)
+
+    async def ask(*pairs):
+        for pair in pairs:
+            await store.guidance(*pair)
+
+    asyncio.run(ask(("liver",), ("spleen", "liver"), ("heart", "liver"), ("spleen", "liver"), ("bladder", None)))
+    assert store.get("heart", "liver") is None  # least recently requested, dropped
+    assert store.get("spleen", "liver") and store.get("bladder")
+    assert store.stats()["organs"] == 3 and store.stats()["entries"] == 3
+
+    calls = len(llm.calls)
+    store.refresh()
+    assert len(llm.calls) == calls + 3
@@ -0,0 +1,34 @@
+"""Tests for the NumPy overlay engine."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+
+from overlay import OverlayRenderer, mask_contour
+
+def _square_mask():
+    mask = np.zeros((10, 10), dtype=np.uint8)
+    mask[2:8, 2:8] = 255
+    return mask
+
+def test_render_fill_alpha_and_buffer_reuse():
+    image = np.full((10, 10, 3), 100, dtype=np.uint8)
+    renderer = OverlayRenderer()
+    out = renderer.render(image, [(_square_mask(), (255, 0, 0))])
+    assert out.shape == (10, 10, 4)
+    assert tuple(out[5, 5]) == (255, 0, 0, 255)
+    assert tuple(out[0, 0]) == (100, 100, 100, 255)
+
+    blended = renderer.render(image, [(_square_mask(), (200, 0, 0))], alpha=0.5)
+    assert blended is out
+    assert tuple(blended[5, 5, :3]) == (150, 50, 50)
+
+def test_render_multiple_masks_and_contour():
+    image = np.zeros((10, 10), dtype=np.uint8)
+    second = np.zeros((10, 10), dtype=np.uint8)
+    second[0, 0] = 1
+    out = OverlayRenderer().render(image, [(_square_mask(), (0, 255, 0)), (second, (0, 0, 255))], contour=True)
+    assert tuple(out[2, 2, :3]) == (0, 255, 0)
+    assert tuple(out[5, 5, :3]) == (0, 0, 0)
+    assert tuple(out[0, 0, :3]) == (0, 0, 255)
+    assert mask_contour(_square_mask()).sum() == 20
@@ -0,0 +1,143 @@
+"""Coarse-to-fine segmentation: band helpers and SegmentationServer pyramid mode."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from pyramid import boundary_band, mask_iou, parse_pyramid, refine_band, upscale_mask
+from segmentation_server import SegmentationServer
+
+def _disk_frame(size=400, radius=120, seed=0):
+    yy, xx = np.mgrid[:size, :size]
+    disk = (yy - size / 2 + 7) ** 2 + (xx - size / 2 - 11) ** 2 < radius ** 2
+    rng = np.random.default_rng(seed)
+    frame = np.where(disk, 190, 40) + rng.normal(0, 8, disk.shape)
+    return np.clip(frame, 0, 255).astype(np.uint8), disk
+
+class ThresholdEngine:
+    """Stands in for SAM2Engine: segments bright pixels (inside the box prompt, if any)."""
+
+    def __init__(self):
+        self.predicted = []
+        self.last_logits = None
+
+    def generate(self, image_np):
+        self.last_logits = None
+        return image_np[..., 0] > 115, 0.9, {"encoder_ms": 0.0, "decoder_ms": 0.0}
+
+    def predict(self, image_np, points, labels, box):
+        self.predicted.append((image_np.shape[:2], box))
+        left, top, right, bottom = (int(round(v)) for v in box)
+        inside = np.zeros(image_np.shape[:2], dtype=bool)
+        inside[top:bottom, left:right] = True
+        logits = np.where(inside, image_np[..., 0].astype(np.float32) - 115, -100.0).astype(np.float32)
+        # Low-resolution logits over the whole frame, as SAM2 returns them
+        self.last_logits = np.asarray(Image.fromarray(logits, mode="F").resize((64, 64), Image.BILINEAR))[None]
+        return inside & (logits > 0), 0.8, {"encoder_ms": 0.0, "decoder_ms": 0.0}
+
+def test_boundary_band_straddles_the_edge():
+    mask = np.zeros((20, 20), dtype=bool)
+    mask[5:15, 5:15] = True
+    band = boundary_band(mask, 2)
+    assert band[5, 10] and band[3, 10] and band[6, 10]
+    assert not band[10, 10] and not band[0, 0]
+
+def test_refine_band_recovers_full_resolution_edge():
+    frame, disk = _disk_frame()
+    coarse = np.asarray(Image.fromarray(disk.astype(np.uint8) * 255).resize((50, 50), Image.BILINEAR)) > 127
+    up = upscale_mask(coarse, (400, 400))
+    band = upscale_mask(boundary_band(coarse, 1), (400, 400))
+    ring = upscale_mask(boundary_band(coarse, 2) & ~boundary_band(coarse, 1), (400, 400))
+    refined, changed = refine_band(frame, up, band, ring)
+    assert changed > 0
+    assert mask_iou(refined, disk) > mask_iou(up, disk)
+    # No contrast between the sides: keep the coarse mask
+    assert refine_band(np.full_like(frame, 90), up, band, ring)[1] == 0
+
+def test_parse_pyramid_options():
+    assert parse_pyramid(None, 0.5, 6) is None
+    assert parse_pyramid(True, 0.5, 6) == {"scale": 0.5, "band": 6, "verify": False, "refine": "auto"}
+    assert parse_pyramid(0.25, 0.5, 6)["scale"] == 0.25
+    assert parse_pyramid({"refine": "intensity"}, 0.5, 6)["refine"] == "intensity"
+    with pytest.raises(ValueError):
+        parse_pyramid({"scale": 2}, 0.5, 6)
+    with pytest.raises(ValueError):
+        parse_pyramid({"refine": "bilinear"}, 0.5, 6)
+
+def test_mask_iou_of_empty_masks_is_zero():
+    empty = np.zeros((4, 4), dtype=bool)
+    assert mask_iou(empty, empty) == 0.0
+
+def _png(frame):
+    buffer = io.BytesIO()
+    Image.fromarray(np.stack([frame] * 3, axis=-1)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+async def _segment(server, frame, pyramid, **request):
+    return await server.segment({
+        "image": _png(frame),
+        "pyramid": pyramid,
+        "fields": {"mask": "array", "pyramid": "info", "score": "float"},
+        **request,
+    })
+
+@pytest.mark.asyncio
+async def test_segment_pyramid_reports_tradeoff():
+    frame, disk = _disk_frame()
+    engine = ThresholdEngine()
+    server = SegmentationServer(backend="sam2", engine=engine)
+    response = await _segment(server, frame, {"scale": 0.25, "band": 4, "verify": True})
+    report = response["pyramid"]
+    # No logits from an unprompted pass: the band is refined locally, without another model pass
+    assert report["scale"] == 0.25 and report["band"] == 4 and report["refine"] == "intensity"
+    assert engine.predicted == []
+    assert 0 < report["band_fraction"] < 0.2
+    assert report["iou_vs_full"] > 0.97
+    assert {"coarse_ms", "refine_ms", "total_ms", "full_ms", "speedup"} <= set(report)
+    assert mask_iou(response["mask"] > 0, disk) > 0.97
+    assert response["score"] == 0.9
+
+@pytest.mark.asyncio
+async def test_segment_pyramid_refines_from_coarse_logits():
+    frame, disk = _disk_frame()
+    engine = ThresholdEngine()
+    server = SegmentationServer(backend="sam2", engine=engine)
+    response = await _segment(server, frame, {"scale": 0.25, "band": 4}, box=[0, 0, 400, 400])
+    assert response["pyramid"]["refine"] == "logits"
+    # Only the coarse pass ran the model
+    assert [shape for shape, _ in engine.predicted] == [(100, 100)]
+    assert response["pyramid"]["refined_pixels"] > 0
+    assert mask_iou(response["mask"] > 0, disk) > 0.97
+
+@pytest.mark.asyncio
+async def test_segment_pyramid_model_refinement_is_opt_in():
+    frame, disk = _disk_frame()
+    engine = ThresholdEngine()
+    server = SegmentationServer(backend="sam2", engine=engine)
+    response = await _segment(server, frame, {"scale": 0.25, "band": 4, "refine": "model"})
+    assert response["pyramid"]["refine"] == "model"
+    # A second pass on a full-resolution crop, prompted with the coarse box
+    [(crop_shape, box)] = engine.predicted
+    assert 240 < crop_shape[0] < 400 and 240 < crop_shape[1] < 400
+    assert box is not None
+    assert mask_iou(response["mask"] > 0, disk) > 0.97
+
+@pytest.mark.asyncio
+async def test_segment_pyramid_keeps_coarse_stub_mask():
+    frame, _ = _disk_frame()
+    server = SegmentationServer()
+    response = await _segment(server, frame, {"scale": 0.25, "refine": "model", "verify": True})
+    report = response["pyramid"]
+    assert report["refine"] == "none" and report["refined_pixels"] == 0
+    assert report["iou_vs_full"] > 0.95
+    assert len(server.mask_cache) == 2  # the coarse and the full-size circle only
+
+@pytest.mark.asyncio
+async def test_segment_rejects_pyramid_with_session():
+    frame, _ = _disk_frame()
+    with pytest.raises(ValueError):
+        await _segment(SegmentationServer(), frame, True, session="s")
@@ -0,0 +1,91 @@
+"""SAM2Engine embedding cache, against a predictor stub with SAM2ImagePredictor's state attributes."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'sam')))
+import contextlib
+import importlib
+import types
+
+import numpy as np
+import pytest
+
+class StubPredictor:
+    """Keeps its image state in the same attributes as SAM2ImagePredictor."""
+
+    def __init__(self, model):
+        self.encoded = 0
+        self.reset_predictor()
+
+    def reset_predictor(self):
+        self._is_image_set = False
+        self._features = None
+        self._orig_hw = None
+        self._is_batch = False
+
+    def set_image(self, image):
+        self.reset_predictor()
+        self.encoded += 1
+        self._features = {"image_embed": [int(image[0, 0, 0])]}
+        self._orig_hw = [image.shape[:2]]
+        self._is_image_set = True
+
+    def set_image_batch(self, images):
+        self.reset_predictor()
+        self.encoded += 1
+        self._features = {"image_embed": [int(image[0, 0, 0]) for image in images]}
+        self._orig_hw = [image.shape[:2] for image in images]
+        self._is_image_set = True
+        self._is_batch = True
+
+    def predict(self, point_coords=None, point_labels=None, box=None, mask_input=None, multimask_output=True):
+        if not self._is_image_set or self._is_batch:
+            raise RuntimeError("predict needs a single image set")
+        # Like SAM2ImagePredictor (img_idx=-1): the embedding and size of the last image set
+        mask = np.full((1,) + tuple(self._orig_hw[-1]), self._features["image_embed"][-1], dtype=np.float32)
+        return mask, np.array([0.9]), np.zeros((1, 4, 4), dtype=np.float32)
+
+    def predict_batch(self, point_coords_batch=None, point_labels_batch=None, box_batch=None,
+                      multimask_output=True):
+        assert self._is_batch
+        masks = [np.full((1,) + tuple(hw), embed, dtype=np.float32)
+                 for embed, hw in zip(self._features["image_embed"], self._orig_hw)]
+        return masks, [np.array([0.9])] * len(masks), None
+
+@pytest.fixture
+def model(monkeypatch):
+    try:
+        import torch
+    except ImportError:
+        torch = types.ModuleType("torch")
+        torch.inference_mode = contextlib.nullcontext
+    stubs = {
+        "torch": torch,
+        "sam2": types.ModuleType("sam2"),
+        "sam2.build_sam": types.SimpleNamespace(build_sam2=lambda *a, **k: types.SimpleNamespace(eval=lambda: None)),
+        "sam2.sam2_image_predictor": types.SimpleNamespace(SAM2ImagePredictor=StubPredictor),
+        "sam2.automatic_mask_generator": types.SimpleNamespace(SAM2AutomaticMaskGenerator=None),
+    }
+    for name, module in stubs.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.delitem(sys.modules, "src.model", raising=False)
+    return importlib.import_module("src.model")
+
+def _frame(value, size=8):
+    return np.full((size, size, 3), value, dtype=np.uint8)
+
+def test_cached_embedding_restores_single_image_state_after_a_batch(model):
+    engine = model.SAM2Engine()
+    first, second = _frame(1), _frame(2, size=6)
+    engine.predict(first, box=[0, 0, 4, 4])
+    engine.predict(second, box=[0, 0, 4, 4])
+    engine.predict_batch([_frame(3), _frame(4)], boxes=[None, None])
+    assert engine.predictor._is_batch
+
+    mask, _, timings = engine.predict(first, box=[0, 0, 4, 4])
+    assert timings["encoder_ms"] == 0.0
+    assert engine.predictor.encoded == 3
+    assert not engine.predictor._is_batch
+    assert mask.shape == (8, 8) and mask.all()
+    mask, _, _ = engine.predict(second, box=[0, 0, 4, 4])
+    assert mask.shape == (6, 6)
+    assert engine.stats["embedding_hits"] == 2
@@ -0,0 +1,139 @@
+"""Direct tests of SegmentationServer: mask caching and field selection."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import io
+import numpy as np
+import pytest
+from PIL import Image
+
+from segmentation_server import SegmentationServer
+
+def _png(size):
+    img_bytes = io.BytesIO()
+    Image.fromarray(np.zeros((size, size), dtype=np.uint8)).save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+@pytest.mark.asyncio
+async def test_mask_cache_hits_for_same_geometry():
+    server = SegmentationServer(mask_cache_size=1)
+    first = await server.segment({"image": _png(64)})
+    second = await server.segment({"image": _png(64)})
+    assert first["mask"] is second["mask"]
+    assert server.mask_cache.stats()["hits"] == 1
+
+    third = await server.segment({"image": _png(32)})
+    assert Image.open(io.BytesIO(third["mask"])).size == (32, 32)
+    assert server.mask_cache.stats()["misses"] == 2
+    assert len(server.mask_cache) == 1
+
+@pytest.mark.asyncio
+async def test_segment_returns_only_requested_fields():
+    server = SegmentationServer()
+    response = await server.segment({"image": _png(16), "fields": {"score": "float", "contour": "points"}})
+    assert set(response) == {"score", "contour"}
+    assert [8, 4] in response["contour"]
+
+    default = await server.segment({"image": _png(16)})
+    assert set(default) == {"mask", "bbox", "score", "overlay"}
+
+    with pytest.raises(ValueError):
+        await server.segment({"image": _png(16), "fields": {"mask": "jpeg"}})
+
+class FakeEngine:
+    """Stands in for SAM2Engine: returns a fixed square mask."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, image_np, points, labels, box, mask_input=None):
+        self.calls.append(("predict", points, labels, box))
+        mask = np.zeros(image_np.shape[:2], dtype=bool)
+        mask[2:6, 2:6] = True
+        return mask, 0.93, {"encoder_ms": 0.0, "decoder_ms": 1.5}
+
+    def generate(self, image_np):
+        self.calls.append(("generate",))
+        return np.ones(image_np.shape[:2], dtype=bool), 0.6, {"encoder_ms": 10.0, "decoder_ms": 2.0}
+
+    def predict_batch(self, images_np, points, labels, boxes):
+        self.calls.append(("predict_batch", len(images_np)))
+        return [self.predict(image_np, None, None, None)[:2] + ({"batch_size": len(images_np)},)
+                for image_np in images_np]
+
+@pytest.mark.asyncio
+async def test_segment_uses_model_backend_and_prompts():
+    engine = FakeEngine()
+    server = SegmentationServer(backend="sam2", engine=engine)
+    response = await server.segment({
+        "image": _png(16),
+        "points": [[4, 4]],
+        "fields": ["score", "bbox", "timings"],
+    })
+    assert response == {"score": 0.93, "bbox": [2, 2, 6, 6], "timings": {"encoder_ms": 0.0, "decoder_ms": 1.5}}
+    assert engine.calls[0] == ("predict", [[4, 4]], [1], None)
+
+    response = await server.segment({"image": _png(16), "fields": ["score"]})
+    assert response["score"] == 0.6
+    assert engine.calls[1] == ("generate",)
+
+def _png_fill(size, value):
+    img_bytes = io.BytesIO()
+    Image.fromarray(np.full((size, size), value, dtype=np.uint8)).save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+@pytest.mark.asyncio
+async def test_streaming_session_reuses_and_propagates():
+    engine = FakeEngine()
+    server = SegmentationServer(backend="sam2", engine=engine)
+    request = {"session": "probe", "fields": ["score", "stream"]}
+
+    first = await server.segment({**request, "image": _png_fill(16, 100)})
+    assert first["stream"]["mode"] == "full"
+    second = await server.segment({**request, "image": _png_fill(16, 100)})
+    assert second["stream"]["mode"] == "reused"
+    assert second["score"] == first["score"]
+    third = await server.segment({**request, "image": _png_fill(16, 120)})
+    assert third["stream"]["mode"] == "propagated"
+    # Previous mask was the full frame, so its box seeds the decoder
+    assert engine.calls[-1] == ("predict", None, None, [0, 0, 16, 16])
+    fourth = await server.segment({**request, "image": _png_fill(16, 250)})
+    assert fourth["stream"]["mode"] == "full"
+    assert [c[0] for c in engine.calls] == ["generate", "predict", "generate"]
+
+@pytest.mark.asyncio
+async def test_segment_batch_groups_same_size_frames():
+    engine = FakeEngine()
+    server = SegmentationServer(backend="sam2", engine=engine, max_batch_size=8, max_batch_wait=0.05)
+    frames = [{"image": _png(16), "points": [[4, 4]]} for _ in range(3)]
+    frames.append({"image": _png(24), "box": [0, 0, 8, 8]})
+    frames.append({"image": b"not an image"})
+
+    responses = [r async for r in server.segment_batch({"frames": frames, "fields": ["score", "timings"]})]
+    by_index = {r["index"]: r for r in responses}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert by_index[0] == {"index": 0, "score": 0.93, "timings": {"batch_size": 3}}
+    assert by_index[3]["score"] == 0.93
+    assert "error" in by_index[4]
+    assert ("predict_batch", 3) in engine.calls
+    assert server.batcher.stats()["batches"] == 1
+    server.batcher.close()
+
+@pytest.mark.asyncio
+async def test_segment_in_process_pool_matches_thread_pool():
+    thread_server = SegmentationServer()
+    process_server = SegmentationServer(executor_kind="process")
+    request = {"image": _png(16), "fields": ["score", "bbox"]}
+    assert await process_server.segment(request) == await thread_server.segment(request)
+    stats = await process_server.stats({})
+    assert stats["executor"]["process"]["completed"] == 1
+    process_server.executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_segment_compact_mask_encodings():
+    from mask_codec import rle_bbox, unpack_mask
+    server = SegmentationServer()
+    response = await server.segment({"image": _png(16), "fields": {"mask": "rle", "bbox": "list"}})
+    assert list(rle_bbox(response["mask"])) == response["bbox"]
+    response = await server.segment({"image": _png(16), "fields": {"mask": "bits"}})
+    assert unpack_mask(response["mask"]).shape == (16, 16)
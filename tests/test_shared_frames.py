@@ -0,0 +1,76 @@
+"""Tests for the shared-memory frame pool."""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+import pytest
+
+import shared_frames
+from shared_frames import SharedFramePool, SharedFrameReader, StaleFrameError
+
+def test_shared_frame_roundtrip_and_staleness():
+    pool = SharedFramePool(slots=2)
+    reader = SharedFrameReader()
+    try:
+        pixels = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+        handle = pool.write(pixels)
+        assert handle["shape"] == [4, 5, 3]
+
+        view = reader.read(handle)
+        assert view.shape == (4, 5, 3)
+        assert np.array_equal(view, pixels)
+        assert not view.flags.writeable
+        del view
+
+        # Two more writes wrap the ring and overwrite the first slot
+        pool.write(pixels)
+        pool.write(pixels)
+        with pytest.raises(StaleFrameError):
+            reader.read(handle)
+    finally:
+        reader.close()
+        pool.close()
+
+def test_reader_detects_slot_overwritten_during_use():
+    pool = SharedFramePool(slots=1)
+    reader = SharedFrameReader()
+    try:
+        first = pool.write(np.zeros((4, 5), dtype=np.uint8), mode="L")
+        view = reader.view(first)
+        reader.check(first)
+        # The ring wraps onto the slot while the view is still in use
+        pool.write(np.full((4, 5), 255, dtype=np.uint8), mode="L")
+        assert view.max() == 255  # torn: the view now shows the newer frame
+        with pytest.raises(StaleFrameError):
+            reader.check(first)
+        del view
+
+        # A copy taken from a slot mid-write is rejected rather than returned
+        second = {**first, "seq": pool.seq}
+        shm = pool.slots[0]
+        shared_frames.SEQ.pack_into(shm.buf, shared_frames.SEQ_OFFSET, shared_frames.WRITING)
+        with pytest.raises(StaleFrameError, match="being overwritten"):
+            reader.read(second)
+        shared_frames.SEQ.pack_into(shm.buf, shared_frames.SEQ_OFFSET, pool.seq)
+        assert reader.read(second).max() == 255
+    finally:
+        reader.close()
+        pool.close()
+
+def test_reader_drops_blocks_of_resized_slots():
+    pool = SharedFramePool(slots=1)
+    reader = SharedFrameReader()
+    try:
+        small = pool.write(np.zeros((4, 5), dtype=np.uint8), mode="L")
+        reader.read(small)
+        old = reader._attached[shared_frames._slot_of(small["name"])]
+        # A larger frame does not fit, so the slot moves to a new block
+        large = pool.write(np.full((8, 10), 7, dtype=np.uint8), mode="L")
+        assert large["name"] != small["name"]
+        assert reader.read(large).max() == 7
+        assert [shm.name for shm in reader._attached.values()] == [large["name"]]
+        assert old.buf is None  # closed
+        assert not reader._retired
+    finally:
+        reader.close()
+        pool.close()
@@ -44,8 +44,11 @@ class VoiceTTSServer:
             logger.error(f"TTS error: {e}")
             return {"error": str(e)}
 
-    def run(self):
+    def register_handlers(self):
         self.app.register_request("speak", self.speak)
+
+    def run(self):
+        self.register_handlers()
         self.app.run(
             os.sys.stdin.buffer,
             os.sys.stdout.buffer,
@@ -0,0 +1,180 @@
+"""
+Binary message framing for the MCP transport in mcp_local.py.
+
+Every message is one frame: a 5-byte header (little-endian uint32 payload
+length, uint8 codec id) followed by the encoded payload. Payloads are
+msgpack when it is installed; otherwise a small built-in tagged encoding
+with the same value model is used. Either way bytes travel unencoded (no
+base64) and NumPy arrays are sent as dtype + shape + raw buffer. The codec
+id in the header lets a receiver decode frames from either encoder.
+
+Supported values: None, bool, int (64-bit), float, str, bytes, list/tuple,
+dict, NumPy arrays and scalars. Decoded arrays are read-only views of the
+received frame.
+"""
+import asyncio
+import struct
+from typing import Any, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # built-in codec only
+    msgpack = None
+
+HEADER = struct.Struct("<IB")
+MAX_FRAME = 1 << 30
+
+CODEC_TAGGED = 0
+CODEC_MSGPACK = 1
+DEFAULT_CODEC = CODEC_MSGPACK if msgpack is not None else CODEC_TAGGED
+
+# msgpack extension type carrying a NumPy array
+EXT_NDARRAY = 1
+
+class FrameError(Exception):
+    """Malformed or oversized frame."""
+
+def _array_header(array: np.ndarray) -> bytes:
+    dtype = array.dtype.str.encode()
+    return struct.pack(f"<B{len(dtype)}sB{array.ndim}I", len(dtype), dtype, array.ndim, *array.shape)
+
+def _array_from(view: memoryview, offset: int) -> Tuple[np.ndarray, int]:
+    (dtype_len,) = struct.unpack_from("<B", view, offset)
+    offset += 1
+    dtype = np.dtype(bytes(view[offset:offset + dtype_len]).decode())
+    offset += dtype_len
+    (ndim,) = struct.unpack_from("<B", view, offset)
+    offset += 1
+    shape = struct.unpack_from(f"<{ndim}I", view, offset)
+    offset += 4 * ndim
+    count = int(np.prod(shape, dtype=np.int64))
+    array = np.frombuffer(view, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return array, offset + count * dtype.itemsize
+
+# --- built-in tagged codec -------------------------------------------------
+
+def _encode_tagged(value: Any, out: list):
+    if value is None:
+        out.append(b"N")
+    elif value is True:
+        out.append(b"T")
+    elif value is False:
+        out.append(b"F")
+    elif isinstance(value, int):
+        out.append(b"i" + struct.pack("<q", value))
+    elif isinstance(value, float):
+        out.append(b"d" + struct.pack("<d", value))
+    elif isinstance(value, str):
+        data = value.encode()
+        out.append(b"s" + struct.pack("<I", len(data)))
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(b"b" + struct.pack("<I", len(value)))
+        out.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        out.append(b"l" + struct.pack("<I", len(value)))
+        for item in value:
+            _encode_tagged(item, out)
+    elif isinstance(value, dict):
+        out.append(b"m" + struct.pack("<I", len(value)))
+        for key, item in value.items():
+            _encode_tagged(key, out)
+            _encode_tagged(item, out)
+    elif isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        out.append(b"a" + _array_header(array))
+        out.append(array.tobytes())
+    elif isinstance(value, np.generic):
+        _encode_tagged(value.item(), out)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def _decode_tagged(view: memoryview, offset: int) -> Tuple[Any, int]:
+    tag = view[offset:offset + 1].tobytes()
+    offset += 1
+    if tag == b"N":
+        return None, offset
+    if tag == b"T":
+        return True, offset
+    if tag == b"F":
+        return False, offset
+    if tag == b"i":
+        return struct.unpack_from("<q", view, offset)[0], offset + 8
+    if tag == b"d":
+        return struct.unpack_from("<d", view, offset)[0], offset + 8
+    if tag in (b"s", b"b"):
+        (length,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        data = view[offset:offset + length].tobytes()
+        return (data.decode() if tag == b"s" else data), offset + length
+    if tag == b"l":
+        (count,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        items = []
+        for _ in range(count):
+            item, offset = _decode_tagged(view, offset)
+            items.append(item)
+        return items, offset
+    if tag == b"m":
+        (count,) = struct.unpack_from("<I", view, offset)
+        offset += 4
+        mapping = {}
+        for _ in range(count):
+            key, offset = _decode_tagged(view, offset)
+            mapping[key], offset = _decode_tagged(view, offset)
+        return mapping, offset
+    if tag == b"a":
+        return _array_from(view, offset)
+    raise FrameError(f"Unknown value tag {tag!r}")
+
+# --- msgpack codec ----------------------------------------------------------
+
+def _msgpack_default(value: Any):
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        return msgpack.ExtType(EXT_NDARRAY, _array_header(array) + array.tobytes())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, memoryview):
+        return bytes(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def _msgpack_ext(code: int, data: bytes):
+    if code == EXT_NDARRAY:
+        return _array_from(memoryview(data), 0)[0]
+    return msgpack.ExtType(code, data)
+
+# --- frames -------------------------------------------------------------------
+
+def encode(value: Any, codec: int = DEFAULT_CODEC) -> bytes:
+    """Encode `value` as a complete frame (header included)."""
+    if codec == CODEC_MSGPACK:
+        payload = msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+        return HEADER.pack(len(payload), codec) + payload
+    parts = []
+    _encode_tagged(value, parts)
+    payload = b"".join(parts)
+    return HEADER.pack(len(payload), codec) + payload
+
+def decode(payload: bytes, codec: int) -> Any:
+    if codec == CODEC_MSGPACK:
+        if msgpack is None:
+            raise FrameError("Received a msgpack frame but msgpack is not installed")
+        return msgpack.unpackb(payload, raw=False, ext_hook=_msgpack_ext, strict_map_key=False)
+    if codec == CODEC_TAGGED:
+        value, _ = _decode_tagged(memoryview(payload), 0)
+        return value
+    raise FrameError(f"Unknown codec {codec}")
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[bytes, int]:
+    """Read one frame's (payload, codec); raises asyncio.IncompleteReadError at end of stream."""
+    length, codec = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise FrameError(f"Frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+    return await reader.readexactly(length), codec
+
+async def read_message(reader: asyncio.StreamReader) -> Any:
+    """Read and decode one frame."""
+    return decode(*await read_frame(reader))